@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""Header-only reader for sampler metadata in AIFF and AIFF-C files.
+
+Reads the 'COMM', 'MARK' and 'INST' chunks and skips the sound data. Root note
+and loops are provided in the same shape as by `wavfile.WavFile`.
+
+"""
+
+__all__ = [
+    'AiffFile',
+    'Error',
+    'ParseError',
+    'make_loops',
+    'parse_comm',
+    'parse_inst',
+    'parse_mark',
+]
+
+import logging
+import struct
+
+import perfstats
+import wavfile
+
+
+# module globals
+log = logging.getLogger(__name__)
+
+FORM_TYPES = (b'AIFF', b'AIFC')
+METADATA_CHUNKS = (b'COMM', b'INST', b'MARK')
+
+# INST loop play modes
+PLAY_MODE_NO_LOOPING = 0
+PLAY_MODE_FORWARD = 1
+PLAY_MODE_FORWARD_BACKWARD = 2
+
+_LOOP_TYPES = {
+    PLAY_MODE_FORWARD: wavfile.LOOP_TYPE_FORWARD,
+    PLAY_MODE_FORWARD_BACKWARD: wavfile.LOOP_TYPE_ALTERNATE,
+}
+
+_FORM_HEADER = struct.Struct('>4sL4s')
+_CHUNK_HEADER = struct.Struct('>4sL')
+_COMM = struct.Struct('>hLhHQ')
+_MARK_COUNT = struct.Struct('>H')
+_MARKER = struct.Struct('>hL')
+_INST = struct.Struct('>bbbbbbh3h3h')
+
+
+# exceptions
+class Error(wavfile.Error):
+    """General error."""
+    pass
+
+
+class ParseError(Error):
+    pass
+
+
+# utility functions
+def _extended_to_float(exponent, mantissa):
+    """Convert 80-bit IEEE 754 extended precision number to float."""
+    if not mantissa:
+        return 0.0
+
+    sign = -1 if exponent & 0x8000 else 1
+    return sign * mantissa * 2.0 ** ((exponent & 0x7FFF) - 16383 - 63)
+
+
+def parse_comm(data):
+    """Return tuple (channels, num_frames, bits_per_sample, samplerate)."""
+    try:
+        channels, num_frames, bits, exponent, mantissa = _COMM.unpack_from(data)
+    except struct.error:
+        raise ParseError("Invalid data in 'COMM' chunk.")
+
+    return channels, num_frames, bits, _extended_to_float(exponent, mantissa)
+
+
+def parse_mark(data):
+    """Return dict mapping marker IDs to (position, name) tuples."""
+    try:
+        count = _MARK_COUNT.unpack_from(data)[0]
+        markers = {}
+        pos = _MARK_COUNT.size
+
+        for _ in range(count):
+            marker_id, position = _MARKER.unpack_from(data, pos)
+            pos += _MARKER.size
+            # Pascal string, padded to even total length
+            length = data[pos]
+            name = data[pos + 1:pos + 1 + length].decode('latin1')
+            pos += 1 + length + (0 if length % 2 else 1)
+            markers[marker_id] = (position, name)
+    except (IndexError, struct.error):
+        raise ParseError("Invalid data in 'MARK' chunk.")
+
+    return markers
+
+
+def parse_inst(data):
+    """Return tuple of 'INST' chunk fields.
+
+    The tuple contains base note, detune (in cents), low note, high note, low
+    velocity, high velocity, gain (in dB) and the sustain and release loops as
+    (play mode, begin marker ID, end marker ID) tuples.
+
+    """
+    try:
+        fields = _INST.unpack_from(data)
+    except struct.error:
+        raise ParseError("Invalid data in 'INST' chunk.")
+
+    return fields[:7] + (fields[7:10], fields[10:13])
+
+
+def make_loops(markers, inst_loops):
+    """Return list of wavfile.Loop tuples for INST loops referencing markers.
+
+    The sustain loop has ID 0, the release loop ID 1. The loop end is
+    converted from the AIFF marker position (after the last loop sample) to the
+    position of the last sample, as used in WAV 'smpl' chunks.
+
+    """
+    loops = []
+
+    for loop_id, (play_mode, begin_id, end_id) in enumerate(inst_loops):
+        if play_mode == PLAY_MODE_NO_LOOPING:
+            continue
+
+        try:
+            start = markers[begin_id][0]
+            end = markers[end_id][0]
+        except KeyError:
+            log.warning("INST loop references undefined marker.")
+            continue
+
+        loops.append(wavfile.Loop(loop_id, _LOOP_TYPES.get(play_mode, play_mode),
+                                  start, max(start, end - 1), 0, 0))
+
+    return loops
+
+
+# API classes
+class AiffFile(object):
+    """AIFF/AIFF-C file metadata reader.
+
+    Only the chunk headers and the 'COMM', 'MARK' and 'INST' chunks are read.
+
+    Attributes: form_type, channels, num_frames, bits_per_sample, samplerate,
+    markers (see 'parse_mark'), inst (see 'parse_inst', None if the file has
+    no 'INST' chunk), root_note and loops.
+
+    """
+
+    def __init__(self, aifffile):
+        self._i_opened_the_file = False
+        perfstats.count("aiff.files")
+
+        if isinstance(aifffile, str):
+            self.filename = aifffile
+            self.file = open(self.filename, 'rb')
+            self._i_opened_the_file = True
+        else:
+            self.file = aifffile
+            self.filename = getattr(aifffile, 'name', None)
+
+        self.channels = self.num_frames = self.bits_per_sample = None
+        self.samplerate = None
+        self.markers = {}
+        self.inst = None
+
+        try:
+            self._read_chunks()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_chunks(self):
+        file = self.file
+
+        try:
+            form, form_size, self.form_type = _FORM_HEADER.unpack(
+                file.read(_FORM_HEADER.size))
+        except struct.error:
+            raise ParseError("%s: Invalid/missing FORM tag or chunk size." %
+                self.filename)
+
+        if form != b'FORM' or self.form_type not in FORM_TYPES:
+            raise Error("%s: not an AIFF file" % self.filename)
+
+        pos = _FORM_HEADER.size
+        end = 8 + form_size
+
+        while pos + _CHUNK_HEADER.size <= end:
+            file.seek(pos)
+            header = file.read(_CHUNK_HEADER.size)
+
+            if len(header) < _CHUNK_HEADER.size:
+                break
+
+            name, size = _CHUNK_HEADER.unpack(header)
+
+            if name in METADATA_CHUNKS:
+                data = file.read(size)
+                perfstats.count("aiff.bytes_read", len(data))
+
+                if name == b'COMM':
+                    (self.channels, self.num_frames, self.bits_per_sample,
+                     self.samplerate) = parse_comm(data)
+                elif name == b'MARK':
+                    self.markers = parse_mark(data)
+                else:
+                    self.inst = parse_inst(data)
+
+            pos += _CHUNK_HEADER.size + size + (size & 1)
+
+        if self.channels is None:
+            raise ParseError("%s: 'COMM' chunk missing." % self.filename)
+
+    def close(self):
+        if getattr(self, '_i_opened_the_file', False):
+            try:
+                self.file.close()
+            except:
+                pass
+
+    __del__ = close
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def root_note(self):
+        """MIDI root note from 'INST' chunk or None."""
+        return self.inst[0] if self.inst else None
+
+    @property
+    def loops(self):
+        """List of wavfile.Loop tuples for the sustain and release loop."""
+        return make_loops(self.markers, self.inst[7:]) if self.inst else []
+
+
+if __name__ == '__main__':
+    import sys
+
+    with AiffFile(sys.argv[1]) as aiff:
+        print("Format: %s, %i ch, %i bit, %g Hz, %i frames" % (
+            aiff.form_type.decode(), aiff.channels, aiff.bits_per_sample,
+            aiff.samplerate, aiff.num_frames))
+        print("Root note: %s" % aiff.root_note)
+        for loop in aiff.loops:
+            print("Loop #%i - start: %10d end: %10d" % (loop.cue_point_id, loop.start,
+                                                         loop.end))
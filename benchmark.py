@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmarks for the sfzparser tools.
+
+Sub-commands:
+
+startup
+    Measure the start-up time of the command line tools and fail, if it
+    exceeds the time budget or if a plain import of a tool module pulls in
+    heavy optional dependencies (NumPy, aubio, Jinja2).
+
+run
+    Generate synthetic corpora (SFZ files with different numbers of regions
+    and layouts, WAV files with different bit depths, lengths and chunk sets
+    and a sample directory for makesfz), then measure time and peak memory
+    use of each processing stage on them and optionally compare the results
+    against a stored baseline. Exits with a non-zero status, if any stage
+    regressed by more than the given tolerance.
+
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from os.path import abspath, dirname, exists, join as pathjoin
+
+
+HERE = dirname(abspath(__file__))
+HEAVY_MODULES = ("aubio", "jinja2", "numpy")
+# (name, command line for a run which doesn't do any real work, module to check
+# for heavy imports)
+STARTUP_COMMANDS = (
+    ("makesfz", ["makesfz.py", "--version"], "makesfz"),
+    ("fix-polyphone-sfz", ["fix-polyphone-sfz.py", "--help"], None),
+    ("fix-sfz", ["fix-sfz.py", "--help"], None),
+    ("sfzparser", ["-c", "import sfzparser"], "sfzparser"),
+    ("wavfile", ["-c", "import wavfile"], "wavfile"),
+)
+# maximum start-up time in ms on top of bare interpreter start-up
+STARTUP_BUDGET = 80.0
+
+STAGES = ("parse", "wav", "makesfz")
+SFZ_LAYOUTS = ("flat", "grouped", "compact", "commented")
+SFZ_SIZES = (1000, 10000, 100000)
+# (bits per sample, length in seconds, chunk set)
+WAV_VARIANTS = (
+    (16, 1, "minimal"),
+    (16, 10, "sampler"),
+    (24, 10, "sampler"),
+    (24, 60, "full"),
+    (32, 10, "full"),
+)
+MAKESFZ_SIZES = (100, 1000)
+NOTE_NAMES = ("c", "c#", "d", "d#", "e", "f", "f#", "g", "g#", "a", "a#", "b")
+
+
+def time_command(cmd, runs):
+    """Return median wall clock time in ms of running Python with given arguments."""
+    timings = []
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + cmd, cwd=HERE, stdout=subprocess.DEVNULL,
+                       check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(timings)
+
+
+def heavy_imports(module):
+    """Return list of heavy optional modules loaded by importing given module."""
+    code = "import sys, {}; print(' '.join(m for m in {!r} if m in sys.modules))"
+    proc = subprocess.run([sys.executable, "-c", code.format(module, HEAVY_MODULES)],
+                          cwd=HERE, capture_output=True, check=True, text=True)
+    return proc.stdout.split()
+
+
+def bench_startup(args):
+    base = time_command(["-c", "pass"], args.runs)
+    print("Interpreter start-up: {:.1f} ms".format(base))
+    failed = False
+
+    for name, cmd, module in STARTUP_COMMANDS:
+        overhead = time_command(cmd, args.runs) - base
+        heavy = heavy_imports(module) if module else []
+        status = "ok"
+        if overhead > args.budget:
+            status = "OVER BUDGET"
+            failed = True
+        if heavy:
+            status += ", imports " + ", ".join(heavy)
+            failed = True
+
+        print("{:20s} {:7.1f} ms  {}".format(name, overhead, status))
+
+    return 1 if failed else 0
+
+
+def write_sfz_corpus(path, num_regions, layout):
+    """Write synthetic SFZ file with given number of regions and layout.
+
+    Layouts:
+
+    flat
+        all opcodes in the region headers, one per line
+    grouped
+        shared opcodes in a group header per 16 regions
+    compact
+        like grouped, but each header with all its opcodes on one line
+    commented
+        like grouped, with a comment line before each region
+
+    """
+    sep = " " if layout == "compact" else "\n"
+
+    with open(path, "w", encoding="utf-8") as fp:
+        fp.write("<control>\ndefault_path=samples/\n\n<global>\nloop_mode=no_loop\n\n")
+
+        for i in range(num_regions):
+            key = i % 128
+            lovel = (i // 128) % 4 * 32
+            opcodes = [
+                ("sample", "s%07i.wav" % i),
+                ("lokey", key),
+                ("hikey", key),
+                ("pitch_keycenter", key),
+                ("seq_position", i % 4 + 1),
+            ]
+            group = [("lovel", lovel), ("hivel", lovel + 31), ("seq_length", 4),
+                     ("amp_velcurve_%i" % (lovel + 31), 1)]
+
+            if layout == "flat":
+                opcodes.extend(group)
+            elif i % 16 == 0:
+                fp.write(sep.join(["<group>"] + ["%s=%s" % op for op in group]) + "\n")
+
+            if layout == "commented":
+                fp.write("// region %i\n" % i)
+
+            fp.write(sep.join(["<region>"] + ["%s=%s" % op for op in opcodes]) + "\n")
+
+
+def _riff_chunk(tag, data):
+    return tag + struct.pack("<L", len(data)) + data + (b"\0" if len(data) % 2 else b"")
+
+
+def write_wav_corpus(path, nframes, bits=16, channels=2, chunks="minimal",
+                     root_note=60):
+    """Write synthetic WAV file.
+
+    Chunk sets:
+
+    minimal
+        'fmt ' and 'data'
+    sampler
+        'fmt ', 'smpl' with two loops, 'cue ' with two cue points and 'data'
+    full
+        'fmt ', 'LIST' ('INFO'), 'data' and 'smpl' and 'cue ' after 'data'
+
+    """
+    width = (bits + 7) // 8
+    block_align = width * channels
+    fmt = struct.pack("<HHLLHH", 1, channels, 44100, 44100 * block_align, block_align,
+                      bits)
+    smpl = struct.pack("<9l", 0, 0, 22675, root_note, 0, 0, 0, 2, 0)
+    cue = struct.pack("<l", 2)
+
+    for i in range(2):
+        start = nframes // 4 * (i + 1)
+        smpl += struct.pack("<6l", i, 0, start, start + nframes // 8, 0, 0)
+        cue += struct.pack("<2l4s3l", i, start, b"data", 0, 0, start)
+
+    info = b"INFO" + _riff_chunk(b"INAM", b"synthetic\0") + _riff_chunk(b"ISFT",
+                                                                         b"benchmark\0")
+    head = [_riff_chunk(b"fmt ", fmt)]
+    tail = []
+
+    if chunks == "sampler":
+        head += [_riff_chunk(b"smpl", smpl), _riff_chunk(b"cue ", cue)]
+    elif chunks == "full":
+        head.append(_riff_chunk(b"LIST", info))
+        tail += [_riff_chunk(b"smpl", smpl), _riff_chunk(b"cue ", cue)]
+
+    data_size = nframes * block_align
+    head = b"".join(head)
+    tail = b"".join(tail)
+    riff_size = 4 + len(head) + 8 + data_size + data_size % 2 + len(tail)
+    block = bytes(range(256)) * 4096
+
+    with open(path, "wb") as fp:
+        fp.write(b"RIFF" + struct.pack("<L", riff_size) + b"WAVE" + head)
+        fp.write(b"data" + struct.pack("<L", data_size))
+        remaining = data_size
+
+        while remaining > 0:
+            fp.write(block[:remaining])
+            remaining -= len(block)
+
+        if data_size % 2:
+            fp.write(b"\0")
+
+        fp.write(tail)
+
+
+def write_sample_dir(path, num_samples):
+    """Create directory with short synthetic samples named for makesfz."""
+    layers = ("p", "mp", "f")
+
+    for i in range(num_samples):
+        subdir = pathjoin(path, "%03i" % (i // 1000))
+        note = i // 12 % 128
+        name = "%s%i %s %i.wav" % (NOTE_NAMES[note % 12], note // 12, layers[i % 3],
+                                   i % 4 + 1)
+
+        if i % 1000 == 0:
+            os.makedirs(subdir, exist_ok=True)
+
+        write_wav_corpus(pathjoin(subdir, name), 1000, channels=1, chunks="sampler",
+                         root_note=note)
+
+
+def measure(func, repeat=3):
+    """Return best wall clock time in s and peak traced memory in bytes of func()."""
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {"time": min(timings), "peak": peak}
+
+
+def _corpus_file(corpus, name, writer, *args):
+    path = pathjoin(corpus, name)
+    if not exists(path):
+        print("Generating", name, file=sys.stderr)
+        writer(path, *args)
+    return path
+
+
+def bench_parse(corpus, args):
+    from sfzparser import SFZParser
+
+    for size in args.sfz_sizes:
+        for layout in SFZ_LAYOUTS:
+            path = _corpus_file(corpus, "%s-%i.sfz" % (layout, size), write_sfz_corpus,
+                                size, layout)
+            yield "parse/%s/%i" % (layout, size), lambda path=path: SFZParser(path)
+
+
+def bench_wav(corpus, args):
+    import wavfile
+
+    def read_header(path):
+        with wavfile.WavFile(path) as wav:
+            if wav.has_chunk("smpl"):
+                wav.smpl.midi_unity_note
+
+    def read_frames(path):
+        with wavfile.WavFile(path) as wav:
+            for _ in wav.raw_frames():
+                pass
+
+    for bits, length, chunks in WAV_VARIANTS:
+        name = "%ibit-%is-%s" % (bits, length, chunks)
+        path = _corpus_file(corpus, name + ".wav", write_wav_corpus, 44100 * length,
+                            bits, 2, chunks)
+        yield "wav-header/" + name, lambda path=path: read_header(path)
+        yield "wav-frames/" + name, lambda path=path: read_frames(path)
+
+
+def bench_makesfz(corpus, args):
+    import makesfz
+
+    for size in args.makesfz_sizes:
+        sampledir = _corpus_file(corpus, "samples-%i" % size, write_sample_dir, size)
+        output = pathjoin(corpus, "samples-%i.sfz" % size)
+        argv = ["-O", output, sampledir]
+        yield "makesfz/%i" % size, lambda argv=argv: makesfz.main(argv)
+
+
+def compare(results, baseline, tolerance):
+    """Return list of (key, metric, old, new) tuples for regressed results."""
+    regressions = []
+
+    for key, result in results.items():
+        for metric, value in result.items():
+            old = baseline.get(key, {}).get(metric)
+            if old and value > old * (1 + tolerance):
+                regressions.append((key, metric, old, value))
+
+    return regressions
+
+
+def bench_run(args):
+    stage_benches = {"parse": bench_parse, "wav": bench_wav, "makesfz": bench_makesfz}
+    corpus = args.corpus or tempfile.mkdtemp(prefix="sfzbench-")
+    os.makedirs(corpus, exist_ok=True)
+    sys.path.insert(0, HERE)
+    results = {}
+
+    try:
+        for stage in args.stages:
+            for key, func in stage_benches[stage](corpus, args):
+                results[key] = result = measure(func, args.repeat)
+                print("{:40s} {:10.2f} ms {:12.1f} KiB".format(
+                      key, result["time"] * 1000, result["peak"] / 1024))
+    finally:
+        if not args.corpus:
+            shutil.rmtree(corpus, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+    if not args.baseline:
+        return 0
+
+    if args.save_baseline or not exists(args.baseline):
+        with open(args.baseline, "w") as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+        print("Baseline saved to", args.baseline)
+        return 0
+
+    with open(args.baseline) as fp:
+        regressions = compare(results, json.load(fp), args.tolerance)
+
+    for key, metric, old, new in regressions:
+        print("REGRESSION {}: {} {:.4g} -> {:.4g} ({:+.0%})".format(
+              key, metric, old, new, new / old - 1))
+
+    return 1 if regressions else 0
+
+
+def _int_list(value):
+    return [int(s) for s in value.split(",")]
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = ap.add_subparsers(dest="command", required=True)
+
+    sp = subparsers.add_parser("startup", help="Check start-up time budget of tools.")
+    sp.add_argument("-b", "--budget", type=float, default=STARTUP_BUDGET, metavar="MS",
+                    help="Start-up time budget in ms (default: %(default).0f).")
+    sp.add_argument("-n", "--runs", type=int, default=10, metavar="NUM",
+                    help="Number of runs per command (default: %(default)i).")
+    sp.set_defaults(func=bench_startup)
+
+    sp = subparsers.add_parser("run", help="Run stage benchmarks on synthetic corpora.")
+    sp.add_argument("-s", "--stages", type=lambda s: s.split(","),
+                    default=list(STAGES), metavar="LIST",
+                    help="Comma-separated list of stages to run (default: %s)."
+                    % ",".join(STAGES))
+    sp.add_argument("-c", "--corpus", metavar="DIR",
+                    help="Directory to generate synthetic corpora in and re-use them "
+                    "from (default: temporary directory).")
+    sp.add_argument("--sfz-sizes", type=_int_list, default=list(SFZ_SIZES),
+                    metavar="LIST",
+                    help="Comma-separated list of SFZ region counts (default: %s)."
+                    % ",".join(str(n) for n in SFZ_SIZES))
+    sp.add_argument("--makesfz-sizes", type=_int_list, default=list(MAKESFZ_SIZES),
+                    metavar="LIST",
+                    help="Comma-separated list of makesfz sample counts (default: %s)."
+                    % ",".join(str(n) for n in MAKESFZ_SIZES))
+    sp.add_argument("-n", "--repeat", type=int, default=3, metavar="NUM",
+                    help="Number of timed runs per benchmark (default: %(default)i).")
+    sp.add_argument("-b", "--baseline", metavar="FILE",
+                    help="Compare results against baseline in given JSON file (saved "
+                    "there if it does not exist yet).")
+    sp.add_argument("-S", "--save-baseline", action="store_true",
+                    help="Overwrite baseline file with results.")
+    sp.add_argument("-t", "--tolerance", type=float, default=0.25, metavar="FRACTION",
+                    help="Allowed relative increase over baseline (default: "
+                    "%(default).2f).")
+    sp.add_argument("-j", "--json", metavar="FILE", help="Write results to JSON file.")
+    sp.set_defaults(func=bench_run)
+
+    args = ap.parse_args(args)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
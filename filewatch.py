@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""Watch files and directories for changes.
+
+On Linux, changes are reported by the kernel through inotify (used via
+ctypes, so no extra package is needed). Elsewhere, or if inotify is not
+available, e.g. because the watch limit is exhausted, the watched paths are
+polled for changes of file size and modification time.
+
+Events are collected until there has been no event for a short time, so that
+a batch of files copied into a directory, or a file written in several steps,
+results in one change notification. Either way, changes are determined by
+comparing the size and modification time of the files touched with the last
+known state, so both implementations report the same changes.
+
+"""
+
+__all__ = (
+    "Changes",
+    "InotifyWatcher",
+    "PollingWatcher",
+    "open_watcher",
+    "watch",
+)
+
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from collections import namedtuple
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 1.0
+DEFAULT_DEBOUNCE = 0.2
+
+# inotify event masks from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+# wd, mask, cookie, length of name
+_EVENT = struct.Struct("iIII")
+
+# sets of absolute paths
+Changes = namedtuple("Changes", ["added", "modified", "removed"])
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return st.st_size, st.st_mtime_ns
+
+
+class PollingWatcher(object):
+    """Watch files by polling their size and modification time.
+
+    'paths' are files or directories. Files in directories are only watched
+    if their extension (including the dot, all lower-case) is in 'extensions'
+    (all files if None), and files in sub-directories only if 'recursive' is
+    true. Files given directly are always watched, even if they don't exist
+    yet.
+
+    """
+
+    def __init__(self, paths, recursive=False, extensions=None, interval=DEFAULT_INTERVAL):
+        self.recursive = recursive
+        self.extensions = extensions
+        self.interval = interval
+        self.dirs = set()
+        self.explicit = set()
+        self.files = {}
+        self.add(paths)
+
+    def add(self, paths):
+        """Add files or directories to the watched paths."""
+        for path in paths:
+            path = os.path.abspath(path)
+
+            if os.path.isdir(path):
+                self.dirs.add(path)
+                self._watch_dir(path, self.recursive)
+            else:
+                self.explicit.add(path)
+
+                try:
+                    self._watch_dir(os.path.dirname(path))
+                except OSError as exc:
+                    log.warning("Could not watch '%s': %s", path, exc)
+
+        self.files.update(self._scan(paths))
+
+    def set_files(self, paths):
+        """Replace the set of individually watched files."""
+        paths = {os.path.abspath(path) for path in paths}
+        dropped = self.explicit - paths
+        self.explicit &= paths
+
+        for path in dropped:
+            if not self._matches(path):
+                self.files.pop(path, None)
+
+        self.add(paths - self.explicit)
+
+    def _watch_dir(self, path, subdirs=False):
+        """Start watching directory (and its sub-directories, if 'subdirs')."""
+        pass
+
+    def _matches(self, path):
+        if path in self.explicit:
+            return True
+
+        parent = os.path.dirname(path)
+
+        if not self.recursive:
+            if parent not in self.dirs:
+                return False
+        elif not any(parent == d or parent.startswith(d + os.sep) for d in self.dirs):
+            return False
+
+        return self.extensions is None or os.path.splitext(path)[1].lower() in self.extensions
+
+    def _scan(self, paths=None):
+        """Return dict mapping matching file paths below 'paths' to size and mtime."""
+        found = {}
+        stack = []
+
+        for path in (self.dirs | self.explicit) if paths is None else paths:
+            path = os.path.abspath(path)
+
+            if os.path.isdir(path):
+                stack.append(path)
+            elif path in self.explicit or self._matches(path):
+                state = _stat(path)
+
+                if state:
+                    found[path] = state
+
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            if self.recursive:
+                                stack.append(entry.path)
+                        elif self._matches(entry.path):
+                            state = _stat(entry.path)
+
+                            if state:
+                                found[entry.path] = state
+            except OSError as exc:
+                log.debug("Could not scan directory: %s", exc)
+
+        return found
+
+    def _classify(self, paths):
+        """Compare state of given paths with last known state and update it."""
+        added, modified, removed = set(), set(), set()
+
+        for path in paths:
+            old = self.files.get(path)
+            new = _stat(path) if self._matches(path) else None
+
+            if new == old:
+                continue
+            elif old is None:
+                added.add(path)
+            elif new is None:
+                removed.add(path)
+            else:
+                modified.add(path)
+
+            if new is None:
+                del self.files[path]
+            else:
+                self.files[path] = new
+
+        return Changes(added, modified, removed)
+
+    def changes(self, timeout=None):
+        """Wait for changes and return Changes or None, if 'timeout' expired."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(self.interval if deadline is None else
+                       max(0, min(self.interval, deadline - time.monotonic())))
+            current = self._scan()
+            changes = self._classify(set(current) | set(self.files))
+
+            if any(changes):
+                return changes
+
+        return None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class InotifyWatcher(PollingWatcher):
+    """Watch files with Linux inotify.
+
+    Takes the same arguments as PollingWatcher, except 'interval' (the time
+    to wait for further events before changes are reported). Raises OSError
+    if inotify is not available.
+
+    """
+
+    def __init__(self, paths, recursive=False, extensions=None, interval=DEFAULT_DEBOUNCE):
+        import ctypes
+        import ctypes.util
+
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                                 use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        self._watches = {}
+
+        try:
+            super().__init__(paths, recursive, extensions, interval)
+        except Exception:
+            self.close()
+            raise
+
+    def _watch_dir(self, path, subdirs=False):
+        # adding an existing watch returns its descriptor again
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+
+        if wd < 0:
+            import ctypes
+
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+
+        self._watches[wd] = path
+
+        if subdirs:
+            try:
+                with os.scandir(path) as entries:
+                    children = [entry.path for entry in entries if entry.is_dir()]
+            except OSError:
+                children = []
+
+            for child in children:
+                self._watch_dir(child, True)
+
+    def _read_events(self, timeout):
+        """Return set of paths touched by events within 'timeout' seconds or None.
+
+        Returns None, if the event queue overflowed.
+
+        """
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        touched = set()
+
+        if not poller.poll(None if timeout is None else int(timeout * 1000)):
+            return touched
+
+        # collect events until there are none for 'interval' seconds
+        while poller.poll(int(self.interval * 1000)):
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                continue
+
+            pos = 0
+
+            while pos < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, pos)
+                name = data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b"\0")
+                pos += _EVENT.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    return None
+
+                directory = self._watches.get(wd)
+
+                if mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+
+                if directory is None or not name:
+                    continue
+
+                path = os.path.join(directory, os.fsdecode(name))
+
+                if mask & IN_ISDIR:
+                    if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                        try:
+                            self._watch_dir(path, True)
+                        except OSError as exc:
+                            log.warning("Could not watch '%s': %s", path, exc)
+
+                        touched.update(self._scan([path]))
+                    elif mask & (IN_DELETE | IN_MOVED_FROM):
+                        touched.update(p for p in self.files if p.startswith(path + os.sep))
+                else:
+                    touched.add(path)
+
+        return touched
+
+    def changes(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            touched = self._read_events(remaining)
+
+            if touched is None:
+                log.debug("inotify event queue overflow, rescanning.")
+                touched = set(self._scan()) | set(self.files)
+
+            changes = self._classify(touched)
+
+            if any(changes):
+                return changes
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def open_watcher(paths, recursive=False, extensions=None, polling=False,
+                 interval=DEFAULT_INTERVAL):
+    """Return InotifyWatcher for paths, or PollingWatcher if not available or 'polling'."""
+    if not polling:
+        try:
+            return InotifyWatcher(paths, recursive, extensions)
+        except (OSError, AttributeError) as exc:
+            log.debug("inotify not available (%s), polling for changes.", exc)
+
+    return PollingWatcher(paths, recursive, extensions, interval)
+
+
+def watch(paths, recursive=False, extensions=None, polling=False,
+          interval=DEFAULT_INTERVAL):
+    """Yield Changes for watched paths, forever.
+
+    See PollingWatcher for the arguments. 'interval' is the polling interval
+    in seconds, if inotify is not used.
+
+    """
+    with open_watcher(paths, recursive, extensions, polling, interval) as watcher:
+        while True:
+            yield watcher.changes()
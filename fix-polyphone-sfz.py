@@ -6,6 +6,8 @@ import re
 import sys
 from os.path import exists
 
+import perfstats
+
 
 SFZ_NOTE_LETTER_OFFSET = {'a': 9, 'b': 11, 'c': 0, 'd': 2, 'e': 4, 'f': 5, 'g': 7}
 NOTE_RX = re.compile(r"\b(hikey|key|lokey|pitch_keycenter)=([a-h](#|♯|b|♭)?\d+)\b",
@@ -45,12 +47,41 @@ def replace_key(match, german=False):
     return match.group(0)
 
 
+def fix_file(args):
+    with perfstats.timer('read'), open(args.sfzfile) as infp:
+        sfz = infp.read()
+        perfstats.count('bytes_read', len(sfz))
+
+    if re.search(r"\b(hikey|key|lokey|pitch_keycenter)=h\d+", sfz, re.I):
+        print("Detected use of mixed/German note names. Enabling '-g' option.", file=sys.stderr)
+        args.german = True
+
+    with perfstats.timer('fix'):
+        sfz, num_subs = NOTE_RX.subn(lambda m: replace_key(m, args.german), sfz)
+
+    perfstats.count('opcodes_fixed', num_subs)
+
+    print("Total opcodes fixed: %d" % num_subs, file=sys.stderr)
+
+    if num_subs or not args.inplace:
+        if args.inplace:
+            outfp = open(args.sfzfile, 'w')
+        elif args.output:
+            outfp = open(args.output, 'w')
+        else:
+            outfp = sys.stdout
+
+        with perfstats.timer('write'), outfp:
+            outfp.write(sfz)
+
+
 def main(args=None):
     ap = argparse.ArgumentParser()
     ap.add_argument('-g', '--german', action="store_true",
                     help="Input uses mixed/German note names")
     ap.add_argument('-i', '--inplace', action="store_true",
                     help="Change input file in-place")
+    perfstats.add_arguments(ap)
     ap.add_argument('sfzfile', help="SFZ input file")
     ap.add_argument('output', nargs="?", help="SFZ output file")
 
@@ -64,28 +95,8 @@ def main(args=None):
         ap.print_help()
         return "\nError: Option -i/--inplace and output file argument are mutually exclusive"
 
-    with open(args.sfzfile) as infp:
-        sfz = infp.read()
-
-
-    if re.search(r"\b(hikey|key|lokey|pitch_keycenter)=h\d+", sfz, re.I):
-        print("Detected use of mixed/German note names. Enabling '-g' option.", file=sys.stderr)
-        args.german = True
-
-    sfz, num_subs = NOTE_RX.subn(lambda m: replace_key(m, args.german), sfz)
-
-    print("Total opcodes fixed: %d" % num_subs, file=sys.stderr)
-
-    if num_subs or not args.inplace:
-        if args.inplace:
-            outfp = open(args.sfzfile, 'w')
-        elif args.output:
-            outfp = open(args.output, 'w')
-        else:
-            outfp = sys.stdout
-
-        with outfp:
-            outfp.write(sfz)
+    with perfstats.session(args.stats, args.profile):
+        return fix_file(args)
 
 
 if __name__ == '__main__':
@@ -1,30 +1,34 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+"""Add missing directory prefix to sample file names in an SFZ file."""
 
+import argparse
 import shutil
 from os.path import basename, exists, isdir, splitext
 
+import perfstats
 from sfzparser import SFZParser
 
 
-def main(args=None):
-    fn = args[0]
+def fix_file(fn):
     bn = splitext(basename(fn))[0]
     parser = SFZParser(fn)
 
     fixed = False
-    for name, sect in parser.sections:
-        # fix sample filename without directory prefix
-        if name == 'region' and 'sample' in sect and isdir(bn) and '/' not in sect['sample']:
-            print("Setting prefix for sample '{}' to '{}'.".format(sect['sample'], bn))
-            sect['sample'] = bn + '/' + sect['sample']
-            fixed = True
+    with perfstats.timer('fix'):
+        for name, sect in parser.sections:
+            # fix sample filename without directory prefix
+            if name == 'region' and 'sample' in sect and isdir(bn) and '/' not in sect['sample']:
+                print("Setting prefix for sample '{}' to '{}'.".format(sect['sample'], bn))
+                sect['sample'] = bn + '/' + sect['sample']
+                perfstats.count('samples_fixed')
+                fixed = True
 
     if fixed:
         if not exists(fn + '.bak'):
             shutil.copy(fn, fn + '.bak')
 
-        with open(args[0], 'w') as sfz:
+        with perfstats.timer('write'), open(fn, 'w') as sfz:
             for name, sect in parser.sections:
                 if name == 'comment':
                     sfz.write(sect + '\n')
@@ -36,6 +40,16 @@ def main(args=None):
         print("Nothing to fix.")
 
 
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__)
+    perfstats.add_arguments(ap)
+    ap.add_argument('sfzfile', help="SFZ file to fix in-place")
+    args = ap.parse_args(args)
+
+    with perfstats.session(args.stats, args.profile):
+        return fix_file(args.sfzfile)
+
+
 if __name__ == '__main__':
     import sys
-    sys.exit(main(sys.argv[1:] or 0))
+    sys.exit(main() or 0)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Header-only reader for sampler metadata in FLAC files.
+
+Reads the FLAC metadata blocks only. Sampler metadata of the original file is
+taken from the APPLICATION blocks with the IDs 'riff' (WAV 'smpl' chunk) or
+'aiff' ('INST' and 'MARK' chunks), as written by `flac
+--keep-foreign-metadata`. Root note and loops are provided in the same shape as
+by `wavfile.WavFile`.
+
+"""
+
+__all__ = [
+    'Error',
+    'FlacFile',
+    'ParseError',
+]
+
+import logging
+import struct
+
+import aifffile
+import perfstats
+import wavfile
+
+
+# module globals
+log = logging.getLogger(__name__)
+
+BLOCK_STREAMINFO = 0
+BLOCK_APPLICATION = 2
+
+_BLOCK_HEADER = struct.Struct('>B3s')
+_STREAMINFO = struct.Struct('>HHxxxxxxQ')
+_RIFF_CHUNK_HEADER = struct.Struct('<4sL')
+_AIFF_CHUNK_HEADER = struct.Struct('>4sL')
+
+
+# exceptions
+class Error(wavfile.Error):
+    """General error."""
+    pass
+
+
+class ParseError(Error):
+    pass
+
+
+# utility functions
+def _iter_foreign_chunks(data, header, container_tags):
+    """Yield (name, data) tuples of chunks in foreign metadata block payload."""
+    pos = 12 if data[:4] in container_tags else 0
+
+    while pos + header.size <= len(data):
+        name, size = header.unpack_from(data, pos)
+        pos += header.size
+        yield name, data[pos:pos + size]
+        pos += size + (size & 1)
+
+
+# API classes
+class FlacFile(object):
+    """FLAC file metadata reader.
+
+    Attributes: channels, bits_per_sample, samplerate, num_frames (from the
+    STREAMINFO block), smpl (wavfile.SmplChunk from 'riff' foreign metadata or
+    None), inst and markers (from 'aiff' foreign metadata, see
+    'aifffile.AiffFile'), root_note and loops.
+
+    """
+
+    def __init__(self, flacfile):
+        self._i_opened_the_file = False
+        perfstats.count("flac.files")
+
+        if isinstance(flacfile, str):
+            self.filename = flacfile
+            self.file = open(self.filename, 'rb')
+            self._i_opened_the_file = True
+        else:
+            self.file = flacfile
+            self.filename = getattr(flacfile, 'name', None)
+
+        self.channels = self.bits_per_sample = self.samplerate = None
+        self.num_frames = None
+        self.smpl = None
+        self.inst = None
+        self.markers = {}
+
+        try:
+            self._read_blocks()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_blocks(self):
+        file = self.file
+
+        if file.read(4) != b'fLaC':
+            raise Error("%s: not a FLAC file" % self.filename)
+
+        last = False
+
+        while not last:
+            header = file.read(_BLOCK_HEADER.size)
+
+            if len(header) < _BLOCK_HEADER.size:
+                raise ParseError("%s: Truncated metadata block header." % self.filename)
+
+            flags, size = _BLOCK_HEADER.unpack(header)
+            size = int.from_bytes(size, 'big')
+            last = bool(flags & 0x80)
+            block_type = flags & 0x7F
+
+            if block_type in (BLOCK_STREAMINFO, BLOCK_APPLICATION):
+                data = file.read(size)
+                perfstats.count("flac.bytes_read", len(data))
+
+                if len(data) < size:
+                    raise ParseError("%s: Truncated metadata block." % self.filename)
+
+                if block_type == BLOCK_STREAMINFO:
+                    self._parse_streaminfo(data)
+                else:
+                    self._parse_application(data)
+            else:
+                file.seek(size, 1)
+
+        if self.channels is None:
+            raise ParseError("%s: STREAMINFO block missing." % self.filename)
+
+    def _parse_streaminfo(self, data):
+        try:
+            _, _, packed = _STREAMINFO.unpack_from(data)
+        except struct.error:
+            raise ParseError("Invalid STREAMINFO block.")
+
+        # 20 bits sample rate, 3 bits channels - 1, 5 bits bps - 1, 36 bits frames
+        self.samplerate = packed >> 44
+        self.channels = (packed >> 41 & 0x7) + 1
+        self.bits_per_sample = (packed >> 36 & 0x1F) + 1
+        self.num_frames = packed & 0xFFFFFFFFF
+
+    def _parse_application(self, data):
+        app_id, payload = data[:4], data[4:]
+
+        if app_id == b'riff':
+            chunks = _iter_foreign_chunks(payload, _RIFF_CHUNK_HEADER, wavfile.RIFF_TAGS)
+
+            for name, chunk_data in chunks:
+                if name == b'smpl':
+                    self.smpl = wavfile.SmplChunk(name, len(chunk_data), data=chunk_data)
+        elif app_id == b'aiff':
+            chunks = _iter_foreign_chunks(payload, _AIFF_CHUNK_HEADER, (b'FORM',))
+
+            for name, chunk_data in chunks:
+                if name == b'INST':
+                    self.inst = aifffile.parse_inst(chunk_data)
+                elif name == b'MARK':
+                    self.markers = aifffile.parse_mark(chunk_data)
+
+    def close(self):
+        if getattr(self, '_i_opened_the_file', False):
+            try:
+                self.file.close()
+            except:
+                pass
+
+    __del__ = close
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def root_note(self):
+        """MIDI root note from foreign 'smpl' or 'INST' chunk or None."""
+        if self.smpl is not None:
+            return self.smpl.midi_unity_note
+        if self.inst:
+            return self.inst[0]
+        return None
+
+    @property
+    def loops(self):
+        """List of wavfile.Loop tuples from foreign 'smpl' or 'INST' chunk."""
+        if self.smpl is not None:
+            return self.smpl.loops
+        if self.inst:
+            return aifffile.make_loops(self.markers, self.inst[7:])
+        return []
+
+
+if __name__ == '__main__':
+    import sys
+
+    with FlacFile(sys.argv[1]) as flac:
+        print("Format: FLAC, %i ch, %i bit, %i Hz, %i frames" % (
+            flac.channels, flac.bits_per_sample, flac.samplerate, flac.num_frames))
+        print("Root note: %s" % flac.root_note)
+        for loop in flac.loops:
+            print("Loop #%i - start: %10d end: %10d" % (loop.cue_point_id, loop.start,
+                                                         loop.end))
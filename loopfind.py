@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+"""Find sustain loop points in WAV files and write them to the 'smpl' chunk.
+
+Loop candidates are pairs of rising zero crossings in the sustain part of the
+sample, at least a minimum loop length apart. For all candidate pairs at once,
+the signal around the loop end is compared with the signal around the loop
+start, so that playback continues smoothly when it jumps back:
+
+* phase continuity: normalised cross-correlation of a short window (by
+  default 256 frames) before and after each point
+* spectral continuity: cosine similarity of the magnitude spectra of a longer
+  window (by default 2048 frames) centered on each point
+* level continuity: ratio of the RMS levels of the short windows
+
+The candidates are ranked by the product of the three scores. Windows are
+taken from a strided frame view of the sample data and compared with matrix
+products, so there is no Python loop over candidate pairs. Files are
+processed in parallel worker processes.
+
+Requires:
+
+* [NumPy](https://pypi.org/project/numpy/)
+
+"""
+
+import argparse
+import logging
+import os
+import sys
+from collections import namedtuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import npanalysis
+import perfstats
+import wavfile
+
+
+__all__ = (
+    "LoopCandidate",
+    "find_loops",
+    "find_loops_in_file",
+    "write_loop",
+)
+log = logging.getLogger(__name__)
+
+LoopCandidate = namedtuple(
+    "LoopCandidate", ["start", "end", "score", "correlation", "spectral", "level"]
+)
+
+# minimum RMS level of the windows around a loop point (-60 dBFS)
+MIN_LEVEL = 1e-3
+EPSILON = 1e-12
+
+
+def _thin(positions, count):
+    """Return at most `count` evenly spread elements of sorted `positions`."""
+    if len(positions) <= count:
+        return positions
+
+    return positions[np.linspace(0, len(positions) - 1, count).round().astype(int)]
+
+
+def _normalized(rows):
+    return rows / np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), EPSILON)
+
+
+def find_loops(
+    samples,
+    samplerate,
+    min_length=0.5,
+    search_start=0.3,
+    window=256,
+    fft_size=2048,
+    max_candidates=256,
+    num_results=5,
+):
+    """Return list of the best LoopCandidate tuples for a mono signal.
+
+    `samples` is a 1-D float array. Loops start after `search_start` (as a
+    fraction of the sample length) and are at least `min_length` seconds
+    long. At most `max_candidates` start and end points each are compared.
+
+    `start` of each candidate is the first frame in the loop, `end` the last
+    (as in WAV 'smpl' chunks). Returns an empty list if the sample is too
+    short or has no suitable zero crossings.
+
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    n = len(samples)
+    half = max(window, fft_size // 2)
+    min_frames = int(min_length * samplerate)
+
+    # position of the first non-negative frame after each rising zero crossing
+    crossings = np.flatnonzero((samples[:-1] < 0) & (samples[1:] >= 0)) + 1
+    crossings = crossings[(crossings >= max(half, int(search_start * n)))
+                          & (crossings <= n - half)]
+
+    if len(crossings) < 2:
+        return []
+
+    starts = _thin(crossings[crossings <= crossings[-1] - min_frames], max_candidates)
+    # the frame after the loop end, which should continue like the loop start
+    ends = _thin(crossings[crossings >= crossings[0] + min_frames], max_candidates)
+
+    if not len(starts) or not len(ends):
+        return []
+
+    short = sliding_window_view(samples, 2 * window)
+    context_starts = short[starts - window]
+    context_ends = short[ends - window]
+    correlation = _normalized(context_starts) @ _normalized(context_ends).T
+
+    rms_starts = np.sqrt(np.mean(np.square(context_starts), axis=1))
+    rms_ends = np.sqrt(np.mean(np.square(context_ends), axis=1))
+    level = np.minimum.outer(rms_starts, rms_ends) / np.maximum(
+        np.maximum.outer(rms_starts, rms_ends), EPSILON
+    )
+    level[(rms_starts < MIN_LEVEL)[:, np.newaxis] | (rms_ends < MIN_LEVEL)] = 0
+
+    long = sliding_window_view(samples, fft_size)
+    taper = np.hanning(fft_size).astype(np.float32)
+    spectra_starts = np.abs(np.fft.rfft(long[starts - fft_size // 2] * taper, axis=1))
+    spectra_ends = np.abs(np.fft.rfft(long[ends - fft_size // 2] * taper, axis=1))
+    spectral = _normalized(spectra_starts) @ _normalized(spectra_ends).T
+
+    score = np.clip(correlation, 0, None) * spectral * level
+    score[ends[np.newaxis, :] - starts[:, np.newaxis] < min_frames] = -1
+
+    num_results = min(num_results, score.size)
+    best = np.argpartition(score, -num_results, axis=None)[-num_results:]
+    best = best[np.argsort(score.flat[best])[::-1]]
+    results = []
+
+    for i, j in zip(*np.unravel_index(best, score.shape)):
+        if score[i, j] <= 0:
+            break
+
+        results.append(
+            LoopCandidate(
+                int(starts[i]),
+                int(ends[j]) - 1,
+                float(score[i, j]),
+                float(correlation[i, j]),
+                float(spectral[i, j]),
+                float(level[i, j]),
+            )
+        )
+
+    return results
+
+
+def find_loops_in_file(path, **kwargs):
+    """Return list of LoopCandidate tuples for WAV file (mixed down to mono).
+
+    Keyword arguments are passed to `find_loops`.
+
+    """
+    with perfstats.timer("loops.read"):
+        samples, samplerate = npanalysis.read_wav(path)
+
+    with perfstats.timer("loops.search"):
+        return find_loops(samples, samplerate, **kwargs)
+
+
+def write_loop(path, loop):
+    """Replace the loops in the 'smpl' chunk of WAV file with given candidate.
+
+    Other 'smpl' chunk fields are kept. If the file has no 'smpl' chunk, one
+    is added. The file is rewritten via a temporary file.
+
+    """
+    tmp_path = path + ".tmp"
+
+    with wavfile.WavFile(path) as wav:
+        smpl = wav.chunks.get(b"smpl")
+        wav.set_chunk(
+            wavfile.SmplChunk.create(
+                [wavfile.Loop(0, wavfile.LOOP_TYPE_FORWARD, loop.start, loop.end, 0, 0)],
+                samplerate=wav.fmt.samples_per_sec,
+                template=smpl,
+            )
+        )
+
+        with open(tmp_path, "wb") as fp:
+            wav.write(fp)
+
+    os.replace(tmp_path, path)
+
+
+def process_file(path, write=False, force=False, **kwargs):
+    """Find loops in WAV file and optionally write the best one.
+
+    Returns a tuple (path, candidates, written, error). Files which already
+    have loops are not changed unless `force` is true.
+
+    """
+    try:
+        candidates = find_loops_in_file(path, **kwargs)
+        written = False
+
+        if write and candidates:
+            with wavfile.WavFile(path) as wav:
+                has_loops = bool(wav.loops)
+
+            if force or not has_loops:
+                write_loop(path, candidates[0])
+                written = True
+
+        return path, candidates, written, None
+    except (OSError, ValueError, wavfile.Error) as exc:
+        return path, [], False, exc
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    perfstats.add_arguments(ap)
+    ap.add_argument("-w", "--write", action="store_true",
+                    help="Write best loop to the 'smpl' chunk of each file")
+    ap.add_argument("-f", "--force", action="store_true",
+                    help="With -w, also replace loops of files which already have loops")
+    ap.add_argument("-l", "--min-length", type=float, default=0.5, metavar="SEC",
+                    help="Minimum loop length in seconds (default: %(default)s)")
+    ap.add_argument("-s", "--search-start", type=float, default=0.3, metavar="FRACTION",
+                    help="Earliest loop start as fraction of sample length "
+                         "(default: %(default)s)")
+    ap.add_argument("-n", "--num-results", type=int, default=3, metavar="NUM",
+                    help="Number of candidates to print per file (default: %(default)i)")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, metavar="NUM",
+                    help="Number of worker processes (default: %(default)i)")
+    ap.add_argument("wavfiles", nargs="+", metavar="WAVFILE", help="WAV input file(s)")
+    args = ap.parse_args(args)
+
+    options = dict(write=args.write, force=args.force, min_length=args.min_length,
+                   search_start=args.search_start, num_results=args.num_results)
+    status = 0
+
+    with perfstats.session(args.stats, args.profile):
+        if args.jobs > 1 and len(args.wavfiles) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            from functools import partial
+
+            pool = ProcessPoolExecutor(max_workers=args.jobs)
+            results = pool.map(partial(process_file, **options), args.wavfiles,
+                               chunksize=4)
+        else:
+            pool = None
+            results = (process_file(path, **options) for path in args.wavfiles)
+
+        try:
+            for path, candidates, written, error in results:
+                if error:
+                    print("%s: %s" % (path, error), file=sys.stderr)
+                    status = 1
+                    continue
+
+                print("%s:%s" % (path, " loop written" if written else ""))
+
+                if not candidates:
+                    print("    no loop found")
+
+                for loop in candidates:
+                    print("    start: %10i end: %10i score: %.3f (phase %.3f, spectrum "
+                          "%.3f, level %.3f)" % loop)
+        finally:
+            if pool:
+                pool.shutdown()
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""Peak, RMS and integrated loudness of WAV files.
+
+Integrated loudness follows the measurement of ITU-R BS.1770: the signal is
+K-weighted, its mean square is taken per channel over overlapping 400 ms
+blocks (75 % overlap), and blocks below an absolute gate of -70 LUFS and a
+relative gate of 10 LU below the ungated loudness are discarded. Channels are
+summed with equal weights, i.e. without the surround channel weighting.
+
+The K-weighting filter is applied as a zero-phase gain in the frequency
+domain, using the magnitude response of the BS.1770 filter (specified for 48
+kHz) at the sample's own frequencies. Block mean squares are taken from the
+running sum of the squared, filtered signal, so the whole measurement is a
+handful of vectorised NumPy operations per file. Results are within a few
+tenths of a dB of a time-domain implementation for typical instrument
+samples, which is plenty for balancing sample levels.
+
+Requires:
+
+* [NumPy](https://pypi.org/project/numpy/)
+
+"""
+
+import logging
+from collections import namedtuple
+
+import numpy as np
+
+import npanalysis
+
+
+__all__ = (
+    "Loudness",
+    "SILENCE_DB",
+    "k_weighting_gain",
+    "measure",
+    "measure_file",
+)
+log = logging.getLogger(__name__)
+
+# floor for levels of silent signals, so results can be stored as JSON numbers
+SILENCE_DB = -120.0
+BLOCK_SECONDS = 0.4
+HOP_SECONDS = 0.1
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# BS.1770 K-weighting filter stages (b, a) for 48 kHz: high shelf, high pass
+K_WEIGHTING_RATE = 48000
+K_WEIGHTING_STAGES = (
+    ((1.53512485958697, -2.69169618940638, 1.19839281085285),
+     (1.0, -1.69065929318241, 0.73248077421585)),
+    ((1.0, -2.0, 1.0),
+     (1.0, -1.99004745483398, 0.99007225036621)),
+)
+
+# peak and RMS level in dBFS, integrated loudness in LUFS
+Loudness = namedtuple("Loudness", ["peak", "rms", "lufs"])
+
+
+def _to_db(power):
+    return max(SILENCE_DB, float(10 * np.log10(power))) if power > 0 else SILENCE_DB
+
+
+def k_weighting_gain(freqs):
+    """Return power gain of the K-weighting filter at given frequencies in Hz.
+
+    Frequencies above the Nyquist frequency of the reference filter get the
+    gain just below it.
+
+    """
+    freqs = np.minimum(np.asarray(freqs, dtype=np.float64), K_WEIGHTING_RATE / 2 - 1)
+    z = np.exp(-2j * np.pi * freqs / K_WEIGHTING_RATE)
+    gain = np.ones(freqs.shape)
+
+    for b, a in K_WEIGHTING_STAGES:
+        num = b[0] + b[1] * z + b[2] * z * z
+        den = a[0] + a[1] * z + a[2] * z * z
+        gain *= np.abs(num / den) ** 2
+
+    return gain
+
+
+def measure(samples, samplerate):
+    """Return Loudness of a float array of shape (frames, channels) or (frames,)."""
+    samples = np.asarray(samples, dtype=np.float32)
+
+    if samples.ndim == 1:
+        samples = samples[:, np.newaxis]
+
+    nframes = len(samples)
+
+    if not nframes:
+        return Loudness(SILENCE_DB, SILENCE_DB, SILENCE_DB)
+
+    peak = float(np.max(np.abs(samples)))
+    rms_power = float(np.mean(np.square(samples, dtype=np.float64)))
+
+    spectrum = np.fft.rfft(samples, axis=0)
+    spectrum *= np.sqrt(k_weighting_gain(np.fft.rfftfreq(nframes, 1 / samplerate)))[
+        :, np.newaxis
+    ]
+    weighted = np.fft.irfft(spectrum, nframes, axis=0)
+    del spectrum
+
+    # running sum of the squares summed over channels, for block mean squares
+    energy = np.concatenate([[0.0], np.cumsum(np.square(weighted).sum(axis=1))])
+    block = min(nframes, int(BLOCK_SECONDS * samplerate))
+    hop = max(1, int(HOP_SECONDS * samplerate))
+    starts = np.arange(0, nframes - block + 1, hop)
+    powers = (energy[starts + block] - energy[starts]) / block
+
+    gated = powers[powers > 10 ** ((ABSOLUTE_GATE + 0.691) / 10)]
+
+    if len(gated):
+        relative = np.mean(gated) * 10 ** (RELATIVE_GATE / 10)
+        gated = gated[gated > relative]
+
+    lufs = _to_db(np.mean(gated)) - 0.691 if len(gated) else SILENCE_DB
+    return Loudness(_to_db(peak * peak), _to_db(rms_power), max(SILENCE_DB, lufs))
+
+
+def measure_file(path):
+    """Return Loudness of WAV file."""
+    samples, samplerate = npanalysis.read_wav(path, mono=False)
+    return measure(samples, samplerate)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    import wavfile
+
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("wavfiles", nargs="+", metavar="WAVFILE", help="WAV input file")
+    args = ap.parse_args()
+    status = 0
+
+    for path in args.wavfiles:
+        try:
+            result = measure_file(path)
+        except (OSError, wavfile.Error) as exc:
+            print("%s: %s" % (path, exc), file=sys.stderr)
+            status = 1
+        else:
+            print("%s: peak %.1f dBFS, RMS %.1f dBFS, %.1f LUFS" % ((path,) + result))
+
+    sys.exit(status)
@@ -3,56 +3,34 @@
 """Create SFZ file from a directory of samples."""
 
 import argparse
+import json
 import logging
+import os
 import pathlib
+import queue
 import re
 import sys
+import threading
 from collections import namedtuple
-from itertools import groupby
-from operator import attrgetter, itemgetter
-from os.path import abspath, basename, exists, join as pathjoin, sep as pathsep, splitext
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
+from os.path import abspath, exists, join as pathjoin, sep as pathsep
 
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+import metascan
+import perfstats
 
-import wavfile
-from onsetdetect import get_offset
-from pitchdetect import estimate_root_note
+# The audio analysis modules 'npanalysis', 'onsetdetect', 'pitchdetect' and
+# 'loudness' pull in NumPy and aubio, so they are only imported when the
+# analysis is enabled.
 
 
 __program__ = "makesfz"
 __version__ = "0.2.0"
 log = logging.getLogger(__program__)
 
-SFZ_TMPL = """\
-<global>
-loop_mode=no_loop
-
-{% for root_note, region in regions -%}
-{% for i, layer in enumerate(sorted(region.layers.values(), key=attrgetter('lovel'))) -%}
-<group>
-lokey={{ region.lokey }}
-pitch_keycenter={{ region.root_note }}
-hikey={{ region.hikey }}
-{% if layer.lovel != 0 %}lovel={{ layer.lovel }}{% endif -%}
-{% if layer.hivel != 127 %}hivel={{ layer.hivel }}{% endif %}
-{# volume={{ (3-i) * -5}} -#}
-{% if layer.hivel < 127 -%}
-amp_velcurve_{{ layer.hivel }}=1
-{% endif -%}
-seq_length={{ layer.samples|length }}
-{% for j, sample in enumerate(layer.samples.values()) -%}
-<region>
-seq_position={{ j+1 }}
-sample={{ sample.path }}
-{% if sample.tune %}tune={{ sample.tune }}{% endif -%}
-{% if sample.offset %}offset={{ sample.offset }}{% endif %}
-{% endfor %}
-{% endfor %}
-{% endfor %}
-"""
 FILE_TYPES = {
     "wav": ("wav",),
-    "aif": ("aif", "aiff"),
+    "aif": ("aif", "aiff", "aifc"),
     "flac": ("flac",),
 }
 RX_NOTE_INFO = (
@@ -69,10 +47,32 @@ SAMPLE_LAYER_VELOCITIES = {
     "all": (0, 127),
 }
 
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_VERSION = 2
+# maximum gain in dB added to quiet samples by level balancing
+MAX_BOOST = 12.0
+
+# 'peak' (dBFS) and 'loudness' (LUFS) are measured with -g/-V, 'volume' (dB) is
+# set by 'balance_levels'
 Sample = namedtuple(
-    "Sample", ["path", "root_note", "tune", "offset", "layer", "sequence_no"]
+    "Sample",
+    [
+        "path",
+        "root_note",
+        "tune",
+        "offset",
+        "layer",
+        "sequence_no",
+        "peak",
+        "loudness",
+        "volume",
+    ],
+    defaults=(None, None, None),
+)
+# 'velcurve' maps velocities to amplitudes for 'amp_velcurve_N' opcodes
+SampleLayer = namedtuple(
+    "SampleLayer", ["hivel", "lovel", "samples", "velcurve"], defaults=(None,)
 )
-SampleLayer = namedtuple("SampleLayer", ["hivel", "lovel", "samples"])
 SampleRegion = namedtuple("SampleRegion", ["root_note", "hikey", "lokey", "layers"])
 
 
@@ -107,20 +107,74 @@ def note_name_to_number(note, base_octave=0):
     return NOTES.index(note) + 12 * (octave - base_octave)
 
 
+class SampleData(object):
+    """Sample data of a file, decoded on first use and shared by all analyses.
+
+    Only WAV files are decoded (with 'npanalysis.read_wav'). Pitch and onset
+    detection read other files, or WAV files which can't be decoded, through
+    their own decoders.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.samples = self.samplerate = self.error = None
+        self._decoded = False
+
+    def decode(self):
+        """Return tuple (samples, samplerate), (None, None) if the file can't be decoded.
+
+        'samples' is a float32 array of shape (frames, channels). For WAV
+        files which can't be decoded, the exception raised is stored in
+        'error'.
+
+        """
+        if not self._decoded:
+            self._decoded = True
+
+            if self.path.suffix.lower() == ".wav":
+                import npanalysis
+                import wavfile
+
+                try:
+                    with perfstats.timer("analyse.decode"):
+                        self.samples, self.samplerate = npanalysis.read_wav(
+                            self.path, mono=False
+                        )
+                except (OSError, ValueError, wavfile.Error) as exc:
+                    self.error = exc
+
+        return self.samples, self.samplerate
+
+    def source(self):
+        """Return tuple (source, samplerate) for pitch and onset detection."""
+        samples, samplerate = self.decode()
+
+        if samples is None:
+            return str(self.path), 0
+
+        return samples, samplerate
+
+
 def get_root_note(
-    path, sample_info, base_octave=0, ignore_metadata=False, detect_pitch=True
+    path,
+    sample_info,
+    base_octave=0,
+    ignore_metadata=False,
+    detect_pitch=True,
+    sample_data=None,
 ):
     root_note = None
 
-    if not ignore_metadata and path.suffix.lower() == ".wav":
-        try:
-            wv = wavfile.WavFile(str(path))
-        except wavfile.Error as exc:
-            log.warning("Could not parse WAV file '%s': %s", path, exc)
-        else:
-            if wv.has_chunk("smpl") and wv.smpl.midi_unity_note:
-                root_note = wv.smpl.midi_unity_note
-                log.debug("Sample root note found in 'smpl' chunk: %i", root_note)
+    if not ignore_metadata and path.suffix.lower() in metascan.READERS:
+        with perfstats.timer("analyse.metadata"):
+            metadata = metascan.read_metadata(path)
+
+        if metadata.error:
+            log.warning("Could not parse sample file '%s': %s", path, metadata.error)
+        elif metadata.root_note:
+            root_note = metadata.root_note
+            log.debug("Sample root note found in metadata: %i", root_note)
 
     if root_note is None:
         acc = sample_info["accidental"] or ""
@@ -135,35 +189,183 @@ def get_root_note(
         )
 
     if root_note is None and detect_pitch:
-        root_note = estimate_root_note(path, start=50)
+        from pitchdetect import estimate_root_note
+
+        source, samplerate = (sample_data or SampleData(path)).source()
+
+        with perfstats.timer("analyse.pitch"):
+            root_note = estimate_root_note(source, start=50, samplerate=samplerate)
 
     return root_note
 
 
-def find_files(rootdir, extensions=None):
-    dirpath = pathlib.Path(rootdir)
+def _scan_dir(dirpath, extensions):
+    """Return lists of matching file paths and sub-directory paths in given directory.
 
-    if dirpath.is_dir():
-        files = []
+    Uses the file type information cached by 'os.scandir', so usually no extra
+    'stat' call per entry is needed.
 
-        for path in dirpath.iterdir():
-            if path.is_file() and (
-                extensions is None or splitext(path)[1] in extensions
-            ):
-                files.append(path)
-            elif path.is_dir():
-                files.extend(find_files(path, extensions))
+    """
+    files = []
+    subdirs = []
+
+    try:
+        with os.scandir(dirpath) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        if extensions is None:
+                            files.append(entry.path)
+                        else:
+                            _, dot, ext = entry.name.rpartition(".")
+                            if dot and "." + ext.lower() in extensions:
+                                files.append(entry.path)
+                    elif entry.is_dir():
+                        subdirs.append(entry.path)
+                except OSError as exc:
+                    log.warning("Could not access '%s': %s", entry.path, exc)
+    except OSError as exc:
+        log.warning("Could not scan directory '%s': %s", dirpath, exc)
+
+    files.sort()
+    subdirs.sort()
+    return files, subdirs
+
+
+def _find_files_parallel(rootdir, extensions, workers):
+    results = queue.Queue()
+    pending = [0]
+    lock = threading.Lock()
+
+    def scan(dirpath):
+        try:
+            files, subdirs = _scan_dir(dirpath, extensions)
+            with lock:
+                pending[0] += len(subdirs)
+            for subdir in subdirs:
+                pool.submit(scan, subdir)
+            results.put(files)
+        finally:
+            with lock:
+                pending[0] -= 1
+                done = pending[0] == 0
+            if done:
+                results.put(None)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending[0] = 1
+        pool.submit(scan, rootdir)
+
+        while True:
+            files = results.get()
+            if files is None:
+                break
+            for path in files:
+                yield pathlib.Path(path)
+
+
+def find_files(rootdir, extensions=None, workers=1):
+    """Yield paths of all files below given directory as 'pathlib.Path' instances.
+
+    If 'extensions' is given, only files with a file name extension (including
+    the dot, all lower-case) in it are included. Matching is case-insensitive.
+
+    Files are yielded as soon as the directory they are in has been scanned.
+    If 'workers' is > 1, sub-directories are scanned in parallel by that many
+    threads, which speeds up scanning of network file systems, but the order
+    in which directories are visited is not deterministic.
+
+    """
+    rootdir = os.fspath(rootdir)
+
+    if not os.path.isdir(rootdir):
+        return
 
-        return files
+    if workers > 1:
+        yield from _find_files_parallel(rootdir, extensions, workers)
+        return
 
+    stack = [rootdir]
 
-def find_samples(rootdir, file_types):
+    while stack:
+        files, subdirs = _scan_dir(stack.pop(), extensions)
+
+        for path in files:
+            yield pathlib.Path(path)
+
+        stack.extend(reversed(subdirs))
+
+
+def sample_extensions(file_types):
+    """Return set of file name extensions for comma-separated list of file types."""
     extensions = set()
     for ftype in file_types.split(","):
         ftype = ftype.strip().lower()
         extensions.update("." + ext for ext in FILE_TYPES.get(ftype, (ftype,)))
 
-    return find_files(rootdir, extensions)
+    return extensions
+
+
+def find_samples(rootdir, file_types, workers=1):
+    return find_files(rootdir, sample_extensions(file_types), workers)
+
+
+def write_sfz(regions, fp):
+    """Write SFZ instrument definition for sample regions to file object.
+
+    'regions' is an iterable of SampleRegion instances, which are written in
+    the given order, one '<group>' per velocity layer and one '<region>' per
+    sample in a layer. Each group is written as soon as it is taken from the
+    iterable.
+
+    """
+    write = fp.write
+    write("<global>\nloop_mode=no_loop\n")
+
+    for region in regions:
+        head = "\n<group>\nlokey=%i\npitch_keycenter=%i\nhikey=%i\n" % (
+            region.lokey,
+            region.root_note,
+            region.hikey,
+        )
+
+        for layer in sorted(region.layers.values(), key=attrgetter("lovel")):
+            lines = [head]
+
+            if layer.lovel != 0:
+                lines.append("lovel=%i\n" % layer.lovel)
+
+            if layer.hivel != 127:
+                lines.append("hivel=%i\n" % layer.hivel)
+
+            if layer.velcurve:
+                lines.extend(
+                    "amp_velcurve_%i=%g\n" % point
+                    for point in sorted(layer.velcurve.items())
+                )
+            elif layer.hivel != 127:
+                lines.append("amp_velcurve_%i=1\n" % layer.hivel)
+
+            lines.append("seq_length=%i\n" % len(layer.samples))
+
+            for seq_position, sample in enumerate(layer.samples.values(), 1):
+                lines.append(
+                    "\n<region>\nseq_position=%i\nsample=%s\n"
+                    % (seq_position, sample.path)
+                )
+
+                if sample.tune:
+                    lines.append("tune=%i\n" % sample.tune)
+
+                if sample.offset:
+                    lines.append("offset=%i\n" % sample.offset)
+
+                if sample.volume:
+                    lines.append("volume=%.1f\n" % sample.volume)
+
+            write("".join(lines))
+            perfstats.count("sfz.groups")
+            perfstats.count("sfz.regions", len(layer.samples))
 
 
 def strip_dirs(path, keep_dirs=1):  #
@@ -171,6 +373,495 @@ def strip_dirs(path, keep_dirs=1):  #
     return pathjoin(*pathcomps[-(keep_dirs + 1) :])
 
 
+def make_sample(path, regex, args):
+    """Analyse sample file and return Sample instance for it.
+
+    Returns None, if the file name does not match 'regex'.
+
+    """
+    sample_path = strip_dirs(str(path), args.keep_dirs)
+    match = regex.search(path.stem)
+    if not match:
+        log.warning("Sample '{}' did not match regex. Skipping it.".format(path.stem))
+        return None
+
+    info = match.groupdict()
+    sequence_no = info.get("sequence_no")
+    layer = info.get("layer") or "all"
+
+    # decoded once, if needed, for pitch, onset and loudness analysis
+    sample_data = SampleData(path)
+    root = get_root_note(
+        path,
+        info,
+        args.base_octave,
+        args.ignore_metadata,
+        args.detect_pitch,
+        sample_data,
+    )
+
+    if root is None:
+        root_note = 60
+        tune = 0
+    else:
+        root_note = round(root)
+        diff = root_note - root
+        tune = round(diff * 100) if diff else None
+
+    if args.detect_offset:
+        from onsetdetect import get_offset
+
+        source, samplerate = sample_data.source()
+
+        with perfstats.timer("analyse.offset"):
+            offset = get_offset(source, samplerate=samplerate)[0]
+    else:
+        offset = 0
+
+    peak = loudness = None
+
+    if args.balance_levels or args.loudness_layers:
+        if path.suffix.lower() == ".wav":
+            from loudness import SILENCE_DB, measure
+
+            samples, samplerate = sample_data.decode()
+
+            if samples is None:
+                log.warning(
+                    "Could not measure loudness of '%s': %s", path, sample_data.error
+                )
+            else:
+                with perfstats.timer("analyse.loudness"):
+                    level = measure(samples, samplerate)
+
+                if level.lufs > SILENCE_DB:
+                    peak = round(level.peak, 2)
+                    loudness = round(level.lufs, 2)
+        else:
+            log.debug("Loudness analysis is only supported for WAV files: %s", path)
+
+    return Sample(
+        path=sample_path,
+        root_note=root_note,
+        tune=tune,
+        offset=offset,
+        layer=layer,
+        sequence_no=sequence_no,
+        peak=peak,
+        loudness=loudness,
+    )
+
+
+def manifest_options(args):
+    """Return dict of command line options which affect sample analysis results."""
+    return {
+        "version": MANIFEST_VERSION,
+        "base_octave": args.base_octave,
+        "detect_offset": args.detect_offset,
+        "detect_pitch": args.detect_pitch,
+        "ignore_metadata": args.ignore_metadata,
+        "analyse_loudness": bool(args.balance_levels or args.loudness_layers),
+        "keep_dirs": args.keep_dirs,
+        "regex": args.regex,
+    }
+
+
+def load_manifest(path, options):
+    """Load sample analysis manifest written by a previous run.
+
+    Returns a dict mapping absolute sample paths to manifest entries. The dict
+    is empty, if the manifest does not exist, can't be read or was written
+    with different analysis options.
+
+    """
+    try:
+        with open(path, encoding="utf-8") as fp:
+            data = json.load(fp)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as exc:
+        log.warning("Could not read manifest '%s': %s", path, exc)
+        return {}
+
+    if data.get("options") != options:
+        log.info("Analysis options changed since last run. Analysing all samples.")
+        return {}
+
+    return data.get("samples", {})
+
+
+def save_manifest(path, options, samples):
+    """Write sample analysis manifest.
+
+    'samples' is a dict mapping absolute sample paths to dicts with the keys
+    'size', 'mtime' (in ns) and 'sample' (the Sample fields as a dict).
+
+    """
+    tmp_path = path + ".tmp"
+
+    with open(tmp_path, "w", encoding="utf-8") as fp:
+        json.dump({"options": options, "samples": samples}, fp, separators=(",", ":"))
+
+    os.replace(tmp_path, path)
+
+
+def generate_sfz(args, regex, manifest=None):
+    """Analyse samples in 'args.sampledir' and write SFZ file.
+
+    If 'manifest' is given (see 'load_manifest'), analysis results in it are
+    re-used for unchanged samples. Returns the updated manifest or None, if
+    none was given.
+
+    """
+    samples = []
+    new_manifest = None if manifest is None else {}
+    num_reused = 0
+
+    def analyse(path):
+        """Return tuple (path, stat, sample, reused) for sample file path."""
+        stat = None
+
+        if manifest is not None:
+            try:
+                stat = path.stat()
+            except OSError as exc:
+                log.warning("Could not access sample '%s': %s", path, exc)
+                return path, None, None, False
+
+            entry = manifest.get(abspath(path))
+
+            if (
+                entry
+                and entry["size"] == stat.st_size
+                and entry["mtime"] == stat.st_mtime_ns
+            ):
+                return path, stat, Sample(**entry["sample"]), True
+
+        with perfstats.timer("analyse"):
+            return path, stat, make_sample(path, regex, args), False
+
+    paths = find_samples(args.sampledir, args.file_types, args.scan_threads)
+    results = metascan.iter_bounded(analyse, perfstats.timed_iter("scan", paths),
+                                    args.jobs)
+
+    for path, stat, sample, reused in results:
+        perfstats.count("samples.found")
+
+        if sample is None:
+            continue
+
+        if new_manifest is not None:
+            num_reused += reused
+            new_manifest[abspath(path)] = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+                "sample": sample._asdict(),
+            }
+
+        samples.append(sample)
+
+    if new_manifest is not None:
+        log.info(
+            "Re-used analysis results for %i of %i samples.", num_reused, len(samples)
+        )
+
+    with perfstats.timer("group"):
+        regions = group_samples(samples)
+
+    if args.balance_levels or args.loudness_layers:
+        with perfstats.timer("balance"):
+            balance_levels(
+                regions.values(),
+                set_volumes=args.balance_levels,
+                set_velocities=args.loudness_layers,
+            )
+
+    if args.check:
+        check_regions(regions.values())
+
+    sorted_regions = (regions[root_note] for root_note in sorted(regions))
+
+    with perfstats.timer("write"):
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as fp:
+                write_sfz(sorted_regions, fp)
+        else:
+            write_sfz(sorted_regions, sys.stdout)
+            sys.stdout.flush()
+
+    return new_manifest
+
+
+def make_sfz(args):
+    """Analyse samples in 'args.sampledir' and write SFZ file.
+
+    'args' is the namespace of parsed command line options. With
+    'args.watch', the SFZ file is written again whenever sample files are
+    added, changed or removed, and only new or changed samples are analysed
+    again.
+
+    """
+    regex = re.compile(args.regex, re.IGNORECASE)
+
+    if not exists(args.sampledir):
+        return "Sample directory not found: %s" % args.sampledir
+
+    manifest_path = None
+    manifest = None
+
+    if args.incremental:
+        if not args.output:
+            return "Option -u/--incremental requires -O/--output."
+
+        manifest_path = args.output + MANIFEST_SUFFIX
+        options = manifest_options(args)
+        manifest = load_manifest(manifest_path, options)
+    elif args.watch:
+        # analysis results are kept in memory between runs
+        manifest = {}
+
+    manifest = generate_sfz(args, regex, manifest)
+
+    if manifest_path:
+        save_manifest(manifest_path, options, manifest)
+
+    if not args.watch:
+        return
+
+    from filewatch import open_watcher
+
+    extensions = sample_extensions(args.file_types)
+
+    with open_watcher([args.sampledir], True, extensions, args.poll) as watcher:
+        log.info("Watching '%s' for changes. Press Ctrl-C to stop.", args.sampledir)
+
+        try:
+            while True:
+                changes = watcher.changes()
+                log.info(
+                    "%i samples added, %i changed, %i removed.",
+                    len(changes.added),
+                    len(changes.modified),
+                    len(changes.removed),
+                )
+                manifest = generate_sfz(args, regex, manifest)
+
+                if manifest_path:
+                    save_manifest(manifest_path, options, manifest)
+        except KeyboardInterrupt:
+            pass
+
+
+def group_samples(samples):
+    """Group samples into SampleRegion instances by root note.
+
+    Returns a dict mapping root notes to regions. Samples in each region are
+    grouped into SampleLayer instances by velocity layer and ordered by
+    round-robin sequence number within each layer.
+
+    """
+    regions = {}
+    unknown_layers = set()
+    for sample in samples:
+        if sample.root_note not in regions:
+            regions[sample.root_note] = region = SampleRegion(
+                sample.root_note, sample.root_note, sample.root_note, layers={}
+            )
+        else:
+            region = regions[sample.root_note]
+
+        if sample.layer not in region.layers:
+            if sample.layer in SAMPLE_LAYER_VELOCITIES:
+                lovel, hivel = SAMPLE_LAYER_VELOCITIES[sample.layer]
+            else:
+                if sample.layer not in unknown_layers:
+                    log.warning(
+                        "No velocity range for layer '%s', using 0-127 unless derived "
+                        "from loudness (-V).",
+                        sample.layer,
+                    )
+                    unknown_layers.add(sample.layer)
+
+                lovel, hivel = SAMPLE_LAYER_VELOCITIES["all"]
+
+            region.layers[sample.layer] = layer = SampleLayer(hivel, lovel, samples={})
+        else:
+            layer = region.layers[sample.layer]
+
+        if sample.sequence_no is None:
+            sample = sample._replace(sequence_no=len(layer.samples) + 1)
+
+        if sample.sequence_no in layer.samples:
+            log.warning(
+                "Multiple samples for  sequence slot '{}'. Ignoring sample '{}'.".format(
+                    sample.sequence_no, sample.path
+                )
+            )
+            continue
+
+        layer.samples[sample.sequence_no] = sample
+
+    return regions
+
+
+def loudness_velocities(layer_loudness):
+    """Return dict mapping layer names to (lovel, hivel) from layer loudness.
+
+    'layer_loudness' maps layer names to loudness in LUFS. Each layer is
+    placed at the velocity at which the loudest layer, attenuated by the
+    default SFZ velocity curve (amplitude proportional to velocity squared),
+    would be as loud, and the boundaries are put halfway between on a
+    logarithmic scale.
+
+    """
+    names = sorted(layer_loudness, key=layer_loudness.get)
+
+    if not names:
+        return {}
+
+    loudest = layer_loudness[names[-1]]
+    natural = [127 * 10 ** ((layer_loudness[name] - loudest) / 40) for name in names]
+    ranges = {}
+    lovel = 0
+
+    for i, name in enumerate(names):
+        if i == len(names) - 1:
+            hivel = 127
+        else:
+            hivel = int((natural[i] * natural[i + 1]) ** 0.5)
+            # leave at least one velocity for each louder layer
+            hivel = min(max(hivel, lovel), 126 - (len(names) - 2 - i))
+
+        ranges[name] = (lovel, hivel)
+        lovel = hivel + 1
+
+    return ranges
+
+
+def balance_levels(regions, set_volumes=True, set_velocities=False):
+    """Adjust SampleRegion instances in place from measured sample loudness.
+
+    With 'set_volumes', each sample gets a 'volume' which brings it to the
+    median loudness of its velocity layer (without raising its peak level
+    above 0 dBFS or by more than MAX_BOOST dB), and each layer gets a velocity
+    curve, which starts at the level of the next softer layer of the region,
+    so the level does not jump at layer boundaries.
+
+    With 'set_velocities', the velocity ranges of the layers are derived from
+    their loudness with 'loudness_velocities', instead of taken from
+    SAMPLE_LAYER_VELOCITIES.
+
+    Samples without measured loudness are left unchanged.
+
+    """
+    from statistics import median
+
+    regions = list(regions)
+    measured = {}
+
+    for region in regions:
+        for name, layer in region.layers.items():
+            for sample in layer.samples.values():
+                if sample.loudness is not None:
+                    measured.setdefault(name, []).append(sample.loudness)
+
+    layer_loudness = {name: median(values) for name, values in measured.items()}
+    ranges = {}
+
+    if set_velocities:
+        ranges = loudness_velocities(layer_loudness)
+        # layers without a nominal range keep their measured position
+        named = [name for name in ranges if name in SAMPLE_LAYER_VELOCITIES]
+        nominal = sorted(named, key=lambda name: SAMPLE_LAYER_VELOCITIES[name])
+
+        if named != nominal:
+            log.warning(
+                "Measured loudness order of velocity layers (%s) differs from their "
+                "names.",
+                ", ".join(ranges),
+            )
+
+    for name, loudness in layer_loudness.items():
+        lovel, hivel = ranges.get(
+            name, SAMPLE_LAYER_VELOCITIES.get(name, SAMPLE_LAYER_VELOCITIES["all"])
+        )
+        log.info(
+            "Layer '%s': %.1f LUFS, velocity %i-%i.", name, loudness, lovel, hivel
+        )
+
+    for region in regions:
+        for name, layer in list(region.layers.items()):
+            if name in ranges:
+                layer = layer._replace(lovel=ranges[name][0], hivel=ranges[name][1])
+
+            if set_volumes and name in layer_loudness:
+                for seq, sample in layer.samples.items():
+                    if sample.loudness is None:
+                        continue
+
+                    volume = min(
+                        layer_loudness[name] - sample.loudness, -sample.peak, MAX_BOOST
+                    )
+                    layer.samples[seq] = sample._replace(volume=round(volume, 1))
+
+            region.layers[name] = layer
+
+        if not set_volumes:
+            continue
+
+        softer = None
+
+        for name, layer in sorted(region.layers.items(), key=lambda i: i[1].lovel):
+            if name not in layer_loudness:
+                softer = None
+                continue
+
+            if layer.hivel != 127 or layer.lovel != 0:
+                velcurve = {layer.hivel: 1}
+
+                if softer is not None and layer.lovel > 0:
+                    gain = 10 ** ((layer_loudness[softer] - layer_loudness[name]) / 20)
+                    velcurve[layer.lovel] = round(min(gain, 1.0), 3)
+
+                region.layers[name] = layer._replace(velcurve=velcurve)
+
+            softer = name
+
+
+def check_regions(regions):
+    """Log overlapping velocity layers and velocity gaps of SampleRegion instances."""
+    import sfzcoverage
+
+    with perfstats.timer("check"):
+        zones = sfzcoverage.zones_from_sample_regions(regions)
+        coverage = sfzcoverage.analyse(zones)
+
+    for overlap in coverage.overlaps:
+        log.warning(
+            "Samples '%s' and '%s' overlap at keys %i-%i, velocity %i-%i.",
+            overlap.first.path,
+            overlap.second.path,
+            overlap.lokey,
+            overlap.hikey,
+            overlap.lovel,
+            overlap.hivel,
+        )
+
+    for gap in coverage.gaps:
+        # keys between root notes are not mapped by design
+        if (gap.lovel, gap.hivel) != (0, 127):
+            log.warning(
+                "No sample for keys %i-%i, velocity %i-%i.",
+                gap.lokey,
+                gap.hikey,
+                gap.lovel,
+                gap.hivel,
+            )
+
+    for zone in coverage.unreachable:
+        log.warning("Sample '%s' is unreachable.", zone.ref.path)
+
+
 def main(args=None):
     ap = argparse.ArgumentParser(prog=__program__, description=__doc__)
     # ap.set_defaults(**options)
@@ -213,6 +904,21 @@ def main(args=None):
         action="store_true",
         help="Try to detect pitch of samples through audio analysis.",
     )
+    ap.add_argument(
+        "-g",
+        "--balance-levels",
+        action="store_true",
+        help="Measure sample loudness (WAV only) and add 'volume' and "
+        "'amp_velcurve_N' opcodes, which balance the samples of each velocity layer "
+        "and avoid level jumps between layers.",
+    )
+    ap.add_argument(
+        "-V",
+        "--loudness-layers",
+        action="store_true",
+        help="Derive velocity layer ranges from measured sample loudness (WAV only) "
+        "instead of the fixed ranges for the layer names.",
+    )
     ap.add_argument(
         "-H",
         "--high-key",
@@ -233,6 +939,57 @@ def main(args=None):
         default=1,
         help="Number of directory levels to keep on sample file paths (default: %(default)i).",
     )
+    ap.add_argument(
+        "-j",
+        "--scan-threads",
+        type=int,
+        metavar="NUM",
+        default=1,
+        help="Number of threads for scanning sample directories in parallel "
+        "(default: %(default)i).",
+    )
+    ap.add_argument(
+        "-J",
+        "--jobs",
+        type=int,
+        metavar="NUM",
+        default=1,
+        help="Number of samples to read and analyse concurrently (default: "
+        "%(default)i). Values > 1 hide storage latency on network file systems.",
+    )
+    ap.add_argument(
+        "-O",
+        "--output",
+        metavar="FILE",
+        help="Write SFZ to given file instead of standard output.",
+    )
+    ap.add_argument(
+        "-u",
+        "--incremental",
+        action="store_true",
+        help="Record analysis results in a manifest next to the output file and only "
+        "analyse new or changed samples on subsequent runs (requires -O).",
+    )
+    ap.add_argument(
+        "-C",
+        "--check",
+        action="store_true",
+        help="Warn about overlapping regions and velocity gaps in the generated "
+        "instrument.",
+    )
+    ap.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        help="Keep running and write the SFZ again whenever samples are added, "
+        "changed or removed. Only new or changed samples are analysed again.",
+    )
+    ap.add_argument(
+        "--poll",
+        action="store_true",
+        help="With -w, poll for changes instead of using inotify.",
+    )
+    perfstats.add_arguments(ap)
     ap.add_argument(
         "-v", "--verbose", action="store_true", default=False, help="Be more verbose"
     )
@@ -250,94 +1007,8 @@ def main(args=None):
         format="%(levelname)s - %(message)s",
     )
 
-    env = Environment(
-        loader=FileSystemLoader("templates"), autoescape=select_autoescape(["tmpl"])
-    )
-    template = env.from_string(SFZ_TMPL)
-    regex = re.compile(args.regex, re.IGNORECASE)
-
-    samples = []
-
-    if not exists(args.sampledir):
-        return "Sample directory not found: %s" % args.sampledir
-
-    for path in find_samples(args.sampledir, args.file_types):
-        sample_path = strip_dirs(str(path), args.keep_dirs)
-        match = regex.search(path.stem)
-        if not match:
-            log.warning(
-                "Sample '{}' did not match regex. Skipping it.".format(path.stem)
-            )
-            continue
-
-        info = match.groupdict()
-        sequence_no = info.get("sequence_no")
-        layer = info.get("layer") or "all"
-
-        root = get_root_note(
-            path, info, args.base_octave, args.ignore_metadata, args.detect_pitch
-        )
-
-        if root is None:
-            root_note = 60
-            tune = 0
-        else:
-            root_note = round(root)
-            diff = root_note - root
-            tune = round(diff * 100) if diff else None
-
-        if args.detect_offset:
-            offset = get_offset(str(path))[0]
-        else:
-            offset = 0
-
-        samples.append(
-            Sample(
-                path=sample_path,
-                root_note=root_note,
-                tune=tune,
-                offset=offset,
-                layer=layer,
-                sequence_no=sequence_no,
-            )
-        )
-
-    regions = {}
-    for sample in samples:
-        if sample.root_note not in regions:
-            regions[sample.root_note] = region = SampleRegion(
-                sample.root_note, sample.root_note, sample.root_note, layers={}
-            )
-        else:
-            region = regions[sample.root_note]
-
-        if sample.layer not in region.layers:
-            lovel, hivel = SAMPLE_LAYER_VELOCITIES[sample.layer]
-            region.layers[sample.layer] = layer = SampleLayer(hivel, lovel, samples={})
-        else:
-            layer = region.layers[sample.layer]
-
-        if sample.sequence_no is None:
-            sample = sample._replace(sequence_no=len(layer.samples) + 1)
-
-        if sample.sequence_no in layer.samples:
-            log.warning(
-                "Multiple samples for  sequence slot '{}'. Ignoring sample '{}'.".format(
-                    sample.sequence_no, sample.path
-                )
-            )
-            continue
-
-        layer.samples[sample.sequence_no] = sample
-
-    print(
-        template.render(
-            regions=sorted(regions.items()),
-            enumerate=enumerate,
-            attrgetter=attrgetter,
-            sorted=sorted,
-        )
-    )
+    with perfstats.session(args.stats, args.profile):
+        return make_sfz(args)
 
 
 if __name__ == "__main__":
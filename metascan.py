@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Concurrent sample file metadata scanning for high-latency storage.
+
+On network file systems, each open and header read waits for a round-trip.
+The functions in this module keep many of them in flight at once, bounded by
+a concurrency limit, so that scanning is limited by bandwidth rather than
+latency.
+
+`scan_metadata` and `iter_bounded` use a thread pool and yield results in
+input order as soon as they are available. `scan_metadata_async` is an
+asynchronous generator for asyncio applications, which yields results in
+completion order.
+
+"""
+
+__all__ = (
+    "READERS",
+    "SampleMetadata",
+    "iter_bounded",
+    "read_metadata",
+    "scan_metadata",
+    "scan_metadata_async",
+)
+
+import logging
+import os
+from collections import deque, namedtuple
+
+import aifffile
+import flacfile
+import wavfile
+
+
+log = logging.getLogger(__name__)
+
+# header-only readers for root note and loops embedded in sample files
+READERS = {
+    ".aif": aifffile.AiffFile,
+    ".aifc": aifffile.AiffFile,
+    ".aiff": aifffile.AiffFile,
+    ".flac": flacfile.FlacFile,
+    ".wav": wavfile.WavFile,
+}
+DEFAULT_CONCURRENCY = 16
+
+SampleMetadata = namedtuple("SampleMetadata", ["path", "root_note", "loops", "error"])
+
+
+def read_metadata(path):
+    """Read root note and loops from sample file header.
+
+    Returns a SampleMetadata instance. 'root_note' is None and 'loops' is empty
+    if the file type is not supported or the file has no such metadata. If the
+    file can't be read or parsed, 'error' is set to the exception.
+
+    """
+    reader = READERS.get(os.path.splitext(str(path))[1].lower())
+
+    if reader is None:
+        return SampleMetadata(path, None, [], None)
+
+    try:
+        with reader(str(path)) as sample_file:
+            return SampleMetadata(path, sample_file.root_note, sample_file.loops, None)
+    except (OSError, wavfile.Error) as exc:
+        return SampleMetadata(path, None, [], exc)
+
+
+def iter_bounded(func, iterable, workers=DEFAULT_CONCURRENCY, max_pending=None):
+    """Yield func(item) for each item of iterable, computed by a thread pool.
+
+    At most 'max_pending' (default: twice the number of workers) calls are in
+    flight at any time, so 'iterable' is consumed lazily and may be a
+    generator, e.g. a directory scan, which is still running. Results are
+    yielded in input order. Exceptions raised by 'func' are re-raised.
+
+    With 'workers' <= 1, items are processed one after another in the
+    calling thread.
+
+    """
+    if workers <= 1:
+        yield from map(func, iterable)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    max_pending = max_pending or 2 * workers
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            for item in iterable:
+                pending.append(pool.submit(func, item))
+
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def scan_metadata(paths, concurrency=DEFAULT_CONCURRENCY):
+    """Yield SampleMetadata for each path, reading up to 'concurrency' files at once."""
+    return iter_bounded(read_metadata, paths, concurrency)
+
+
+async def scan_metadata_async(paths, concurrency=DEFAULT_CONCURRENCY):
+    """Asynchronously yield SampleMetadata for each path as reads complete.
+
+    Blocking file reads run in a thread pool with 'concurrency' workers, and
+    at most 'concurrency' reads are in flight at any time.
+
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    loop = asyncio.get_running_loop()
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        try:
+            for path in paths:
+                pending.add(loop.run_in_executor(pool, read_metadata, path))
+
+                if len(pending) >= concurrency:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        yield future.result()
+
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,403 @@
+"""Pure-NumPy pitch and onset detection for WAV files.
+
+Fallback implementations of the analysis done by `pitchdetect` and
+`onsetdetect`, for hosts where aubio is not available. Sample data is read
+through `wavfile.WavFile` (or passed in as an array decoded by the caller)
+and split into a 2-D array of overlapping frames (a strided view, no copy),
+which is then processed in batches of many frames at once.
+
+Requires:
+
+* [NumPy](https://pypi.org/project/numpy/)
+
+"""
+
+import logging
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import wavfile
+
+
+__all__ = (
+    "blocks",
+    "detect_onsets",
+    "detect_pitch",
+    "frame_signal",
+    "get_offset",
+    "onset_positions",
+    "pcm_to_array",
+    "read_wav",
+    "source_blocks",
+    "spectral_flux",
+    "wav_format",
+    "yin_pitch",
+)
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = 2048
+
+
+def pcm_to_array(data, format_tag, bits_per_sample, channels):
+    """Convert raw WAV sample data to a float32 array of shape (frames, channels).
+
+    Integer PCM is scaled to the range -1.0 .. 1.0.
+
+    """
+    width = (bits_per_sample + 7) // 8
+    nframes = len(data) // (width * channels)
+    data = memoryview(data)[: nframes * width * channels]
+
+    if format_tag == wavfile.WAVE_FORMAT_IEEE_FLOAT:
+        if width not in (4, 8):
+            raise wavfile.UnsupportedCompressionError(
+                "Unsupported float sample width: %i bits" % bits_per_sample
+            )
+        a = np.frombuffer(data, dtype="<f%i" % width).astype(np.float32)
+    elif format_tag == wavfile.WAVE_FORMAT_PCM:
+        if width == 1:
+            a = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+        elif width == 3:
+            raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+            padded = np.zeros((len(raw), 4), dtype=np.uint8)
+            padded[:, 1:] = raw
+            a = (padded.view("<i4").ravel() >> 8).astype(np.float32) / (1 << 23)
+        elif width in (2, 4):
+            a = np.frombuffer(data, dtype="<i%i" % width).astype(np.float32)
+            a /= 1 << (width * 8 - 1)
+        else:
+            raise wavfile.UnsupportedCompressionError(
+                "Unsupported PCM sample width: %i bits" % bits_per_sample
+            )
+    else:
+        raise wavfile.UnsupportedCompressionError(
+            "Unsupported data compression format: %s"
+            % wavfile.FORMAT_TAGS.get(format_tag, format_tag)
+        )
+
+    return a.reshape(-1, channels)
+
+
+def wav_format(wav):
+    """Return tuple (format_tag, bits_per_sample, channels, samplerate) of WavFile.
+
+    For WAVE_FORMAT_EXTENSIBLE files, the format tag of the sub-format is
+    returned. Raises `wavfile.ParseError` if the 'fmt ' chunk has no bits per
+    sample.
+
+    """
+    fmt = wav.fmt
+
+    if not fmt.bits_per_sample:
+        raise wavfile.ParseError("No bits per sample in 'fmt ' chunk.")
+
+    return fmt.sub_format, fmt.bits_per_sample, fmt.channels, fmt.samples_per_sec
+
+
+def read_wav(source, mono=True):
+    """Read sample data of WAV file into a float32 NumPy array.
+
+    `source` may be a file name or an open `wavfile.WavFile` instance.
+
+    Returns a tuple `(samples, samplerate)`. If `mono` is true, all channels
+    are mixed down and `samples` is 1-dimensional, otherwise it has the shape
+    (frames, channels).
+
+    """
+    wav = source if isinstance(source, wavfile.WavFile) else wavfile.WavFile(str(source))
+
+    try:
+        format_tag, bits, channels, samplerate = wav_format(wav)
+        samples = pcm_to_array(wav.chunks[b"data"].data, format_tag, bits, channels)
+    finally:
+        if wav is not source:
+            wav.close()
+
+    if mono:
+        samples = samples.mean(axis=1) if channels > 1 else samples[:, 0]
+
+    return samples, samplerate
+
+
+def _mono_samples(source, samplerate=0):
+    """Return tuple (samples, samplerate) of 1-D samples of an analysis source.
+
+    `source` is a file name, a `wavfile.WavFile` or a float array of shape
+    (frames,) or (frames, channels) with the given `samplerate`. Arrays with
+    several channels are mixed down.
+
+    """
+    if isinstance(source, np.ndarray):
+        if not samplerate:
+            raise ValueError("Sample rate required to analyse an array of samples.")
+
+        samples = source.mean(axis=1) if source.ndim > 1 else source
+        return samples.astype(np.float32, copy=False), samplerate
+
+    samples, file_samplerate = read_wav(source)
+
+    if samplerate and samplerate != file_samplerate:
+        log.warning("Resampling not supported. Using file sample rate %i.",
+                    file_samplerate)
+
+    return samples, file_samplerate
+
+
+def blocks(samples, hop_size, dtype=np.float32):
+    """Yield tuples (block, read) of consecutive blocks of `hop_size` frames.
+
+    Blocks are taken from a float array like `read_wav` returns, mixed down
+    to mono, in the way `aubio.source` reads them: the last block is
+    zero-padded and `read` is the number of frames in it, which is less than
+    `hop_size` (possibly 0) for the last block only.
+
+    """
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+
+    for start in range(0, len(samples) + 1, hop_size):
+        block = np.zeros(hop_size, dtype=dtype)
+        read = len(samples[start:start + hop_size])
+        block[:read] = samples[start:start + hop_size]
+        yield block, read
+
+
+def source_blocks(source):
+    """Yield tuples (block, read) from an `aubio.source` until its end, then close it."""
+    with source:
+        while True:
+            block, read = source()
+            yield block, read
+
+            if read < source.hop_size:
+                break
+
+
+def frame_signal(samples, buf_size, hop_size, center=False):
+    """Return 2-D array of overlapping frames of length `buf_size` from 1-D `samples`.
+
+    Frame `i` starts at sample `i * hop_size`, or, if `center` is true, is
+    centered on it. The signal is zero-padded, so that every sample is part of
+    at least one frame. The result is a read-only strided view of the padded
+    signal.
+
+    """
+    pad_start = buf_size // 2 if center else 0
+    nframes = max(1, -(-len(samples) // hop_size))
+    pad_end = max(0, (nframes - 1) * hop_size + buf_size - pad_start - len(samples))
+    padded = np.pad(samples, (pad_start, pad_end))
+    return sliding_window_view(padded, buf_size)[::hop_size][:nframes]
+
+
+def frame_level(frames):
+    """Return sound pressure level in dB of each row in `frames`."""
+    energy = np.einsum("ij,ij->i", frames, frames, dtype=np.float64) / frames.shape[1]
+    with np.errstate(divide="ignore"):
+        return 10.0 * np.log10(energy)
+
+
+def _batches(frames, batch_size):
+    for start in range(0, len(frames), batch_size):
+        yield np.asarray(frames[start:start + batch_size], dtype=np.float64)
+
+
+def yin_pitch(frames, samplerate, tolerance=0.15, fmin=None, fmax=None,
+              batch_size=BATCH_SIZE):
+    """Estimate fundamental frequency of each frame with the YIN algorithm.
+
+    The difference function of all frames in a batch is computed at once from
+    an FFT cross-correlation and running sums of squares.
+
+    Returns a tuple of arrays `(frequencies, confidences)`. The frequency of
+    frames for which no period below the `tolerance` threshold of the
+    normalized difference function is found is 0.
+
+    """
+    buf_size = frames.shape[1]
+    w = buf_size // 2
+    nfft = 1 << (buf_size - 1).bit_length()
+    tau_min = max(2, int(samplerate / fmax)) if fmax else 2
+    tau_max = min(w - 2, int(samplerate / fmin)) if fmin else w - 2
+    lags = np.arange(1, w)
+    freqs = np.zeros(len(frames))
+    confidences = np.zeros(len(frames))
+
+    if tau_max <= tau_min:
+        raise ValueError("Frame size too small for given frequency range.")
+
+    pos = 0
+    for x in _batches(frames, batch_size):
+        n = len(x)
+        # r[t] = sum(x[j] * x[j + t] for j < w)
+        spec = np.fft.rfft(x, nfft, axis=1)
+        r = np.fft.irfft(spec * np.conj(np.fft.rfft(x[:, :w], nfft, axis=1)), nfft,
+                         axis=1)[:, :w]
+        csum = np.zeros((n, buf_size + 1))
+        np.cumsum(x * x, axis=1, out=csum[:, 1:])
+        # d[t] = sum((x[j] - x[j + t]) ** 2 for j < w)
+        d = csum[:, w:w + 1] + (csum[:, w:2 * w] - csum[:, :w]) - 2.0 * r
+        d[:, 0] = 0.0
+        # cumulative mean normalized difference
+        cum = np.cumsum(d[:, 1:], axis=1)
+        cmnd = np.ones_like(d)
+        np.divide(d[:, 1:] * lags, cum, out=cmnd[:, 1:], where=cum > 0)
+
+        # first local minimum below threshold within lag range
+        seg = cmnd[:, tau_min:tau_max + 1]
+        cand = (seg[:, :-1] < tolerance) & (seg[:, :-1] <= seg[:, 1:])
+        voiced = cand.any(axis=1)
+        tau = np.where(voiced, cand.argmax(axis=1), seg[:, :-1].argmin(axis=1)) + tau_min
+        rows = np.arange(n)
+        a, b, c = cmnd[rows, tau - 1], cmnd[rows, tau], cmnd[rows, tau + 1]
+        denom = a - 2.0 * b + c
+        shift = np.zeros(n)
+        np.divide(0.5 * (a - c), denom, out=shift, where=denom != 0)
+        shift = np.clip(shift, -1.0, 1.0)
+
+        freqs[pos:pos + n] = np.where(voiced, samplerate / (tau + shift), 0.0)
+        confidences[pos:pos + n] = np.clip(1.0 - b, 0.0, 1.0)
+        pos += n
+
+    return freqs, confidences
+
+
+def spectral_flux(frames, batch_size=BATCH_SIZE):
+    """Return the half-wave rectified spectral flux of each frame.
+
+    The flux of the first frame is measured against silence.
+
+    """
+    window = np.hanning(frames.shape[1])
+    flux = np.zeros(len(frames))
+    prev = np.zeros(frames.shape[1] // 2 + 1)
+
+    pos = 0
+    for x in _batches(frames, batch_size):
+        mag = np.abs(np.fft.rfft(x * window, axis=1))
+        diff = np.diff(mag, axis=0, prepend=prev[np.newaxis])
+        flux[pos:pos + len(x)] = np.maximum(diff, 0.0).sum(axis=1)
+        prev = mag[-1]
+        pos += len(x)
+
+    return flux
+
+
+def detect_pitch(
+    source,
+    method="default",
+    tolerance=0.15,
+    silence=-70.0,
+    unit="Hz",
+    buf_size=1024,
+    hop_size=256,
+    samplerate=0,
+    channels=0,
+):
+    """Detect pitches of given audio source.
+
+    Same interface and result as `pitchdetect.detect_pitch`: a list of
+    `(position, pitch, confidence)` tuples, one per hop. Only the `yin`
+    method is implemented, `default` is an alias for it. Pitch is 0 for
+    silent or unvoiced frames.
+
+    Supported units: `Hz`, `midi`.
+
+    """
+    if method not in ("default", "yin"):
+        log.warning("Pitch detection method '%s' not supported. Using 'yin'.", method)
+
+    if unit not in ("Hz", "midi"):
+        raise ValueError("Unsupported pitch unit: %s" % unit)
+
+    samples, file_samplerate = _mono_samples(source, samplerate)
+    frames = frame_signal(samples, buf_size, hop_size)
+    freqs, confidences = yin_pitch(frames, file_samplerate, tolerance)
+    freqs[frame_level(frames) < silence] = 0.0
+
+    if unit == "midi":
+        with np.errstate(divide="ignore"):
+            freqs = np.where(freqs > 0, 69.0 + 12.0 * np.log2(freqs / 440.0), 0.0)
+
+    positions = np.arange(len(frames)) * hop_size
+    return list(zip(positions.tolist(), freqs.tolist(), confidences.tolist()))
+
+
+def onset_positions(samples, samplerate, threshold=0.5, silence=-70.0,
+                    min_interval=0.05, buf_size=512, hop_size=256):
+    """Return list of onset positions (in samples) in 1-D array `samples`.
+
+    Onsets are peaks of the normalized spectral flux, which exceed the moving
+    median of the surrounding frames by more than `threshold`.
+
+    """
+    frames = frame_signal(samples, buf_size, hop_size, center=True)
+    odf = spectral_flux(frames)
+    peak = odf.max()
+    onsets = []
+
+    if peak > 0:
+        odf /= peak
+        median = np.median(sliding_window_view(np.pad(odf, (5, 1)), 7), axis=1)
+        prev = np.concatenate(([0.0], odf[:-1]))
+        nxt = np.concatenate((odf[1:], [0.0]))
+        is_onset = ((odf > prev) & (odf >= nxt) & (odf - median > threshold)
+                    & (frame_level(frames) >= silence))
+        min_dist = min_interval * samplerate
+
+        for pos in (np.flatnonzero(is_onset) * hop_size).tolist():
+            if not onsets or pos - onsets[-1] >= min_dist:
+                onsets.append(pos)
+
+    return onsets
+
+
+def detect_onsets(
+    source,
+    method="default",
+    threshold=0.5,
+    silence=-70.0,
+    min_interval=0.05,
+    buf_size=512,
+    hop_size=256,
+    samplerate=0,
+    channels=0,
+):
+    """Detect onsets of given audio source.
+
+    Same interface and result as `onsetdetect.detect_onsets`: a list of onset
+    positions in samples. Only the `specflux` method is implemented,
+    `default` is an alias for it.
+
+    """
+    if method not in ("default", "specflux"):
+        log.warning("Onset detection method '%s' not supported. Using 'specflux'.",
+                    method)
+
+    samples, file_samplerate = _mono_samples(source, samplerate)
+    return onset_positions(samples, file_samplerate, threshold, silence,
+                           min_interval, buf_size, hop_size)
+
+
+def get_offset(fn, buf_size=512, hop_size=256, samplerate=0, channels=0):
+    """Return tuple of sample onset offset and all detected onsets.
+
+    Same interface and result as `onsetdetect.get_offset`.
+
+    """
+    samples, file_samplerate = _mono_samples(fn, samplerate)
+    onsets = onset_positions(samples, file_samplerate, buf_size=buf_size,
+                             hop_size=hop_size)
+    offset = 0
+
+    if len(onsets) > 1 and onsets[0] == 0:
+        offset = onsets[1]
+    elif onsets:
+        offset = onsets[0]
+
+    if offset > file_samplerate / 2:
+        log.warning("%s: detected sample onset offset > 0.5 s!. Assuming offset=0.",
+                    "<samples>" if isinstance(fn, np.ndarray) else fn)
+        offset = 0
+
+    return offset, onsets
@@ -2,14 +2,21 @@
 
 Requires:
 
-* [aubio](https://pypi.org/project/aubio/)
+* [NumPy](https://pypi.org/project/numpy/)
+* [aubio](https://pypi.org/project/aubio/) (optional, falls back to the
+  NumPy implementation in `npanalysis` if not installed)
 
 """
 
 import sys
 import logging
 
-import aubio
+import numpy as np
+
+try:
+    import aubio
+except ImportError:
+    aubio = None
 
 
 __all__ = ("detect_onset", "get_offset")
@@ -32,44 +39,85 @@ def detect_onsets(
     Supported methods: `energy`, `hfc`, `complex`, `phase`, `specdiff`, `kl`,
         `mkl`, `specflux`, `default`(`hfc`).
 
+    `source` is a file name, an `aubio.source` or a float array of samples
+    of shape (frames,) or (frames, channels) (see `npanalysis.read_wav`),
+    which requires `samplerate`.
+
+    Without aubio, only `specflux` is supported (see
+    `npanalysis.detect_onsets`).
+
     """
-    if not isinstance(source, aubio.source):
-        source = aubio.source(
-            source, hop_size=hop_size, samplerate=samplerate, channels=channels
-        )
+    if aubio is None:
+        import npanalysis
 
-    with source:
-        onsetdetect = aubio.onset(
+        return npanalysis.detect_onsets(
+            source,
             method=method,
+            threshold=threshold,
+            silence=silence,
+            min_interval=min_interval,
             buf_size=buf_size,
             hop_size=hop_size,
-            samplerate=source.samplerate,
+            samplerate=samplerate,
+            channels=channels,
         )
-        onsetdetect.set_threshold(threshold)
-        onsetdetect.set_silence(silence)
-        onsetdetect.set_minioi_s(min_interval)
 
-        results = []
-        nframes = 0
+    import npanalysis
+
+    if isinstance(source, np.ndarray):
+        if not samplerate:
+            raise ValueError("Sample rate required to analyse an array of samples.")
 
-        while True:
-            block, read = source()
+        blocks = npanalysis.blocks(source, hop_size, aubio.float_type)
+    else:
+        if not isinstance(source, aubio.source):
+            source = aubio.source(
+                source, hop_size=hop_size, samplerate=samplerate, channels=channels
+            )
+
+        samplerate = source.samplerate
+        blocks = npanalysis.source_blocks(source)
+
+    onsetdetect = aubio.onset(
+        method=method,
+        buf_size=buf_size,
+        hop_size=hop_size,
+        samplerate=samplerate,
+    )
+    onsetdetect.set_threshold(threshold)
+    onsetdetect.set_silence(silence)
+    onsetdetect.set_minioi_s(min_interval)
 
-            if onsetdetect(block):
-                results.append(onsetdetect.get_last())
+    results = []
 
-            nframes += read
-            if read < source.hop_size:
-                break
+    for block, read in blocks:
+        if onsetdetect(block):
+            results.append(onsetdetect.get_last())
 
     return results
 
 
 def get_offset(fn, buf_size=512, hop_size=256, samplerate=0, channels=0):
-    source = aubio.source(
-        fn, hop_size=hop_size, samplerate=samplerate, channels=channels
-    )
-    onsets = detect_onsets(source)
+    if aubio is None:
+        import npanalysis
+
+        return npanalysis.get_offset(
+            fn, buf_size=buf_size, hop_size=hop_size, samplerate=samplerate,
+            channels=channels
+        )
+
+    if isinstance(fn, np.ndarray):
+        source = fn
+        name = "<samples>"
+    else:
+        source = aubio.source(
+            fn, hop_size=hop_size, samplerate=samplerate, channels=channels
+        )
+        samplerate = source.samplerate
+        name = fn
+
+    onsets = detect_onsets(source, buf_size=buf_size, hop_size=hop_size,
+                           samplerate=samplerate)
     offset = 0
 
     if len(onsets) > 1 and onsets[0] == 0:
@@ -77,8 +125,8 @@ def get_offset(fn, buf_size=512, hop_size=256, samplerate=0, channels=0):
     elif onsets:
         offset = onsets[0]
 
-    if offset > source.samplerate / 2:
-        log.warning("%s: detected sample onset offset > 0.5 s!. Assuming offset=0.", fn)
+    if offset > samplerate / 2:
+        log.warning("%s: detected sample onset offset > 0.5 s!. Assuming offset=0.", name)
         offset = 0
 
     return offset, onsets
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+"""Multi-resolution waveform peaks of WAV files with an on-disk cache.
+
+For waveform displays, the sample data of a WAV file is reduced to a pyramid
+of levels, each with the minimum, maximum and RMS value per channel for bins
+of a fixed number of frames (by default 256, 4096 and 65536). The finest level
+is computed from the memory-mapped 'data' chunk in large blocks with
+vectorised NumPy reductions, the coarser levels are reduced from it.
+
+Peaks are stored in a sidecar file (by default next to the WAV file, with the
+suffix '.peaks') as 16-bit integers, scaled so that 32767 is full scale. The
+sidecar records the size and modification time of the WAV file, and is only
+recomputed when these change. Each level is mapped into memory separately, so
+zooming only reads the level which is displayed.
+
+Requires:
+
+* [NumPy](https://pypi.org/project/numpy/)
+
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+
+import numpy as np
+
+import npanalysis
+import perfstats
+import wavfile
+
+
+__all__ = (
+    "LEVELS",
+    "PeakFile",
+    "compute_peaks",
+    "open_peaks",
+    "peaks_path",
+    "write_peaks",
+)
+log = logging.getLogger(__name__)
+
+LEVELS = (256, 4096, 65536)
+# frames converted to float per block, a multiple of all default bin sizes
+BLOCK_FRAMES = 65536 * 16
+FULL_SCALE = 32767
+MAGIC = b"PEAK"
+VERSION = 1
+SUFFIX = ".peaks"
+
+# magic, version, channels, number of levels, samplerate, frames, WAV file
+# size and mtime (ns)
+_HEADER = struct.Struct("<4sHHIIQQq")
+# bin frames, number of bins, data offset
+_LEVEL = struct.Struct("<IQQ")
+
+
+class Error(wavfile.Error):
+    """Invalid or unsupported peaks file."""
+    pass
+
+
+def _frame_size(bits, channels):
+    return channels * ((bits + 7) // 8)
+
+
+def _base_level(wav, bin_frames):
+    """Return (min, max, sum of squares, count) arrays of shape (bins, channels)."""
+    format_tag, bits, channels, _ = npanalysis.wav_format(wav)
+    frame_size = _frame_size(bits, channels)
+    block_size = BLOCK_FRAMES // bin_frames * bin_frames * frame_size
+
+    try:
+        data = wav.mmap_data()
+        blocks = (data[pos:pos + block_size] for pos in range(0, len(data), block_size))
+    except (OSError, ValueError, AttributeError):
+        # not a regular file
+        blocks = wav.iter_blocks(block_size // frame_size)
+
+    mins, maxs, sumsqs, counts = [], [], [], []
+
+    for block in blocks:
+        samples = npanalysis.pcm_to_array(block, format_tag, bits, channels)
+        nframes = len(samples)
+        nbins = -(-nframes // bin_frames)
+        starts = np.arange(0, nframes, bin_frames)
+        mins.append(np.minimum.reduceat(samples, starts, axis=0))
+        maxs.append(np.maximum.reduceat(samples, starts, axis=0))
+        sumsqs.append(np.add.reduceat(np.square(samples, dtype=np.float64), starts, axis=0))
+        count = np.full(nbins, bin_frames, dtype=np.int64)
+        count[-1] = nframes - (nbins - 1) * bin_frames
+        counts.append(count)
+        perfstats.count("peaks.frames", nframes)
+
+    if not mins:
+        empty = np.zeros((0, channels))
+        return empty, empty, empty, np.zeros(0, dtype=np.int64)
+
+    return (np.concatenate(mins), np.concatenate(maxs), np.concatenate(sumsqs),
+            np.concatenate(counts))
+
+
+def _to_int16(values):
+    return np.round(np.clip(values, -1.0, 1.0) * FULL_SCALE).astype("<i2")
+
+
+def compute_peaks(wav, levels=LEVELS):
+    """Compute peak pyramid of a WavFile.
+
+    'levels' are the bin sizes in frames, in ascending order. Each must be a
+    multiple of the previous one, since each level is reduced from the
+    previous one. Returns a list of int16 arrays of shape (bins,
+    channels, 3) with the minimum, maximum and RMS value of each bin.
+
+    """
+    base = levels[0]
+
+    if any(level % finer for finer, level in zip(levels, levels[1:])):
+        raise ValueError("Each peak level must be a multiple of the previous one.")
+
+    with perfstats.timer("peaks.compute"):
+        mins, maxs, sumsqs, counts = _base_level(wav, base)
+        result = []
+
+        for level in levels:
+            if level != base:
+                starts = np.arange(0, len(mins), level // base)
+
+                if len(mins):
+                    mins = np.minimum.reduceat(mins, starts, axis=0)
+                    maxs = np.maximum.reduceat(maxs, starts, axis=0)
+                    sumsqs = np.add.reduceat(sumsqs, starts, axis=0)
+                    counts = np.add.reduceat(counts, starts)
+
+                base = level
+
+            rms = np.sqrt(sumsqs / np.maximum(counts, 1)[:, np.newaxis])
+            result.append(np.stack([_to_int16(mins), _to_int16(maxs), _to_int16(rms)],
+                                   axis=-1))
+
+    return result
+
+
+def write_peaks(path, peaks, levels, channels, samplerate, num_frames, size, mtime_ns):
+    """Write peak pyramid computed by 'compute_peaks' to file."""
+    offset = _HEADER.size + _LEVEL.size * len(levels)
+    table = []
+
+    for level, data in zip(levels, peaks):
+        table.append(_LEVEL.pack(level, len(data), offset))
+        offset += data.nbytes
+
+    tmp_path = path + ".tmp"
+
+    with open(tmp_path, "wb") as fp:
+        fp.write(_HEADER.pack(MAGIC, VERSION, channels, len(levels), samplerate,
+                              num_frames, size, mtime_ns))
+        fp.write(b"".join(table))
+
+        for data in peaks:
+            fp.write(np.ascontiguousarray(data).tobytes())
+
+    os.replace(tmp_path, path)
+
+
+class PeakFile(object):
+    """Memory-mapped peaks file.
+
+    Attributes: channels, samplerate, num_frames, source_size, source_mtime
+    (size and modification time in ns of the WAV file the peaks were computed
+    from) and levels (list of bin sizes in frames).
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, "rb") as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            (magic, version, self.channels, num_levels, self.samplerate,
+             self.num_frames, self.source_size,
+             self.source_mtime) = _HEADER.unpack_from(self._mmap)
+
+            if magic != MAGIC or version != VERSION:
+                raise Error("%s: not a peaks file or unsupported version" % path)
+
+            self._levels = {}
+
+            for i in range(num_levels):
+                bin_frames, num_bins, offset = _LEVEL.unpack_from(
+                    self._mmap, _HEADER.size + i * _LEVEL.size)
+                self._levels[bin_frames] = (num_bins, offset)
+        except struct.error:
+            self.close()
+            raise Error("%s: truncated peaks file" % path)
+        except Exception:
+            self.close()
+            raise
+
+        self.levels = sorted(self._levels)
+
+    def close(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            # level arrays still referenced, unmapped on garbage collection
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def level(self, bin_frames):
+        """Return int16 array (bins, channels, 3) of min/max/RMS for bin size."""
+        num_bins, offset = self._levels[bin_frames]
+        return np.frombuffer(self._mmap, dtype="<i2", count=num_bins * self.channels * 3,
+                             offset=offset).reshape(num_bins, self.channels, 3)
+
+    def for_zoom(self, frames_per_pixel):
+        """Return (bin_frames, array) of the coarsest level not coarser than zoom.
+
+        If even the finest level is coarser than 'frames_per_pixel', the finest
+        level is returned.
+
+        """
+        candidates = [level for level in self.levels if level <= frames_per_pixel]
+        bin_frames = candidates[-1] if candidates else self.levels[0]
+        return bin_frames, self.level(bin_frames)
+
+
+def peaks_path(wav_path, cache_dir=None):
+    """Return path of peaks file for WAV file.
+
+    Without 'cache_dir', this is a sidecar file next to the WAV file, else a
+    file in 'cache_dir' named after a hash of the absolute WAV file path.
+
+    """
+    if cache_dir is None:
+        return wav_path + SUFFIX
+
+    digest = hashlib.blake2b(os.path.abspath(wav_path).encode("utf-8"), digest_size=16)
+    return os.path.join(cache_dir, digest.hexdigest() + SUFFIX)
+
+
+def open_peaks(wav_path, levels=LEVELS, cache_dir=None):
+    """Return PeakFile for WAV file, computing and caching peaks if needed.
+
+    Cached peaks are used, if they were computed with the same levels from a
+    file with the same size and modification time.
+
+    """
+    wav_path = os.fspath(wav_path)
+    path = peaks_path(wav_path, cache_dir)
+    stat = os.stat(wav_path)
+
+    try:
+        peakfile = PeakFile(path)
+    except FileNotFoundError:
+        pass
+    except (OSError, Error) as exc:
+        log.warning("Ignoring invalid peaks file '%s': %s", path, exc)
+    else:
+        if (peakfile.source_size == stat.st_size
+                and peakfile.source_mtime == stat.st_mtime_ns
+                and peakfile.levels == sorted(levels)):
+            perfstats.count("peaks.cache_hits")
+            return peakfile
+
+        peakfile.close()
+
+    with wavfile.WavFile(wav_path) as wav:
+        peaks = compute_peaks(wav, sorted(levels))
+        _, bits, channels, samplerate = npanalysis.wav_format(wav)
+        num_frames = wav.chunks[b"data"].size // _frame_size(bits, channels)
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    write_peaks(path, peaks, sorted(levels), channels, samplerate, num_frames,
+                stat.st_size, stat.st_mtime_ns)
+    return PeakFile(path)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    perfstats.add_arguments(ap)
+    ap.add_argument("-d", "--cache-dir", metavar="DIR",
+                    help="Store peaks files in DIR instead of next to the WAV files")
+    ap.add_argument("-l", "--levels", default=",".join(str(l) for l in LEVELS),
+                    help="Comma-separated bin sizes in frames (default: %(default)s)")
+    ap.add_argument("wavfiles", nargs="+", metavar="WAVFILE", help="WAV input file")
+    args = ap.parse_args()
+
+    levels = [int(level) for level in args.levels.split(",")]
+    status = 0
+
+    with perfstats.session(args.stats, args.profile):
+        for wav_path in args.wavfiles:
+            try:
+                with open_peaks(wav_path, levels, args.cache_dir) as peakfile:
+                    print("%s: %i frames, %i ch, levels: %s" % (
+                        wav_path, peakfile.num_frames, peakfile.channels,
+                        ", ".join("%i (%i bins)" % (level, len(peakfile.level(level)))
+                                  for level in peakfile.levels)))
+            except (OSError, ValueError, wavfile.Error) as exc:
+                print("%s: %s" % (wav_path, exc), file=sys.stderr)
+                status = 1
+
+    sys.exit(status)
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""Low-overhead run-time statistics and profiling hooks.
+
+Stage timers and counters are only recorded after `enable()` was called
+(usually via `session()`). While disabled, `timer()` returns a shared no-op
+context manager and `count()` returns immediately, so instrumented code paths
+only pay for one function call. Code which has to compute a value just for
+the statistics should check the module-level `enabled` flag first.
+
+Command line tools add the `--stats` and `--profile` options with
+`add_arguments()` and wrap their work in `session()`:
+
+    with perfstats.session(args.stats, args.profile):
+        ...
+
+`--profile FILE` writes a cProfile dump, or, if the file name ends in
+`.json`, the recorded timer spans as a Chrome trace event file (viewable
+with chrome://tracing or Perfetto).
+
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+
+__all__ = (
+    "add_arguments",
+    "count",
+    "counters",
+    "disable",
+    "enable",
+    "enabled",
+    "report",
+    "reset",
+    "session",
+    "timed_iter",
+    "timer",
+    "timers",
+)
+
+enabled = False
+counters = Counter()
+timers = defaultdict(float)
+calls = Counter()
+_events = None
+_clock = time.perf_counter
+# timers and counters may be updated from worker threads
+_lock = threading.Lock()
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _Timer(object):
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = _clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, self.start, _clock())
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def enable(trace=False):
+    """Start recording timers and counters.
+
+    If `trace` is true, each timer span is also recorded for a trace event
+    dump.
+
+    """
+    global enabled, _events
+    enabled = True
+    _events = [] if trace else None
+
+
+def disable():
+    """Stop recording timers and counters."""
+    global enabled
+    enabled = False
+
+
+def reset():
+    """Clear all recorded timers, counters and trace events."""
+    counters.clear()
+    timers.clear()
+    calls.clear()
+
+    if _events is not None:
+        del _events[:]
+
+
+def record(name, start, end):
+    """Add time span from `start` to `end` (in `time.perf_counter` s) to timer."""
+    with _lock:
+        timers[name] += end - start
+        calls[name] += 1
+
+    if _events is not None:
+        _events.append((name, start, end, threading.get_ident()))
+
+
+def timer(name):
+    """Return context manager, which adds the time spent in it to the named timer."""
+    return _Timer(name) if enabled else _NULL_TIMER
+
+
+def count(name, n=1):
+    """Increment named counter by `n`."""
+    if enabled:
+        with _lock:
+            counters[name] += n
+
+
+def _timed_iter(name, iterable):
+    iterator = iter(iterable)
+
+    while True:
+        start = _clock()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            record(name, start, _clock())
+            return
+
+        record(name, start, _clock())
+        yield item
+
+
+def timed_iter(name, iterable):
+    """Wrap iterable, adding the time spent producing each item to the named timer.
+
+    Returns `iterable` unchanged if recording is disabled.
+
+    """
+    return _timed_iter(name, iterable) if enabled else iterable
+
+
+def report(fp=None):
+    """Write table of recorded timers and counters to file object (default: stderr)."""
+    fp = fp or sys.stderr
+
+    if timers:
+        fp.write("{:32s} {:>12s} {:>10s}\n".format("Stage", "Time [ms]", "Calls"))
+
+        for name in sorted(timers):
+            fp.write("{:32s} {:12.2f} {:10d}\n".format(
+                name, timers[name] * 1000, calls[name]))
+
+    if counters:
+        fp.write("{:32s} {:>12s}\n".format("Counter", "Value"))
+
+        for name in sorted(counters):
+            fp.write("{:32s} {:12d}\n".format(name, counters[name]))
+
+
+def write_trace(path):
+    """Write recorded timer spans as Chrome trace event JSON file."""
+    tids = {}
+    events = []
+
+    for name, start, end, tid in _events or ():
+        events.append({
+            "name": name,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": 0,
+            "tid": tids.setdefault(tid, len(tids)),
+        })
+
+    with open(path, "w") as fp:
+        json.dump({"traceEvents": events, "otherData": dict(counters)}, fp)
+
+
+@contextmanager
+def session(stats=False, profile=None, fp=None):
+    """Context manager which records statistics for the code run in it.
+
+    If `stats` is true, a report is written to `fp` (default: stderr) on
+    exit. If `profile` is a file name, a cProfile dump, or a trace event
+    file if the name ends in `.json`, is written to it.
+
+    If both are false, nothing is recorded.
+
+    """
+    if not (stats or profile):
+        yield
+        return
+
+    trace = bool(profile) and profile.endswith(".json")
+    profiler = None
+    reset()
+    enable(trace=trace)
+
+    if profile and not trace:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile)
+
+        disable()
+
+        if trace:
+            write_trace(profile)
+
+        if stats:
+            report(fp)
+
+
+def add_arguments(ap):
+    """Add '--stats' and '--profile' options to argparse.ArgumentParser instance."""
+    ap.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print per-stage timings and counters to standard error on exit.",
+    )
+    ap.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Write cProfile data to FILE, or trace events, if FILE ends in '.json'.",
+    )
@@ -2,16 +2,21 @@
 
 Requires:
 
-* [aubio](https://pypi.org/project/aubio/)
 * [NumPy](https://pypi.org/project/numpy/)
+* [aubio](https://pypi.org/project/aubio/) (optional, falls back to the
+  NumPy implementation in `npanalysis` if not installed)
 
 """
 
 import statistics
 
-import aubio
 import numpy as np
 
+try:
+    import aubio
+except ImportError:
+    aubio = None
+
 
 __all__ = ("detect_pitch", "estimate_root_note", "remove_outliers")
 
@@ -44,53 +49,83 @@ def detect_pitch(
     Supported methods: `yinfft`, `yin`, `yinfast`, `fcomb`, `mcomb`,
     `schmitt`, `specacf`, `default` (`yinfft`).
 
+    `source` is a file name, an `aubio.source` or a float array of samples
+    of shape (frames,) or (frames, channels) (see `npanalysis.read_wav`),
+    which requires `samplerate`.
+
+    Without aubio, only `yin` is supported (see `npanalysis.detect_pitch`).
+
     """
-    if not isinstance(source, aubio.source):
-        source = aubio.source(
-            source, hop_size=hop_size, samplerate=samplerate, channels=channels
-        )
+    if aubio is None:
+        import npanalysis
 
-    with source:
-        pitchdetect = aubio.pitch(
+        # aubio's yinfft tolerance is not a YIN threshold, use the YIN default
+        return npanalysis.detect_pitch(
+            source,
             method=method,
+            silence=silence,
+            unit=unit,
             buf_size=buf_size,
             hop_size=hop_size,
-            samplerate=source.samplerate,
+            samplerate=samplerate,
+            channels=channels,
         )
-        pitchdetect.set_tolerance(tolerance)
-        pitchdetect.set_silence(silence)
-        pitchdetect.set_unit(unit)
 
-        results = []
-        nframes = 0
+    import npanalysis
+
+    if isinstance(source, np.ndarray):
+        if not samplerate:
+            raise ValueError("Sample rate required to analyse an array of samples.")
 
-        while True:
-            block, read = source()
-            confidence = pitchdetect.get_confidence()
+        blocks = npanalysis.blocks(source, hop_size, aubio.float_type)
+    else:
+        if not isinstance(source, aubio.source):
+            source = aubio.source(
+                source, hop_size=hop_size, samplerate=samplerate, channels=channels
+            )
 
-            results.append((nframes, pitchdetect(block)[0], confidence))
+        samplerate = source.samplerate
+        blocks = npanalysis.source_blocks(source)
 
-            nframes += read
-            if read < source.hop_size:
-                break
+    pitchdetect = aubio.pitch(
+        method=method,
+        buf_size=buf_size,
+        hop_size=hop_size,
+        samplerate=samplerate,
+    )
+    pitchdetect.set_tolerance(tolerance)
+    pitchdetect.set_silence(silence)
+    pitchdetect.set_unit(unit)
+
+    results = []
+    nframes = 0
+
+    for block, read in blocks:
+        confidence = pitchdetect.get_confidence()
+
+        results.append((nframes, pitchdetect(block)[0], confidence))
+
+        nframes += read
 
     return results
 
 
-def estimate_root_note(fn, start=0, end=None):
+def estimate_root_note(fn, start=0, end=None, samplerate=0):
     """Estimate root MIDI note of given sample using harmonic mean of detected pitches.
 
-    Detectd pitches of zero and outliers of detected pitches are removed using interquartile range.
+    Detected pitches of zero and outliers of detected pitches are removed using interquartile range.
+
+    `fn` may also be an array of samples with the given `samplerate` (see `detect_pitch`).
 
     """
-    data = detect_pitch(fn, unit="midi")
+    data = detect_pitch(fn, unit="midi", samplerate=samplerate)
     if start or end:
         if end is None:
             end = len(data)
         data = data[start:end]
 
     return statistics.harmonic_mean(
-        remove_outliers([i[1] for i in data if i[0] != 0.0])
+        remove_outliers([i[1] for i in data if i[1] != 0.0])
     )
 
 
@@ -1,19 +1,59 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+"""Print root note, sample loops and cue points stored in WAV files."""
 
+import argparse
 import os
 import sys
 import wavfile
 
 
-for path in sys.argv[1:]:
-    print("File:", os.path.basename(path))
-    try:
-        wav = wavfile.WavFile(path)
-    except wavfile.Error as exc:
-        print("Could not parse WAV file '{}': {}".format(path, exc), file=sys.stderr)
-    else:
-        if wav.smpl:
-            print("Root note: {}".format(wav.smpl.midi_unity_note))
-            for loop in wav.smpl.loops:
-                print("Loop #{cue_point_id} - start: {start:10d} end: {end:10d}".format(**loop))
+def format_loops(wav):
+    lines = []
+
+    if wav.has_chunk('smpl'):
+        lines.append("Root note: {}\n".format(wav.smpl.midi_unity_note))
+        lines.extend("Loop #{0.cue_point_id} - start: {0.start:10d} end: {0.end:10d}\n"
+                     .format(loop) for loop in wav.loops)
+
+    return lines
+
+
+def format_cue_points(wav):
+    labels = wav.cue_labels
+    lines = []
+
+    for cue in wav.cue_points:
+        label = labels.get(cue.id)
+        lines.append("Cue #{0.id} - position: {0.sample_offset:10d}{1}\n".format(
+                     cue, " " + label if label else ""))
+
+    return lines
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument('-c', '--cue-points', action='store_true',
+                    help="Also print cue points (markers) with their labels")
+    ap.add_argument('wavfiles', nargs='+', metavar='WAVFILE', help="WAV input file(s)")
+    args = ap.parse_args(args)
+
+    for path in args.wavfiles:
+        try:
+            wav = wavfile.WavFile(path)
+        except (OSError, wavfile.Error) as exc:
+            print("Could not parse WAV file '{}': {}".format(path, exc), file=sys.stderr)
+            continue
+
+        with wav:
+            lines = ["File: {}\n".format(os.path.basename(path))]
+            lines.extend(format_loops(wav))
+
+            if args.cue_points:
+                lines.extend(format_cue_points(wav))
+
+        sys.stdout.write("".join(lines))
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
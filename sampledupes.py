@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Find duplicate WAV samples by their audio data.
+
+Only the payload of the 'data' chunk and the audio format (format tag,
+channels, sample rate and bit depth) of each file are hashed, so files which
+only differ in their metadata chunks, e.g. loops or INFO tags, or in their
+names are found as duplicates. The data chunk is hashed through a memory map,
+or in blocks if it can't be mapped, and files are hashed in parallel.
+
+Hashes are stored in a cache file (default: '.sampledupes.json' in the scanned
+directory), keyed by path, size and modification time, so unchanged files are
+not read again on subsequent runs.
+
+With '-r/--rewrite', 'sample=' references to duplicates in the given SFZ files
+are changed to point to the canonical file of each group of duplicates (the
+first in sort order of the shortest paths).
+
+"""
+
+__all__ = [
+    'HashCache',
+    'find_duplicates',
+    'fingerprint',
+    'rewrite_sfz',
+]
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+from collections import defaultdict
+from os.path import abspath, dirname, join, normpath, relpath
+
+import perfstats
+import wavfile
+
+
+log = logging.getLogger(__name__)
+
+CACHE_NAME = '.sampledupes.json'
+CACHE_VERSION = 1
+
+
+def fingerprint(path):
+    """Return hex digest of audio format and 'data' chunk payload of WAV file."""
+    with wavfile.WavFile(str(path)) as wav:
+        fmt = wav.fmt
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(('%i:%i:%i:%i;' % (fmt.format_tag, fmt.channels, fmt.samples_per_sec,
+                                         fmt.bits_per_sample or 0)).encode())
+
+        try:
+            data = wav.mmap_data()
+        except (OSError, ValueError, AttributeError):
+            # not a regular file
+            data = None
+
+        if data is not None:
+            digest.update(data)
+            perfstats.count('dupes.bytes_hashed', len(data))
+            data.release()
+        else:
+            for block in wav.iter_blocks():
+                digest.update(block)
+                perfstats.count('dupes.bytes_hashed', len(block))
+
+    return digest.hexdigest()
+
+
+class HashCache(object):
+    """Persistent cache of file hashes keyed by absolute path, size and mtime."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        # number of cached hashes used, counted by the caller
+        self.hits = 0
+
+        if path:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as exc:
+            log.warning("Could not read hash cache '%s': %s", self.path, exc)
+            return
+
+        if data.get('version') == CACHE_VERSION:
+            self.entries = data.get('files', {})
+
+    def save(self):
+        if not self.path:
+            return
+
+        tmp_path = self.path + '.tmp'
+
+        with open(tmp_path, 'w', encoding='utf-8') as fp:
+            json.dump({'version': CACHE_VERSION, 'files': self.entries}, fp,
+                      separators=(',', ':'))
+
+        os.replace(tmp_path, self.path)
+
+    def get(self, path, stat):
+        """Return cached hash of file or None, if unknown or the file changed."""
+        entry = self.entries.get(path)
+
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+
+        return None
+
+    def set(self, path, stat, digest):
+        self.entries[path] = [stat.st_size, stat.st_mtime_ns, digest]
+
+
+def find_duplicates(paths, cache=None, jobs=1):
+    """Return list of duplicate groups (sorted lists of paths) of WAV files.
+
+    The first path of each group is the canonical file: the one with the
+    shortest path, then the first in sort order. Files which can't be read
+    are skipped with a warning.
+
+    """
+    from metascan import iter_bounded
+
+    cache = cache or HashCache()
+
+    def hash_file(path):
+        path = abspath(path)
+
+        try:
+            stat = os.stat(path)
+            digest = cache.get(path, stat)
+            cached = digest is not None
+
+            if not cached:
+                with perfstats.timer('dupes.hash'):
+                    digest = fingerprint(path)
+        except (OSError, wavfile.Error) as exc:
+            log.warning("Could not read '%s': %s", path, exc)
+            return path, None, None, False
+
+        return path, stat, digest, cached
+
+    by_digest = defaultdict(list)
+    seen = set()
+
+    for path, stat, digest, cached in iter_bounded(hash_file, paths, jobs):
+        if digest is None:
+            continue
+
+        # cache is only updated in this thread
+        cache.hits += cached
+        cache.set(path, stat, digest)
+        perfstats.count('dupes.files')
+
+        if path not in seen:
+            seen.add(path)
+            by_digest[digest].append(path)
+
+    groups = [sorted(group, key=lambda p: (len(p), p))
+              for group in by_digest.values() if len(group) > 1]
+    groups.sort()
+    return groups
+
+
+def rewrite_sfz(sfz_path, replacements, backup=True):
+    """Point 'sample=' references in SFZ file to canonical duplicates.
+
+    'replacements' maps absolute paths of duplicates to the absolute path of
+    their canonical file. Returns the number of references changed. The
+    original file is kept with the suffix '.bak', if 'backup' is true.
+
+    """
+    from sfzparser import SFZParser
+
+    parser = SFZParser(sfz_path)
+    basedir = dirname(abspath(sfz_path))
+    # raw opcode value -> new value
+    new_values = {}
+
+    for region in parser.regions:
+        sample = region.get('sample')
+
+        if not sample or sample in new_values:
+            continue
+
+        prefix = region.control.get('default_path', '')
+        sample_dir = normpath(join(basedir, prefix.replace('\\', '/')))
+        path = normpath(join(sample_dir, sample.replace('\\', '/')))
+        canonical = replacements.get(path)
+
+        if canonical:
+            new_values[sample] = relpath(canonical, sample_dir).replace(os.sep, '/')
+
+    if not new_values:
+        return 0
+
+    with open(sfz_path, encoding=parser.encoding or 'utf-8-sig') as fp:
+        text = fp.read()
+
+    rx = re.compile(r'(\bsample=)(%s)(?=\s|$)' % '|'.join(
+        re.escape(value) for value in sorted(new_values, key=len, reverse=True)))
+    text, count = rx.subn(lambda m: m.group(1) + new_values[m.group(2)], text)
+
+    if count:
+        if backup:
+            os.replace(sfz_path, sfz_path + '.bak')
+
+        with open(sfz_path, 'w', encoding='utf-8') as fp:
+            fp.write(text)
+
+    return count
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    perfstats.add_arguments(ap)
+    ap.add_argument('-c', '--cache', metavar='FILE',
+                    help="Hash cache file (default: '%s' in SAMPLEDIR)" % CACHE_NAME)
+    ap.add_argument('-C', '--no-cache', action='store_true', help="Don't use a hash cache")
+    ap.add_argument('-j', '--jobs', type=int, metavar='NUM', default=4,
+                    help="Number of files to hash in parallel (default: %(default)i)")
+    ap.add_argument('-r', '--rewrite', metavar='SFZFILE', action='append', default=[],
+                    help="Point sample references in SFZFILE to canonical duplicates "
+                         "(may be given more than once)")
+    ap.add_argument('-v', '--verbose', action='store_true', help="Be verbose")
+    ap.add_argument('sampledir', help="Directory to search for WAV files")
+    args = ap.parse_args(args)
+
+    logging.basicConfig(format='%(levelname)s - %(message)s',
+                        level=logging.DEBUG if args.verbose else logging.INFO)
+
+    from makesfz import find_files
+
+    cache = HashCache(None if args.no_cache else
+                      args.cache or join(args.sampledir, CACHE_NAME))
+
+    with perfstats.session(args.stats, args.profile):
+        paths = (str(path) for path in find_files(args.sampledir, {'.wav'}, args.jobs))
+        groups = find_duplicates(paths, cache, args.jobs)
+        cache.save()
+        log.debug("%i hashes taken from cache.", cache.hits)
+
+        for group in groups:
+            print(group[0])
+
+            for path in group[1:]:
+                print("    %s" % path)
+
+        if args.rewrite:
+            replacements = {path: group[0] for group in groups for path in group[1:]}
+
+            for sfz_path in args.rewrite:
+                count = rewrite_sfz(sfz_path, replacements)
+                log.info("%s: %i sample references changed.", sfz_path, count)
+
+    wasted = sum(os.path.getsize(path) for group in groups for path in group[1:])
+    log.info("%i groups of duplicates, %.1f MB in duplicate files.", len(groups),
+             wasted / 1e6)
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compiled binary representation of SFZ instruments.
+
+A compiled instrument is a fully resolved, flat list of regions: header
+inheritance is applied, note names are converted to MIDI note numbers and the
+'default_path' of the '<control>' header is prepended to sample paths.
+
+File layout (all integers little-endian, sections aligned to 8 bytes)::
+
+    header      magic 'SFZB', format version, section counts and offsets
+    strings     'num_strings + 1' uint32 offsets into the UTF-8 string data,
+                followed by the string data
+    regions     'num_regions' fixed-width records of dtype REGION_DTYPE
+    extras      'num_extras' (region, opcode, value) uint32 records for
+                opcodes without a column in REGION_DTYPE, or with values
+                which can't be stored in their column, sorted by region
+
+Strings (sample paths, opcode names and text values) are stored only once in
+the string table. Unset fields in region records hold the NO_STRING, NO_INT or
+NaN sentinel values.
+
+Loading a compiled file with `load()` maps it into memory and creates NumPy
+array views of the sections without copying or parsing, so load time is
+independent of the instrument size. `CompiledInstrument.write_sfz()` converts
+it back to SFZ text.
+
+"""
+
+__all__ = [
+    'CompiledInstrument',
+    'Error',
+    'FORMAT_VERSION',
+    'REGION_DTYPE',
+    'compile_sections',
+    'compile_sfz',
+    'load',
+    'resolve_regions',
+]
+
+import logging
+import math
+import mmap
+import struct
+
+import numpy as np
+
+from sfzparser import KEY_OPCODES, Instrument, SFZParser, sfz_note_to_midi_key
+
+
+# module globals
+log = logging.getLogger(__name__)
+
+MAGIC = b'SFZB'
+FORMAT_VERSION = 1
+
+STRING_FIELDS = ('sample', 'trigger', 'loop_mode')
+INT_FIELDS = ('lokey', 'hikey', 'pitch_keycenter', 'lovel', 'hivel', 'lochan', 'hichan',
+              'seq_length', 'seq_position', 'transpose', 'tune', 'group', 'off_by')
+LONG_FIELDS = ('offset', 'end', 'loop_start', 'loop_end')
+FLOAT_FIELDS = ('volume', 'pan', 'amp_veltrack', 'ampeg_attack', 'ampeg_hold',
+                'ampeg_decay', 'ampeg_sustain', 'ampeg_release')
+NOTE_FIELDS = frozenset(KEY_OPCODES)
+
+NO_STRING = 0xFFFFFFFF
+NO_INT = -2 ** 31
+NO_LONG = -2 ** 63
+
+# 8-byte fields first, so all fields are naturally aligned
+REGION_DTYPE = np.dtype(
+    [(name, '<i8') for name in LONG_FIELDS] +
+    [(name, '<f8') for name in FLOAT_FIELDS] +
+    [(name, '<i4') for name in INT_FIELDS] +
+    [(name, '<u4') for name in STRING_FIELDS])
+EXTRA_DTYPE = np.dtype([('region', '<u4'), ('opcode', '<u4'), ('value', '<u4')])
+
+# magic, version, reserved, num_strings, num_regions, num_extras, region record
+# size, offsets of string index, string data, regions and extras
+_HEADER = struct.Struct('<4sHHIIIIQQQQ')
+
+# exceptions
+class Error(Exception):
+    """General error."""
+    pass
+
+
+# utility functions
+def _pad(size):
+    return -size % 8
+
+
+def resolve_regions(sections):
+    """Yield dict of effective opcodes for each region in parsed SFZ sections.
+
+    'sections' is a list of (header, opcodes) tuples as produced by
+    `SFZParser`. Opcodes of enclosing '<global>', '<master>' and '<group>'
+    headers are merged into each region, 'key' is expanded to 'lokey', 'hikey'
+    and 'pitch_keycenter' and a 'default_path' set in '<control>' is
+    prepended to the 'sample' opcode. Other headers, e.g. '<curve>' or
+    '<effect>', and comments are ignored.
+
+    """
+    for region in Instrument(sections).regions:
+        yield region.flatten()
+
+
+def _to_int(name, value):
+    """Convert value for an integer column, raise ValueError if it doesn't fit."""
+    try:
+        number = int(value)
+    except ValueError:
+        if name in NOTE_FIELDS:
+            return sfz_note_to_midi_key(value)
+        raise
+
+    # the smallest value of each column type is the 'unset' sentinel
+    if name in LONG_FIELDS:
+        low, high = NO_LONG, 2 ** 63 - 1
+    else:
+        low, high = NO_INT, 2 ** 31 - 1
+
+    if not low < number <= high:
+        raise ValueError("Value out of range for column '%s': %s" % (name, value))
+
+    return number
+
+
+def _to_float(name, value):
+    """Convert value for a float column, raise ValueError if it isn't finite."""
+    number = float(value)
+
+    # NaN is the 'unset' sentinel, keep all non-finite values as text
+    if not math.isfinite(number):
+        raise ValueError("Value not finite for column '%s': %s" % (name, value))
+
+    return number
+
+
+def compile_sections(sections):
+    """Compile parsed SFZ sections into the binary format and return it as bytes."""
+    strings = {}
+    extras = []
+
+    def intern(s):
+        index = strings.get(s)
+
+        if index is None:
+            index = strings[s] = len(strings)
+
+        return index
+
+    records = []
+
+    for region_index, opcodes in enumerate(resolve_regions(sections)):
+        record = {}
+
+        for name, value in opcodes.items():
+            try:
+                if name in STRING_FIELDS:
+                    record[name] = intern(value)
+                elif name in INT_FIELDS or name in LONG_FIELDS:
+                    record[name] = _to_int(name, value)
+                elif name in FLOAT_FIELDS:
+                    record[name] = _to_float(name, value)
+                else:
+                    extras.append((region_index, intern(name), intern(value)))
+            except (ValueError, KeyError, IndexError):
+                # keep values which can't be converted as text
+                extras.append((region_index, intern(name), intern(value)))
+
+        records.append(record)
+
+    regions = np.empty(len(records), dtype=REGION_DTYPE)
+
+    for fields, sentinel in ((STRING_FIELDS, NO_STRING), (INT_FIELDS, NO_INT),
+                             (LONG_FIELDS, NO_LONG), (FLOAT_FIELDS, np.nan)):
+        for name in fields:
+            regions[name] = [record.get(name, sentinel) for record in records]
+
+    encoded = [s.encode('utf-8') for s in strings]
+    string_index = np.zeros(len(encoded) + 1, dtype='<u4')
+    np.cumsum([len(s) for s in encoded], out=string_index[1:])
+    string_data = b''.join(encoded)
+    extras = np.array(extras, dtype=EXTRA_DTYPE)
+
+    chunks = []
+    offset = _HEADER.size + _pad(_HEADER.size)
+    offsets = []
+
+    for data in (string_index.tobytes(), string_data, regions.tobytes(), extras.tobytes()):
+        offsets.append(offset)
+        chunks.append(data + b'\0' * _pad(len(data)))
+        offset += len(chunks[-1])
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(encoded), len(regions), len(extras),
+                          REGION_DTYPE.itemsize, *offsets)
+    return b''.join([header, b'\0' * _pad(len(header))] + chunks)
+
+
+def compile_sfz(sfz_path, output, encoding=None):
+    """Parse SFZ file and write compiled instrument to file path 'output'."""
+    parser = SFZParser(sfz_path, encoding=encoding)
+    data = compile_sections(parser.sections)
+
+    with open(output, 'wb') as fp:
+        fp.write(data)
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return '%d' % value if value.is_integer() else repr(value)
+    return str(value)
+
+
+# API classes
+class CompiledInstrument(object):
+    """Compiled SFZ instrument mapped into memory.
+
+    Attributes: regions (NumPy structured array of REGION_DTYPE records),
+    extras (NumPy structured array of EXTRA_DTYPE records) and version.
+
+    The arrays are views of the mapped file and must not be used after
+    `close()`.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as fp:
+            try:
+                self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file
+                raise Error("%s: not a compiled SFZ instrument" % path)
+
+        try:
+            self._map_sections()
+        except Exception:
+            self.close()
+            raise
+
+        self._strings = None
+
+    def _map_sections(self):
+        buf = self._mmap
+
+        try:
+            (magic, self.version, _, num_strings, num_regions, num_extras, record_size,
+             index_offset, data_offset, regions_offset,
+             extras_offset) = _HEADER.unpack_from(buf)
+        except struct.error:
+            raise Error("%s: Truncated header." % self.path)
+
+        if magic != MAGIC:
+            raise Error("%s: not a compiled SFZ instrument" % self.path)
+
+        if self.version != FORMAT_VERSION or record_size != REGION_DTYPE.itemsize:
+            raise Error("%s: Unsupported format version %i." % (self.path, self.version))
+
+        try:
+            self._string_index = np.frombuffer(buf, dtype='<u4', count=num_strings + 1,
+                                               offset=index_offset)
+            self._string_data_offset = data_offset
+            self.regions = np.frombuffer(buf, dtype=REGION_DTYPE, count=num_regions,
+                                         offset=regions_offset)
+            self.extras = np.frombuffer(buf, dtype=EXTRA_DTYPE, count=num_extras,
+                                        offset=extras_offset)
+        except ValueError:
+            raise Error("%s: Truncated file." % self.path)
+
+    def close(self):
+        self._string_index = self.regions = self.extras = None
+
+        try:
+            self._mmap.close()
+        except BufferError:
+            # arrays are still referenced elsewhere, unmapped on garbage collection
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.regions)
+
+    def string(self, index):
+        """Return string with given index from the string table."""
+        start, end = self._string_index[index:index + 2].tolist()
+        offset = self._string_data_offset
+        return self._mmap[offset + start:offset + end].decode('utf-8')
+
+    @property
+    def strings(self):
+        """List of all strings in the string table (decoded on first access)."""
+        if self._strings is None:
+            offsets = self._string_index.tolist()
+            start = self._string_data_offset
+            data = self._mmap[start:start + offsets[-1]]
+            self._strings = [data[a:b].decode('utf-8') for a, b in zip(offsets, offsets[1:])]
+        return self._strings
+
+    def iter_regions(self):
+        """Yield list of (opcode, value) tuples for each region."""
+        strings = self.strings
+        columns = []
+
+        for fields, sentinel in ((STRING_FIELDS, NO_STRING), (INT_FIELDS, NO_INT),
+                                 (LONG_FIELDS, NO_LONG)):
+            for name in fields:
+                columns.append((name, sentinel, self.regions[name].tolist()))
+
+        float_columns = [(name, self.regions[name].tolist()) for name in FLOAT_FIELDS]
+        extra_regions = self.extras['region'].tolist()
+        extra_opcodes = self.extras['opcode'].tolist()
+        extra_values = self.extras['value'].tolist()
+        pos = 0
+
+        for i in range(len(self.regions)):
+            opcodes = []
+
+            for name, sentinel, values in columns:
+                value = values[i]
+
+                if value != sentinel:
+                    opcodes.append((name, strings[value] if name in STRING_FIELDS
+                                    else str(value)))
+
+            for name, values in float_columns:
+                value = values[i]
+
+                if value == value:
+                    opcodes.append((name, _format_value(value)))
+
+            while pos < len(extra_regions) and extra_regions[pos] == i:
+                opcodes.append((strings[extra_opcodes[pos]], strings[extra_values[pos]]))
+                pos += 1
+
+            yield opcodes
+
+    def write_sfz(self, fp):
+        """Write instrument as SFZ text with one '<region>' per region to file object."""
+        for opcodes in self.iter_regions():
+            fp.write('<region>\n')
+            fp.writelines('%s=%s\n' % opcode for opcode in opcodes)
+            fp.write('\n')
+
+
+def load(path):
+    """Map compiled instrument file into memory and return CompiledInstrument."""
+    return CompiledInstrument(path)
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-d', '--decompile', action='store_true',
+                    help="Convert compiled instrument back to SFZ text")
+    ap.add_argument('input', help="SFZ input file (compiled instrument with -d)")
+    ap.add_argument('output', nargs='?',
+                    help="Output file (default: input with suffix '.sfzb', or standard "
+                         "output with -d)")
+    args = ap.parse_args()
+
+    try:
+        if args.decompile:
+            with load(args.input) as instrument:
+                if args.output:
+                    with open(args.output, 'w', encoding='utf-8') as fp:
+                        instrument.write_sfz(fp)
+                else:
+                    instrument.write_sfz(sys.stdout)
+        else:
+            compile_sfz(args.input, args.output or args.input.rsplit('.', 1)[0] + '.sfzb')
+    except (OSError, Error) as exc:
+        sys.exit(str(exc))
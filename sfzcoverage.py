@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Find overlapping regions and gaps in the key/velocity map of an instrument.
+
+Each region is reduced to a Zone: a key range, a velocity range and a
+round-robin sequence position and length. Two zones overlap if both ranges
+intersect and there is a round-robin step at which both sound, e.g. a zone
+with 'seq_length=1' overlaps every position of a round-robin group on the
+same keys and velocities.
+
+`analyse()` finds overlaps with a sweep over the key axis, keeping the zones
+whose key range contains the current key in a heap ordered by 'hikey', so
+each zone is only compared with the zones whose key range contains its
+'lokey'. This takes O(n log n) for sorting plus O(n * a), where a is the
+number of zones active at a key, e.g. the number of velocity layers and
+round-robin positions. Gaps are found with a second sweep, which keeps
+per-velocity coverage counts, in O(n log n) plus the number of reported gaps.
+
+Zones can be created from the regions of a parsed SFZ file with
+`zones_from_sfz()` or from the grouped samples of makesfz with
+`zones_from_sample_regions()`.
+
+"""
+
+__all__ = [
+    'Coverage',
+    'Gap',
+    'Overlap',
+    'Zone',
+    'analyse',
+    'find_gaps',
+    'find_overlaps',
+    'format_report',
+    'zones_from_sample_regions',
+    'zones_from_sfz',
+]
+
+import heapq
+import logging
+from collections import namedtuple
+from math import gcd
+
+import numpy as np
+
+from sfzparser import sfz_note_to_midi_key
+
+
+log = logging.getLogger(__name__)
+
+Zone = namedtuple('Zone', ['lokey', 'hikey', 'lovel', 'hivel', 'seq_position',
+                           'seq_length', 'ref'])
+# 'seq_position' is the first round-robin step (from 1) at which both sound
+Overlap = namedtuple('Overlap', ['first', 'second', 'lokey', 'hikey', 'lovel', 'hivel',
+                                 'seq_position'])
+Gap = namedtuple('Gap', ['lokey', 'hikey', 'lovel', 'hivel'])
+Coverage = namedtuple('Coverage', ['overlaps', 'gaps', 'unreachable'])
+
+
+def _note(value):
+    try:
+        return int(value)
+    except ValueError:
+        return sfz_note_to_midi_key(value)
+
+
+def _opcode(maps, name, default, alias=None):
+    # innermost header first; 'key' counts as lokey/hikey on the same header
+    for opcodes in maps:
+        if name in opcodes:
+            return opcodes[name]
+        if alias and alias in opcodes:
+            return opcodes[alias]
+    return default
+
+
+def zones_from_sfz(regions):
+    """Return list of Zone tuples for the regions of a parsed SFZ file.
+
+    'regions' is a list of `sfzparser.Region` views or plain opcode dicts,
+    e.g. `SFZParser(path).regions`. The 'ref' field of each zone is the index
+    of the region. Regions with invalid key or velocity values are skipped
+    with a warning.
+
+    """
+    zones = []
+
+    for index, region in enumerate(regions):
+        maps = getattr(region, 'maps', (region,))
+
+        try:
+            zones.append(Zone(
+                _note(_opcode(maps, 'lokey', 0, 'key')),
+                _note(_opcode(maps, 'hikey', 127, 'key')),
+                int(_opcode(maps, 'lovel', 0)),
+                int(_opcode(maps, 'hivel', 127)),
+                int(_opcode(maps, 'seq_position', 1)),
+                int(_opcode(maps, 'seq_length', 1)),
+                index))
+        except (ValueError, KeyError, IndexError) as exc:
+            log.warning("Region %i: invalid key or velocity opcode: %s", index + 1, exc)
+
+    return zones
+
+
+def zones_from_sample_regions(regions):
+    """Return list of Zone tuples for makesfz SampleRegion instances.
+
+    'regions' is an iterable of `makesfz.SampleRegion`, e.g. the values of
+    the dict returned by `makesfz.group_samples()`. The 'ref' field of each
+    zone is the `makesfz.Sample`.
+
+    """
+    zones = []
+
+    for region in regions:
+        for layer in region.layers.values():
+            # numbered as written by makesfz.write_sfz
+            for seq_position, sample in enumerate(layer.samples.values(), 1):
+                zones.append(Zone(region.lokey, region.hikey, layer.lovel, layer.hivel,
+                                  seq_position, len(layer.samples), sample))
+
+    return zones
+
+
+def _is_reachable(zone):
+    return (0 <= zone.lokey <= zone.hikey <= 127 and 0 <= zone.lovel <= zone.hivel <= 127
+            and 1 <= zone.seq_position <= max(1, zone.seq_length))
+
+
+def _common_step(first, second):
+    """Return first round-robin step (from 1) at which both zones sound or None.
+
+    A zone sounds at steps t with t = seq_position (mod seq_length).
+
+    """
+    length1, length2 = max(1, first.seq_length), max(1, second.seq_length)
+    pos1, pos2 = first.seq_position - 1, second.seq_position - 1
+
+    if (pos1 - pos2) % gcd(length1, length2):
+        return None
+
+    step = pos1
+
+    while step % length2 != pos2 % length2:
+        step += length1
+
+    return step + 1
+
+
+def find_overlaps(zones):
+    """Return list of Overlap tuples for all pairs of overlapping zones."""
+    zones = sorted(zones, key=lambda z: z.lokey)
+    overlaps = []
+    # heap of (hikey, index) of active zones, removed lazily
+    ending = []
+    active = {}
+
+    for index, zone in enumerate(zones):
+        while ending and ending[0][0] < zone.lokey:
+            del active[heapq.heappop(ending)[1]]
+
+        for other in active.values():
+            if other.lovel <= zone.hivel and zone.lovel <= other.hivel:
+                step = _common_step(other, zone)
+
+                if step is not None:
+                    overlaps.append(Overlap(
+                        other.ref, zone.ref, zone.lokey, min(zone.hikey, other.hikey),
+                        max(zone.lovel, other.lovel), min(zone.hivel, other.hivel),
+                        step))
+
+        active[index] = zone
+        heapq.heappush(ending, (zone.hikey, index))
+
+    return overlaps
+
+
+def find_gaps(zones, key_range=None):
+    """Return list of Gap tuples for uncovered areas of the key/velocity map.
+
+    Keys within 'key_range' (default: lowest to highest key of all zones)
+    not covered by any zone are reported as gaps over the full velocity
+    range. For keys covered by some zones, velocity ranges not covered by any
+    of them are reported. Adjacent keys with the same gaps are merged.
+
+    """
+    if not zones:
+        return [Gap(key_range[0], key_range[1], 0, 127)] if key_range else []
+
+    if key_range is None:
+        key_range = (min(z.lokey for z in zones), max(z.hikey for z in zones))
+
+    # (key, +1/-1, zone) events; a zone ends at hikey + 1
+    events = sorted([(z.lokey, 1, z) for z in zones] +
+                    [(z.hikey + 1, -1, z) for z in zones], key=lambda e: e[0])
+    coverage = np.zeros(128, dtype=np.int32)
+    gaps = []
+    pos = 0
+    key = key_range[0]
+    end = key_range[1] + 1
+
+    # velocity runs of the previous key segment and indexes of their gaps
+    previous = [[], []]
+
+    def add_segment(lokey, hikey):
+        # runs of velocities with zero coverage
+        edges = np.diff(np.concatenate(([0], coverage == 0, [0])).astype(np.int8))
+        runs = list(zip(np.flatnonzero(edges == 1).tolist(),
+                        (np.flatnonzero(edges == -1) - 1).tolist()))
+        prev_runs, prev_indexes = previous
+
+        if runs and runs == prev_runs and gaps[prev_indexes[0]].hikey == lokey - 1:
+            for i in prev_indexes:
+                gaps[i] = gaps[i]._replace(hikey=hikey)
+        else:
+            indexes = list(range(len(gaps), len(gaps) + len(runs)))
+            gaps.extend(Gap(lokey, hikey, lovel, hivel) for lovel, hivel in runs)
+            previous[:] = (runs, indexes)
+
+    while key < end:
+        while pos < len(events) and events[pos][0] <= key:
+            _, delta, zone = events[pos]
+            coverage[zone.lovel:zone.hivel + 1] += delta
+            pos += 1
+
+        next_key = min(events[pos][0], end) if pos < len(events) else end
+        add_segment(key, next_key - 1)
+        key = next_key
+
+    return gaps
+
+
+def analyse(zones, key_range=None):
+    """Return Coverage tuple with overlaps, gaps and unreachable zones.
+
+    Unreachable zones have empty or out-of-range key or velocity ranges or a
+    sequence position after the sequence length. They are excluded from the
+    overlap and gap analysis.
+
+    """
+    reachable = []
+    unreachable = []
+
+    for zone in zones:
+        (reachable if _is_reachable(zone) else unreachable).append(zone)
+
+    return Coverage(find_overlaps(reachable), find_gaps(reachable, key_range),
+                    unreachable)
+
+
+def format_report(coverage, fp):
+    """Write human-readable report of Coverage tuple to file object."""
+    for overlap in coverage.overlaps:
+        fp.write("Overlap: regions %s and %s, keys %i-%i, velocity %i-%i, round-robin step %i\n"
+                 % overlap)
+
+    for gap in coverage.gaps:
+        fp.write("Gap: keys %i-%i, velocity %i-%i\n" % gap)
+
+    for zone in coverage.unreachable:
+        fp.write("Unreachable: region %s (keys %i-%i, velocity %i-%i, seq_position %i/%i)\n"
+                 % ((zone.ref,) + zone[:6]))
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    from sfzparser import SFZParser
+
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-k', '--key-range', metavar='LO-HI',
+                    help="Report gaps in this key range (default: used key range)")
+    ap.add_argument('sfzfile', help="SFZ input file")
+    args = ap.parse_args()
+
+    key_range = tuple(map(int, args.key_range.split('-'))) if args.key_range else None
+    zones = zones_from_sfz(SFZParser(args.sfzfile).regions)
+    # report 1-based region numbers
+    zones = [zone._replace(ref=zone.ref + 1) for zone in zones]
+    coverage = analyse(zones, key_range)
+    format_report(coverage, sys.stdout)
+    sys.exit(1 if coverage.overlaps or coverage.unreachable else 0)
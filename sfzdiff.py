@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Structural diff of the regions of two SFZ files.
+
+Regions are compared by their effective opcodes, i.e. with header
+inheritance, 'key' and 'default_path' applied (see `sfzparser.Region.flatten`).
+The order of regions, headers and opcodes and any whitespace or comments are
+ignored.
+
+Each region is hashed by its set of (opcode, value) pairs. Regions with equal
+sets in both files are matched first by hash look-up. Remaining regions are
+paired up by sample and key/velocity range, then by sample alone, and
+reported as changed with a list of opcode differences. All others are
+reported as added or removed. All steps are dict look-ups, so the diff runs in
+time linear in the number of regions.
+
+"""
+
+__all__ = [
+    'ADDED',
+    'CHANGED',
+    'REMOVED',
+    'RegionDiff',
+    'diff_files',
+    'diff_regions',
+    'format_diff',
+]
+
+import sys
+from collections import defaultdict, namedtuple
+
+from sfzparser import KEY_OPCODES, SFZParser, sfz_note_to_midi_key
+
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+# 'old' and 'new' are region indexes (None for added or removed regions),
+# 'changes' is a list of (opcode, old value, new value) tuples with None for
+# missing opcodes
+RegionDiff = namedtuple('RegionDiff', ['kind', 'old', 'new', 'sample', 'changes'])
+
+# keys for pairing up changed regions, tried in this order
+_PAIRING_KEYS = (
+    ('sample', 'lokey', 'hikey', 'lovel', 'hivel', 'seq_position'),
+    ('sample',),
+)
+
+
+def _opcode_changes(old, new):
+    changes = []
+
+    for name in sorted(old.keys() | new.keys()):
+        old_value = old.get(name)
+        new_value = new.get(name)
+
+        if old_value != new_value:
+            changes.append((name, old_value, new_value))
+
+    return changes
+
+
+def diff_regions(old_regions, new_regions):
+    """Return list of RegionDiff tuples for two lists of effective opcode dicts."""
+    # region hash -> indexes of unmatched old regions with these opcodes
+    unmatched_old = defaultdict(list)
+    old_keys = [frozenset(opcodes.items()) for opcodes in old_regions]
+
+    for index, key in enumerate(old_keys):
+        unmatched_old[key].append(index)
+
+    unmatched_new = []
+
+    for index, opcodes in enumerate(new_regions):
+        candidates = unmatched_old.get(frozenset(opcodes.items()))
+
+        if candidates:
+            candidates.pop()
+        else:
+            unmatched_new.append(index)
+
+    remaining_old = sorted(i for indexes in unmatched_old.values() for i in indexes)
+    diffs = []
+
+    for names in _PAIRING_KEYS:
+        by_key = defaultdict(list)
+
+        for index in reversed(remaining_old):
+            opcodes = old_regions[index]
+
+            if 'sample' in opcodes:
+                by_key[tuple(opcodes.get(name) for name in names)].append(index)
+
+        paired = set()
+        still_new = []
+
+        for index in unmatched_new:
+            opcodes = new_regions[index]
+            candidates = by_key.get(tuple(opcodes.get(name) for name in names))
+
+            if 'sample' in opcodes and candidates:
+                old_index = candidates.pop()
+                paired.add(old_index)
+                diffs.append(RegionDiff(CHANGED, old_index, index, opcodes['sample'],
+                                        _opcode_changes(old_regions[old_index], opcodes)))
+            else:
+                still_new.append(index)
+
+        remaining_old = [index for index in remaining_old if index not in paired]
+        unmatched_new = still_new
+
+    diffs.extend(RegionDiff(REMOVED, index, None, old_regions[index].get('sample'), [])
+                 for index in remaining_old)
+    diffs.extend(RegionDiff(ADDED, None, index, new_regions[index].get('sample'), [])
+                 for index in unmatched_new)
+    diffs.sort(key=lambda d: (d.old if d.old is not None else d.new,
+                              d.new if d.new is not None else -1))
+    return diffs
+
+
+def _normalize_notes(opcodes):
+    # note names and MIDI note numbers for the same key compare equal
+    for name in KEY_OPCODES:
+        value = opcodes.get(name)
+
+        if value is not None and not value.isdigit():
+            try:
+                opcodes[name] = str(sfz_note_to_midi_key(value))
+            except (ValueError, KeyError, IndexError):
+                pass
+
+    return opcodes
+
+
+def diff_files(old_path, new_path, encoding=None):
+    """Return list of RegionDiff tuples for the regions of two SFZ files.
+
+    Note names in key opcodes are converted to MIDI note numbers first.
+
+    """
+    old = [_normalize_notes(region.flatten())
+           for region in SFZParser(old_path, encoding).regions]
+    new = [_normalize_notes(region.flatten())
+           for region in SFZParser(new_path, encoding).regions]
+    return diff_regions(old, new)
+
+
+def format_diff(diff):
+    """Return diff as a line of text with 1-based region numbers."""
+    if diff.kind == ADDED:
+        return "+ region %i (sample=%s)" % (diff.new + 1, diff.sample)
+    elif diff.kind == REMOVED:
+        return "- region %i (sample=%s)" % (diff.old + 1, diff.sample)
+
+    changes = []
+
+    for name, old_value, new_value in diff.changes:
+        if old_value is None:
+            changes.append("+%s=%s" % (name, new_value))
+        elif new_value is None:
+            changes.append("-%s=%s" % (name, old_value))
+        else:
+            changes.append("%s: %s -> %s" % (name, old_value, new_value))
+
+    return "~ region %i -> %i (sample=%s): %s" % (diff.old + 1, diff.new + 1, diff.sample,
+                                                  "; ".join(changes))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('old', help="Original SFZ file")
+    ap.add_argument('new', help="Changed SFZ file")
+    args = ap.parse_args()
+
+    diffs = diff_files(args.old, args.new)
+
+    for diff in diffs:
+        print(format_diff(diff))
+
+    sys.exit(1 if diffs else 0)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Check that the samples referenced by SFZ files exist.
+
+Sample paths are resolved relative to the SFZ file and the 'default_path' of
+its '<control>' header. Instead of one existence check per region, all
+referenced paths of all given SFZ files are collected first and every
+directory they are in is listed only once. Paths which only match a directory
+entry when ignoring case are reported as case mismatches, since they break on
+case-sensitive file systems. Optionally, the headers of all found sample files
+are read and validated.
+
+SFZ files are parsed in parallel worker processes, directory listings and
+sample headers are read by a thread pool.
+
+"""
+
+__all__ = [
+    'DirectoryCache',
+    'Problem',
+    'collect_samples',
+    'lint',
+]
+
+import argparse
+import logging
+import os
+import sys
+from collections import defaultdict, namedtuple
+from os.path import dirname, join, normpath
+
+import perfstats
+
+
+log = logging.getLogger(__name__)
+
+MISSING = 'missing'
+CASE_MISMATCH = 'case-mismatch'
+INVALID = 'invalid'
+PARSE_ERROR = 'parse-error'
+
+Problem = namedtuple('Problem', ['sfz_path', 'region', 'sample', 'kind', 'message'])
+
+
+class DirectoryCache(object):
+    """Cache of directory listings for case-sensitive path look-ups.
+
+    Each directory is listed at most once. Concurrent calls from several
+    threads are safe, but may occasionally list a directory twice.
+
+    """
+
+    def __init__(self):
+        # dir path -> (set of names, dict of lower-case name -> name) or None
+        self._listings = {}
+
+    def listing(self, dirpath):
+        """Return (names, folded) of directory or None, if it can't be listed."""
+        try:
+            return self._listings[dirpath]
+        except KeyError:
+            pass
+
+        try:
+            names = set(os.listdir(dirpath or '.'))
+        except OSError:
+            result = None
+        else:
+            perfstats.count('lint.dirs_listed')
+            result = (names, {name.lower(): name for name in names})
+
+        return self._listings.setdefault(dirpath, result)
+
+    def lookup(self, path):
+        """Look up file path in cached directory listings.
+
+        Returns tuple (status, actual path). 'status' is None if the path
+        exists as given, CASE_MISMATCH if it exists only when ignoring the case
+        of one or more path components (the actual path is returned then), or
+        MISSING.
+
+        """
+        dirpath, name = os.path.split(path)
+        status = None
+        listing = self.listing(dirpath)
+
+        if listing is None and dirpath and dirpath != path:
+            status, dirpath = self.lookup(dirpath)
+
+            if status == MISSING:
+                return MISSING, path
+
+            listing = self.listing(dirpath)
+
+        if listing is None:
+            return MISSING, path
+
+        names, folded = listing
+
+        if name in names:
+            return status, join(dirpath, name)
+
+        actual = folded.get(name.lower())
+
+        if actual is None:
+            return MISSING, path
+
+        return CASE_MISMATCH, join(dirpath, actual)
+
+
+def collect_samples(sfz_path):
+    """Return tuple (sfz_path, list of (region index, sample path) tuples).
+
+    Sample paths are resolved against the directory of the SFZ file and the
+    '<control>' 'default_path'. Regions without 'sample' opcode and built-in
+    samples (starting with '*') are skipped.
+
+    """
+    from sfzparser import SFZParser
+
+    parser = SFZParser(sfz_path)
+    basedir = dirname(sfz_path)
+    samples = []
+
+    for index, region in enumerate(parser.regions):
+        sample = region.get('sample')
+
+        if not sample or sample.startswith('*'):
+            continue
+
+        path = region.control.get('default_path', '') + sample
+        samples.append((index, normpath(join(basedir, path.replace('\\', '/')))))
+
+    return sfz_path, samples
+
+
+def _collect_all(sfz_paths, jobs):
+    if jobs > 1 and len(sfz_paths) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [(path, pool.submit(collect_samples, path)) for path in sfz_paths]
+
+            for path, future in futures:
+                try:
+                    yield future.result()
+                except Exception as exc:
+                    yield path, exc
+    else:
+        for path in sfz_paths:
+            try:
+                yield collect_samples(path)
+            except Exception as exc:
+                yield path, exc
+
+
+def lint(sfz_paths, validate=False, jobs=1):
+    """Check sample references of SFZ files and return list of Problem tuples.
+
+    If 'validate' is true, the headers of all found sample files with a
+    supported file type are read and parse errors are reported. 'jobs' is the
+    number of worker processes for parsing and threads for file system access.
+
+    """
+    from metascan import iter_bounded, scan_metadata
+
+    problems = []
+    # resolved sample path -> list of (sfz path, region index)
+    references = defaultdict(list)
+
+    with perfstats.timer('lint.parse'):
+        for sfz_path, samples in _collect_all(sfz_paths, jobs):
+            if isinstance(samples, Exception):
+                problems.append(Problem(sfz_path, None, None, PARSE_ERROR, str(samples)))
+                continue
+
+            perfstats.count('lint.regions', len(samples))
+
+            for index, path in samples:
+                references[path].append((sfz_path, index))
+
+    cache = DirectoryCache()
+
+    with perfstats.timer('lint.listdirs'):
+        dirs = {dirname(path) for path in references}
+        perfstats.count('lint.samples', len(references))
+        # pre-fill cache in parallel, look-ups below then only hit the cache
+        for _ in iter_bounded(cache.listing, sorted(dirs), jobs):
+            pass
+
+    # actual path on disk -> referenced paths resolving to it
+    found = defaultdict(list)
+
+    with perfstats.timer('lint.lookup'):
+        for path, refs in references.items():
+            status, actual = cache.lookup(path)
+
+            if status == MISSING:
+                message = "Sample file not found: %s" % path
+            elif status == CASE_MISMATCH:
+                message = "Sample path case mismatch: %s (on disk: %s)" % (path, actual)
+            else:
+                message = None
+
+            if message:
+                problems.extend(Problem(sfz_path, index, path, status, message)
+                                for sfz_path, index in refs)
+
+            if status != MISSING:
+                found[actual].append(path)
+
+    if validate:
+        with perfstats.timer('lint.validate'):
+            for metadata in scan_metadata(list(found), jobs):
+                if metadata.error:
+                    message = "Invalid sample file: %s" % metadata.error
+
+                    for path in found[metadata.path]:
+                        problems.extend(Problem(sfz_path, index, path, INVALID, message)
+                                        for sfz_path, index in references[path])
+
+    problems.sort(key=lambda p: (p.sfz_path, -1 if p.region is None else p.region))
+    return problems
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    perfstats.add_arguments(ap)
+    ap.add_argument('-j', '--jobs', type=int, metavar='NUM', default=os.cpu_count() or 1,
+                    help="Number of parallel worker processes and I/O threads "
+                         "(default: %(default)i)")
+    ap.add_argument('-V', '--validate', action='store_true',
+                    help="Read and validate headers of sample files")
+    ap.add_argument('-v', '--verbose', action='store_true', help="Be verbose")
+    ap.add_argument('paths', nargs='+', metavar='PATH',
+                    help="SFZ file or directory to search for SFZ files")
+    args = ap.parse_args(args)
+
+    logging.basicConfig(format='%(levelname)s - %(message)s',
+                        level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    sfz_paths = []
+
+    for path in args.paths:
+        if os.path.isdir(path):
+            from makesfz import find_files
+
+            sfz_paths.extend(str(p) for p in find_files(path, {'.sfz'}, args.jobs))
+        else:
+            sfz_paths.append(path)
+
+    with perfstats.session(args.stats, args.profile):
+        problems = lint(sfz_paths, validate=args.validate, jobs=args.jobs)
+
+    for problem in problems:
+        if problem.region is None:
+            print("%s: %s" % (problem.sfz_path, problem.message))
+        else:
+            print("%s: region %i: %s" % (problem.sfz_path, problem.region + 1,
+                                         problem.message))
+
+    log.info("Checked %i SFZ files, %i problems found.", len(sfz_paths), len(problems))
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,15 +2,26 @@
 # -*- coding: utf-8 -*-
 """A parser for SFZ files."""
 
+import logging
 import math
 import re
+import sys
 
-from collections import OrderedDict
+from collections import ChainMap, OrderedDict
 from io import open
 
+import perfstats
+
+
+log = logging.getLogger(__name__)
 
 SFZ_NOTE_LETTER_OFFSET = {'a': 9, 'b': 11, 'c': 0, 'd': 2, 'e': 4, 'f': 5, 'g': 7}
 
+# Opcode names and values are interned while parsing, so that all regions
+# share one string object per distinct name or value.
+# Values longer than this, e.g. sample paths, are rarely repeated and not interned
+MAX_INTERNED_VALUE_LENGTH = 16
+
 
 def sfz_note_to_midi_key(sfz_note, german=False):
     accidental = 0
@@ -37,22 +48,175 @@ def freq_to_cutoff(param):
     return 127. * max(0, min(1, math.log(param / 130.) / 5)) if param else None
 
 
+# opcodes set by 'key'
+KEY_OPCODES = ('lokey', 'hikey', 'pitch_keycenter')
+# headers which open a new level of the hierarchy, from outermost to innermost
+HEADER_LEVELS = ('global', 'master', 'group')
+
+
+class Region(ChainMap):
+    """Effective opcodes of a region, including those inherited from headers.
+
+    A chained view of the region's own opcodes and the opcodes of its
+    enclosing '<group>', '<master>' and '<global>' headers, in this order of
+    precedence. The header dicts are shared by all regions under them, not
+    copied. Assignments and deletions only affect the region's own opcodes
+    (`maps[0]`), never the shared headers.
+
+    Attributes: opcodes (the region's own opcodes), group (ChainMap view of
+    the enclosing headers, which may be empty) and control (opcodes of the
+    '<control>' header in effect).
+
+    """
+
+    def __init__(self, opcodes, group, control):
+        super(Region, self).__init__(opcodes, *group.maps)
+        self.group = group
+        self.control = control
+
+    @property
+    def opcodes(self):
+        return self.maps[0]
+
+    def flatten(self):
+        """Return dict of effective opcodes with 'key' and 'default_path' applied.
+
+        'key' is expanded to 'lokey', 'hikey' and 'pitch_keycenter', unless
+        these are set explicitly on the same header, and the 'default_path' of
+        the '<control>' header is prepended to 'sample'.
+
+        """
+        merged = {}
+
+        # outermost header first, so inner opcodes take precedence
+        for opcodes in reversed(self.maps):
+            key = opcodes.get('key')
+
+            if key is not None:
+                for name in KEY_OPCODES:
+                    merged[name] = key
+
+            merged.update(opcodes)
+            merged.pop('key', None)
+
+        default_path = self.control.get('default_path')
+
+        if default_path and 'sample' in merged:
+            merged['sample'] = default_path + merged['sample']
+
+        return merged
+
+
+class Instrument(object):
+    """Header hierarchy of parsed SFZ sections.
+
+    Attributes: control (opcodes of the last '<control>' header), groups (list
+    of ChainMap views, one per '<group>' header, of its opcodes and those of
+    the enclosing '<master>' and '<global>' headers) and regions (list of
+    Region views).
+
+    """
+
+    def __init__(self, sections):
+        self.control = {}
+        self.groups = []
+        self.regions = []
+        self._selectors = {}
+        self._resolve(sections)
+
+    def _resolve(self, sections):
+        levels = [None] * len(HEADER_LEVELS)
+        group = ChainMap()
+        control = self.control
+
+        for name, opcodes in sections:
+            if name == 'region':
+                self.regions.append(Region(opcodes, group, control))
+            elif name in HEADER_LEVELS:
+                index = HEADER_LEVELS.index(name)
+                levels[index] = opcodes
+
+                # a header closes all headers of the same or a lower level
+                for lower in range(index + 1, len(levels)):
+                    levels[lower] = None
+
+                # innermost first, empty headers left out to keep lookups short
+                group = ChainMap(*[level for level in reversed(levels) if level])
+
+                if name == 'group':
+                    self.groups.append(group)
+            elif name == 'control':
+                control = self.control = opcodes
+
+    def selector(self, header='region'):
+        """Return sfzquery.Selector for the regions or groups.
+
+        'header' is 'region' or 'group'. The selector and its indexes are
+        created on first use and cached.
+
+        """
+        selector = self._selectors.get(header)
+
+        if selector is None:
+            from sfzquery import Selector
+
+            if header == 'region':
+                views = self.regions
+            elif header == 'group':
+                views = self.groups
+            else:
+                raise ValueError("Can only select 'region' or 'group' headers.")
+
+            selector = self._selectors[header] = Selector(views, self)
+
+        return selector
+
+    def invalidate(self, *names):
+        """Drop cached indexes of the given opcodes (all if none given) of all selectors."""
+        for selector in self._selectors.values():
+            selector.invalidate(*names)
+
+    def select(self, header='region', **predicates):
+        """Return list of region or group views matching all predicates.
+
+        See the sfzquery module for the predicate syntax.
+
+        """
+        return self.selector(header).select(**predicates)
+
+
 class SFZParser(object):
     rx_section = re.compile('^<([^>]+)>\s?')
+    rx_include = re.compile(r'^#include\s+"([^"]+)"')
 
     def __init__(self, sfz_path, encoding=None, **kwargs):
         self.encoding = encoding
         self.sfz_path = sfz_path
-        self.groups = []
         self.sections = []
+        # file names of '#include' directives (not expanded)
+        self.includes = []
+        self._instrument = None
 
-        with open(sfz_path, encoding=self.encoding or 'utf-8-sig') as sfz:
-            self.parse(sfz)
+        with perfstats.timer('sfz.parse'):
+            with open(sfz_path, encoding=self.encoding or 'utf-8-sig') as sfz:
+                self.parse(sfz)
+
+        if perfstats.enabled:
+            perfstats.count('sfz.files')
+            perfstats.count('sfz.sections', len(self.sections))
+            perfstats.count('sfz.opcodes', sum(len(sect) for name, sect in self.sections
+                                               if name != 'comment'))
 
     def parse(self, sfz):
         sections = self.sections
         cur_section = []
+        section_name = None
         value = None
+        # local names for the interning look-ups in the inner loop
+        intern = sys.intern
+        values = {}
+        intern_value = values.setdefault
+        max_value_length = MAX_INTERNED_VALUE_LENGTH
 
         for line in sfz:
             line = line.strip()
@@ -64,39 +228,183 @@ class SFZParser(object):
                 sections.append(('comment', line))
                 continue
 
+            if line.startswith('#'):
+                match = self.rx_include.match(line)
+
+                if match:
+                    self.includes.append(match.group(1))
+                continue
+
             while line:
                 match = self.rx_section.search(line)
                 if match:
                     if cur_section:
+                        self._check_header(section_name, cur_section)
                         sections.append((section_name, OrderedDict(reversed(cur_section))))
                         cur_section = []
 
-                    section_name = match.group(1).strip()
+                    section_name = intern(match.group(1).strip())
                     line = line[match.end():].lstrip()
                 elif "=" in line:
                     line, _, value = line.rpartition('=')
+                    if len(value) <= max_value_length:
+                        value = intern_value(value, value)
                     if '=' in line:
                         line, key = line.rsplit(None, 1)
-                        cur_section.append((key, value))
+                        cur_section.append((intern(key), value))
                         value = None
                 elif value:
                     line, key = None, line
-                    cur_section.append((key, value))
+                    cur_section.append((intern(key), value))
                 else:
                     if line.startswith('//'):
-                        print("Warning: inline comment")
+                        log.warning('Inline comment in %s: %s', self.sfz_path, line)
                         sections.append(('comment', line))
                     # ignore garbage
                     break
 
         if cur_section:
+            self._check_header(section_name, cur_section)
             sections.append((section_name, OrderedDict(reversed(cur_section))))
 
         return sections
 
+    def _check_header(self, section_name, opcodes):
+        if section_name is None:
+            raise ValueError("Opcode '%s' outside of a header." % opcodes[-1][0])
+
+    def resolve(self):
+        """Return Instrument with the header hierarchy of the parsed sections.
+
+        The hierarchy is built on the first call and cached.
+
+        """
+        if self._instrument is None:
+            with perfstats.timer('sfz.resolve'):
+                self._instrument = Instrument(self.sections)
+
+        return self._instrument
+
+    @property
+    def groups(self):
+        """List of ChainMap views of each '<group>' and its enclosing headers."""
+        return self.resolve().groups
+
+    @property
+    def regions(self):
+        """List of Region views with effective (inherited) opcodes of each region."""
+        return self.resolve().regions
+
+
+def watch_files(sfz_paths, callback, polling=False):
+    """Parse SFZ files again when they or files they include change.
+
+    'callback' is called with the path and the SFZParser instance (or the
+    OSError or ValueError raised, e.g. for a file which is only partly
+    written) for each SFZ file when the watch starts and whenever it or one
+    of its '#include' files changed. Only the affected files are parsed
+    again. If parsing fails, the includes found by the last successful parse
+    stay watched. Runs until interrupted with KeyboardInterrupt.
+
+    """
+    from os.path import abspath, dirname, join
+
+    from filewatch import open_watcher
+
+    sfz_paths = [abspath(path) for path in sfz_paths]
+    # SFZ file path -> set of absolute paths of its includes
+    includes = {path: set() for path in sfz_paths}
+
+    def parse(path):
+        try:
+            parser = SFZParser(path)
+        except (OSError, ValueError) as exc:
+            callback(path, exc)
+            return
+
+        includes[path] = {abspath(join(dirname(path), include.replace('\\', '/')))
+                          for include in parser.includes}
+        callback(path, parser)
+
+    def dependents():
+        # path of watched file -> set of SFZ files to parse when it changes
+        result = {path: {path} for path in sfz_paths}
+
+        for path, included in includes.items():
+            for include in included:
+                result.setdefault(include, set()).add(path)
+
+        return result
+
+    for path in sfz_paths:
+        parse(path)
+
+    watched = dependents()
+
+    with open_watcher(list(watched), polling=polling) as watcher:
+        try:
+            while True:
+                changes = watcher.changes()
+                changed = set()
+
+                for path in changes.added | changes.modified | changes.removed:
+                    changed.update(watched.get(path, ()))
+
+                for path in sfz_paths:
+                    if path in changed:
+                        parse(path)
+
+                watched = dependents()
+                watcher.set_files(watched)
+        except KeyboardInterrupt:
+            pass
+
 
 if __name__ == '__main__':
+    import argparse
     import pprint
-    import sys
-    parser = SFZParser(sys.argv[1])
-    pprint.pprint(parser.sections)
+
+    ap = argparse.ArgumentParser(description=__doc__)
+    perfstats.add_arguments(ap)
+    ap.add_argument('-c', '--compile', metavar='FILE',
+                    help="Write compiled binary instrument to FILE (see sfzbin)")
+    ap.add_argument('-w', '--watch', action='store_true',
+                    help="Parse files again whenever they or files they include change")
+    ap.add_argument('--poll', action='store_true',
+                    help="With -w, poll for changes instead of using inotify")
+    ap.add_argument('sfzfiles', nargs='+', metavar='SFZFILE', help="SFZ input file")
+    args = ap.parse_args()
+
+    if args.compile and len(args.sfzfiles) > 1:
+        ap.error("-c/--compile requires a single input file.")
+
+    def output(path, parser):
+        if isinstance(parser, (OSError, ValueError)):
+            print("%s: %s" % (path, parser), file=sys.stderr)
+        elif args.compile:
+            import sfzbin
+
+            with perfstats.timer('sfz.compile'), open(args.compile, 'wb') as fp:
+                fp.write(sfzbin.compile_sections(parser.sections))
+
+            if args.watch:
+                print("%s: compiled to %s" % (path, args.compile), file=sys.stderr)
+        else:
+            if len(args.sfzfiles) > 1 or args.watch:
+                print("# %s" % path)
+
+            pprint.pprint(parser.sections)
+            sys.stdout.flush()
+
+    with perfstats.session(args.stats, args.profile):
+        if args.watch:
+            watch_files(args.sfzfiles, output, args.poll)
+        else:
+            for path in args.sfzfiles:
+                try:
+                    parser = SFZParser(path)
+                except (OSError, ValueError) as exc:
+                    output(path, exc)
+                    sys.exit(1)
+
+                output(path, parser)
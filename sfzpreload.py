@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Pack the preload buffers of all samples of an SFZ instrument into one file.
+
+A disk-streaming sampler keeps the first frames of each sample in memory, so
+playback can start immediately while the rest is streamed from disk. Instead
+of opening every sample file when an instrument is loaded, the player can map
+a single preload file, which holds the first 'preload_frames' frames of each
+sample, starting at the region's 'offset', as raw PCM data in the sample's
+original format.
+
+File layout (all integers little-endian)::
+
+    header      magic 'SFZP', format version, counts and section offsets
+    heads       raw PCM data of each entry, each starting at a multiple of
+                the alignment (by default 4096 bytes, the usual page size)
+    strings     'num_strings + 1' uint32 offsets into the UTF-8 string data,
+                followed by the string data (sample paths as given in the
+                SFZ file, with 'default_path' prepended)
+    entries     'num_entries' records of dtype ENTRY_DTYPE, one for each
+                distinct combination of sample file and offset
+    regions     'num_regions' uint32 entry numbers, NO_ENTRY for regions
+                without a sample, or with a sample which can't be read
+
+The table sections are aligned to 8 bytes. Heads are read in parallel and
+written one after another, so memory use is bounded and does not depend on
+the number of samples.
+
+Requires:
+
+* [NumPy](https://pypi.org/project/numpy/)
+
+"""
+
+__all__ = [
+    'DEFAULT_ALIGNMENT',
+    'DEFAULT_PRELOAD_FRAMES',
+    'ENTRY_DTYPE',
+    'Error',
+    'PreloadFile',
+    'build_preload',
+    'load',
+]
+
+import logging
+import mmap
+import os
+import struct
+from os.path import dirname, join, normpath
+
+import numpy as np
+
+import npanalysis
+import perfstats
+import wavfile
+from sfzparser import SFZParser
+
+
+# module globals
+log = logging.getLogger(__name__)
+
+MAGIC = b'SFZP'
+FORMAT_VERSION = 1
+DEFAULT_PRELOAD_FRAMES = 8192
+DEFAULT_ALIGNMENT = 4096
+NO_ENTRY = 0xFFFFFFFF
+
+ENTRY_DTYPE = np.dtype([
+    ('data_offset', '<u8'),     # position of the head in the file
+    ('sample_offset', '<u8'),   # first frame of the head in the sample ('offset')
+    ('total_frames', '<u8'),    # number of frames of the whole sample
+    ('path', '<u4'),            # string number of the sample path
+    ('num_frames', '<u4'),      # number of frames in the head
+    ('samplerate', '<u4'),
+    ('format_tag', '<u2'),      # sub-format for WAVE_FORMAT_EXTENSIBLE files
+    ('bits_per_sample', '<u2'),
+    ('channels', '<u2'),
+    ('frame_size', '<u2'),
+    ('reserved', '<u4'),
+])
+
+# magic, version, reserved, alignment, preload frames, num_strings, num_entries,
+# num_regions, reserved, offsets of string index, string data, entries and
+# regions
+_HEADER = struct.Struct('<4sHHIIIIIIQQQQ')
+
+
+# exceptions
+class Error(Exception):
+    """General error."""
+    pass
+
+
+# utility functions
+def _pad(size, alignment=8):
+    return -size % alignment
+
+
+def _read_head(item, preload_frames):
+    """Return (header fields, raw PCM data) of the head of a sample file."""
+    path, offset = item
+
+    with wavfile.WavFile(path) as wav:
+        format_tag, bits, channels, samplerate = npanalysis.wav_format(wav)
+        frame_size = wav.fmt.block_align or channels * ((bits + 7) // 8)
+        data_chunk = wav.chunks[b'data']
+        total_frames = data_chunk.size // frame_size
+
+        if offset < total_frames:
+            count = min(preload_frames, total_frames - offset)
+            data = data_chunk.read_range(offset * frame_size, count * frame_size)
+        else:
+            data = b''
+
+    fields = dict(sample_offset=offset, total_frames=total_frames,
+                  num_frames=len(data) // frame_size, samplerate=samplerate,
+                  format_tag=format_tag, bits_per_sample=bits, channels=channels,
+                  frame_size=frame_size)
+    perfstats.count('preload.bytes', len(data))
+    return fields, data
+
+
+def _region_samples(sfz_path, encoding=None):
+    """Yield (sample, resolved path, offset) for each region of SFZ file.
+
+    'sample' is None for regions without a sample file.
+
+    """
+    basedir = dirname(sfz_path)
+
+    for region in SFZParser(sfz_path, encoding=encoding).regions:
+        if not region.get('sample') or region['sample'].startswith('*'):
+            yield None, None, 0
+            continue
+
+        opcodes = region.flatten()
+        sample = opcodes['sample']
+
+        try:
+            offset = max(0, int(opcodes.get('offset', 0)))
+        except ValueError:
+            log.warning("%s: invalid offset '%s' for sample '%s'.", sfz_path,
+                        opcodes['offset'], sample)
+            offset = 0
+
+        yield sample, normpath(join(basedir, sample.replace('\\', '/'))), offset
+
+
+def build_preload(sfz_path, output, preload_frames=DEFAULT_PRELOAD_FRAMES,
+                  alignment=DEFAULT_ALIGNMENT, jobs=4, encoding=None):
+    """Write preload file for SFZ file to file path 'output'.
+
+    Regions referencing the same sample file with the same 'offset' share one
+    entry. Samples which can't be read are skipped with a warning. Returns
+    the number of entries written.
+
+    """
+    from metascan import iter_bounded
+
+    if alignment < 8 or alignment & (alignment - 1):
+        raise ValueError("Alignment must be a power of two >= 8.")
+
+    with perfstats.timer('preload.parse'):
+        regions = list(_region_samples(sfz_path, encoding))
+
+    # (path, offset) -> sample string of first region referencing it
+    heads = {}
+
+    for sample, path, offset in regions:
+        if sample is not None:
+            heads.setdefault((path, offset), sample)
+
+    def read(item):
+        try:
+            with perfstats.timer('preload.read'):
+                return _read_head(item, preload_frames)
+        except (OSError, wavfile.Error) as exc:
+            log.warning("Could not read '%s': %s", item[0], exc)
+            return None, None
+
+    strings = {}
+    entries = []
+    entry_numbers = {}
+    tmp_path = output + '.tmp'
+
+    with open(tmp_path, 'wb') as fp:
+        # header is written last, when the section offsets are known
+        pos = _HEADER.size + _pad(_HEADER.size, alignment)
+        fp.write(b'\0' * pos)
+
+        for item, (fields, data) in zip(heads, iter_bounded(read, heads, jobs)):
+            if fields is None:
+                continue
+
+            fields['path'] = strings.setdefault(heads[item], len(strings))
+            fields['data_offset'] = pos
+            entry_numbers[item] = len(entries)
+            entries.append(fields)
+            fp.write(data)
+            fp.write(b'\0' * _pad(len(data), alignment))
+            pos += len(data) + _pad(len(data), alignment)
+
+        encoded = [s.encode('utf-8') for s in strings]
+        string_index = np.zeros(len(encoded) + 1, dtype='<u4')
+        np.cumsum([len(s) for s in encoded], out=string_index[1:])
+        entry_records = np.zeros(len(entries), dtype=ENTRY_DTYPE)
+
+        for name in ENTRY_DTYPE.names:
+            if name != 'reserved':
+                entry_records[name] = [entry[name] for entry in entries]
+
+        region_entries = np.array(
+            [entry_numbers.get((path, offset), NO_ENTRY) for _, path, offset in regions],
+            dtype='<u4')
+        offsets = []
+
+        for data in (string_index.tobytes(), b''.join(encoded), entry_records.tobytes(),
+                     region_entries.tobytes()):
+            offsets.append(pos)
+            fp.write(data)
+            fp.write(b'\0' * _pad(len(data)))
+            pos += len(data) + _pad(len(data))
+
+        fp.seek(0)
+        fp.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, alignment, preload_frames,
+                              len(encoded), len(entries), len(regions), 0, *offsets))
+
+    os.replace(tmp_path, output)
+    return len(entries)
+
+
+# API classes
+class PreloadFile(object):
+    """Preload file mapped into memory.
+
+    Attributes: entries (NumPy structured array of ENTRY_DTYPE records),
+    region_entries (array of entry numbers per region), alignment,
+    preload_frames and version.
+
+    The arrays and the buffers returned by `head()` are views of the mapped
+    file and must not be used after `close()`.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._map_sections()
+        except Exception:
+            self.close()
+            raise
+
+        self._lookup = None
+
+    def _map_sections(self):
+        buf = self._mmap
+
+        try:
+            (magic, self.version, _, self.alignment, self.preload_frames, num_strings,
+             num_entries, num_regions, _, index_offset, data_offset, entries_offset,
+             regions_offset) = _HEADER.unpack_from(buf)
+        except struct.error:
+            raise Error("%s: Truncated header." % self.path)
+
+        if magic != MAGIC:
+            raise Error("%s: not a preload file" % self.path)
+
+        if self.version != FORMAT_VERSION:
+            raise Error("%s: Unsupported format version %i." % (self.path, self.version))
+
+        try:
+            self._string_index = np.frombuffer(buf, dtype='<u4', count=num_strings + 1,
+                                               offset=index_offset)
+            self._string_data_offset = data_offset
+            self.entries = np.frombuffer(buf, dtype=ENTRY_DTYPE, count=num_entries,
+                                         offset=entries_offset)
+            self.region_entries = np.frombuffer(buf, dtype='<u4', count=num_regions,
+                                                offset=regions_offset)
+        except ValueError:
+            raise Error("%s: Truncated file." % self.path)
+
+    def close(self):
+        self._string_index = self.entries = self.region_entries = None
+
+        try:
+            self._mmap.close()
+        except BufferError:
+            # buffers are still referenced elsewhere, unmapped on garbage collection
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def sample_path(self, entry):
+        """Return sample path of entry as given in the SFZ file."""
+        index = int(self.entries[entry]['path'])
+        start, end = self._string_index[index:index + 2].tolist()
+        offset = self._string_data_offset
+        return self._mmap[offset + start:offset + end].decode('utf-8')
+
+    def head(self, entry):
+        """Return raw PCM data of entry as a memoryview of the mapped file."""
+        record = self.entries[entry]
+        start = int(record['data_offset'])
+        return memoryview(self._mmap)[
+            start:start + int(record['num_frames']) * int(record['frame_size'])]
+
+    def head_array(self, entry):
+        """Return head of entry as float32 array of shape (frames, channels)."""
+        record = self.entries[entry]
+        return npanalysis.pcm_to_array(self.head(entry), int(record['format_tag']),
+                                       int(record['bits_per_sample']),
+                                       int(record['channels']))
+
+    def region_entry(self, region):
+        """Return entry number for region number or None, if it has no head."""
+        entry = int(self.region_entries[region])
+        return None if entry == NO_ENTRY else entry
+
+    def find(self, sample, offset=0):
+        """Return entry number for sample path and offset or None if not found."""
+        if self._lookup is None:
+            self._lookup = {(self.sample_path(i), int(record['sample_offset'])): i
+                            for i, record in enumerate(self.entries)}
+
+        return self._lookup.get((sample, offset))
+
+
+def load(path):
+    """Map preload file into memory and return PreloadFile."""
+    return PreloadFile(path)
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    perfstats.add_arguments(ap)
+    ap.add_argument('-n', '--frames', type=int, default=DEFAULT_PRELOAD_FRAMES,
+                    metavar='NUM',
+                    help="Number of frames to preload per sample (default: %(default)i)")
+    ap.add_argument('-a', '--alignment', type=int, default=DEFAULT_ALIGNMENT,
+                    metavar='BYTES',
+                    help="Alignment of sample heads in bytes (default: %(default)i)")
+    ap.add_argument('-j', '--jobs', type=int, default=4, metavar='NUM',
+                    help="Number of samples to read in parallel (default: %(default)i)")
+    ap.add_argument('-i', '--info', action='store_true',
+                    help="List the entries of an existing preload file")
+    ap.add_argument('-v', '--verbose', action='store_true', help="Be verbose")
+    ap.add_argument('input', help="SFZ input file (preload file with -i)")
+    ap.add_argument('output', nargs='?',
+                    help="Output file (default: input with suffix '.preload')")
+    args = ap.parse_args()
+
+    logging.basicConfig(format='%(levelname)s - %(message)s',
+                        level=logging.DEBUG if args.verbose else logging.INFO)
+
+    try:
+        if args.info:
+            with load(args.input) as preload:
+                print("%i entries, %i regions, %i frames, alignment %i" % (
+                    len(preload), len(preload.region_entries), preload.preload_frames,
+                    preload.alignment))
+
+                for i, record in enumerate(preload.entries):
+                    print("%s @%i: %i frames, %i ch, %i bit, %i Hz" % (
+                        preload.sample_path(i), record['sample_offset'],
+                        record['num_frames'], record['channels'],
+                        record['bits_per_sample'], record['samplerate']))
+        else:
+            output = args.output or os.path.splitext(args.input)[0] + '.preload'
+
+            with perfstats.session(args.stats, args.profile):
+                count = build_preload(args.input, output, args.frames, args.alignment,
+                                      args.jobs)
+
+            log.info("%i sample heads written to '%s'.", count, output)
+    except (OSError, ValueError, Error) as exc:
+        sys.exit("Error: %s" % exc)
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""Select regions or groups of an instrument by opcode values.
+
+Queries are keyword arguments of the form 'opcode__operator=value', e.g.::
+
+    instrument = SFZParser('piano.sfz').resolve()
+    instrument.select(sample__startswith='samples/pp/', lovel__ge=64)
+    instrument.select(header='group', seq_length__gt=1)
+
+Supported operators are 'eq' (the default, if no operator is given), 'ne',
+'lt', 'le', 'gt', 'ge', 'in' (value is a collection), 'startswith' and
+'exists' (value is a bool). Comparisons with 'lt', 'le', 'gt' and 'ge' are
+numeric, and note names are converted to MIDI note numbers for the 'lokey',
+'hikey' and 'pitch_keycenter' opcodes. All other operators compare opcode
+values as strings. Opcodes are matched by their effective values, i.e.
+including opcodes inherited from enclosing headers. Default values of opcodes
+are not taken into account: views without the opcode only match 'ne' and
+'exists=False'.
+
+For each queried opcode, an OpcodeIndex is built on first use and cached. It
+maps each distinct value to the positions of the views with that value, with
+the numeric values and the string values kept in sorted lists for range and
+prefix queries. A query then only looks at the positions matching each
+predicate and intersects them, starting with the smallest set.
+
+Indexes do not track changes of opcode values. Call `Selector.invalidate()`
+after modifying opcodes which are used in queries, or use `Selector.update()`,
+which does this for the modified opcodes. Updates of group views change
+header dicts shared with the regions, so `update()` of a selector created by
+an `Instrument` invalidates the indexes of all its selectors.
+
+"""
+
+__all__ = [
+    'OPERATORS',
+    'OpcodeIndex',
+    'Selector',
+]
+
+from bisect import bisect_left, bisect_right
+
+from sfzparser import KEY_OPCODES, Region, sfz_note_to_midi_key
+
+
+OPERATORS = ('eq', 'ne', 'lt', 'le', 'gt', 'ge', 'in', 'startswith', 'exists')
+
+
+def _effective(view, name):
+    # like view.get(name), but a 'key' on an inner header overrides outer
+    # 'lokey', 'hikey' and 'pitch_keycenter' opcodes
+    if name in KEY_OPCODES:
+        for opcodes in view.maps:
+            if name in opcodes:
+                return opcodes[name]
+            if 'key' in opcodes:
+                return opcodes['key']
+        return None
+
+    return view.get(name)
+
+
+def _to_number(name, value):
+    try:
+        return float(value)
+    except ValueError:
+        if name in KEY_OPCODES:
+            try:
+                return sfz_note_to_midi_key(value)
+            except (KeyError, IndexError, ValueError):
+                pass
+    return None
+
+
+class OpcodeIndex(object):
+    """Index of the effective values of one opcode in a list of views.
+
+    Attributes: name, positions (dict mapping each value to a list of view
+    positions) and missing (set of positions of views without the opcode).
+
+    """
+
+    def __init__(self, name, views):
+        self.name = name
+        self.positions = {}
+        self.missing = set()
+        self._numbers = None
+        self._strings = None
+
+        for pos, view in enumerate(views):
+            value = _effective(view, name)
+
+            if value is None:
+                self.missing.add(pos)
+            else:
+                self.positions.setdefault(value, []).append(pos)
+
+    def _sorted_numbers(self):
+        if self._numbers is None:
+            numbers = []
+
+            for value in self.positions:
+                number = _to_number(self.name, value)
+
+                if number is not None:
+                    numbers.append((number, value))
+
+            numbers.sort()
+            self._numbers = ([number for number, _ in numbers],
+                             [value for _, value in numbers])
+
+        return self._numbers
+
+    def _collect(self, values):
+        result = set()
+
+        for value in values:
+            result.update(self.positions[value])
+
+        return result
+
+    def equal(self, value):
+        return set(self.positions.get(str(value), ()))
+
+    def one_of(self, values):
+        return self._collect(str(value) for value in values
+                             if str(value) in self.positions)
+
+    def in_range(self, low=None, high=None, include_low=True, include_high=True):
+        """Return set of positions with numeric values within given bounds."""
+        numbers, values = self._sorted_numbers()
+        start = 0 if low is None else (bisect_left if include_low else bisect_right)(
+            numbers, low)
+        end = len(numbers) if high is None else (
+            bisect_right if include_high else bisect_left)(numbers, high)
+        return self._collect(values[start:end])
+
+    def startswith(self, prefix):
+        if self._strings is None:
+            self._strings = sorted(self.positions)
+
+        start = bisect_left(self._strings, prefix)
+        end = start
+
+        while end < len(self._strings) and self._strings[end].startswith(prefix):
+            end += 1
+
+        return self._collect(self._strings[start:end])
+
+
+class Selector(object):
+    """Query interface for a list of regions or group views.
+
+    'views' is a list of mappings of effective opcodes, e.g. `Region` views
+    or the group views of an `sfzparser.Instrument`. 'instrument' is the
+    `sfzparser.Instrument` the views belong to, if any.
+
+    """
+
+    def __init__(self, views, instrument=None):
+        self.views = views
+        self.instrument = instrument
+        self._indexes = {}
+
+    def index(self, name):
+        """Return OpcodeIndex for opcode 'name', building it on first use."""
+        index = self._indexes.get(name)
+
+        if index is None:
+            index = self._indexes[name] = OpcodeIndex(name, self.views)
+
+        return index
+
+    def invalidate(self, *names):
+        """Drop cached indexes of the given opcodes, or of all opcodes if none given."""
+        if names:
+            for name in names:
+                self._indexes.pop(name, None)
+        else:
+            self._indexes.clear()
+
+    def _match(self, name, op, value):
+        index = self.index(name)
+
+        if op in ('lt', 'le', 'gt', 'ge') and isinstance(value, str):
+            number = _to_number(name, value)
+
+            if number is None:
+                raise ValueError("Not a number: %s=%s" % (name, value))
+
+            value = number
+
+        if op == 'eq':
+            return index.equal(value)
+        elif op == 'ne':
+            return set(range(len(self.views))) - index.equal(value)
+        elif op == 'in':
+            return index.one_of(value)
+        elif op == 'lt':
+            return index.in_range(high=value, include_high=False)
+        elif op == 'le':
+            return index.in_range(high=value)
+        elif op == 'gt':
+            return index.in_range(low=value, include_low=False)
+        elif op == 'ge':
+            return index.in_range(low=value)
+        elif op == 'startswith':
+            return index.startswith(value)
+        elif op == 'exists':
+            missing = index.missing
+            return (set(range(len(self.views))) - missing) if value else set(missing)
+
+        raise ValueError("Unknown query operator '%s'. Supported: %s" %
+                         (op, ', '.join(OPERATORS)))
+
+    def positions(self, **predicates):
+        """Return sorted list of positions of views matching all predicates."""
+        if not predicates:
+            return list(range(len(self.views)))
+
+        matches = []
+
+        for key, value in predicates.items():
+            name, _, op = key.partition('__')
+            matches.append(self._match(name, op or 'eq', value))
+
+        matches.sort(key=len)
+        result = matches[0]
+
+        for match in matches[1:]:
+            if not result:
+                break
+            result = result.intersection(match)
+
+        return sorted(result)
+
+    def select(self, **predicates):
+        """Return list of views matching all predicates, in document order."""
+        return list(map(self.views.__getitem__, self.positions(**predicates)))
+
+    def update(self, views, **opcodes):
+        """Set opcodes on each of the given views and invalidate their indexes.
+
+        For Region views, the opcodes are set on the region itself, not on
+        the shared headers. For other views, e.g. group views, they are set
+        on the innermost header, which changes the effective opcodes of the
+        regions below it, so the indexes of all selectors of the instrument
+        are invalidated.
+
+        """
+        shared = False
+
+        for view in views:
+            view.update(opcodes)
+            shared = shared or not isinstance(view, Region)
+
+        names = set(opcodes)
+
+        if 'key' in names:
+            # 'key' sets the effective 'lokey', 'hikey' and 'pitch_keycenter'
+            names.update(KEY_OPCODES)
+
+        if shared and self.instrument is not None:
+            self.instrument.invalidate(*names)
+        else:
+            self.invalidate(*names)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Make the top-level modules of the repository importable in tests.
+
+Also provides fixtures, which write small synthetic WAV and SFZ files.
+
+"""
+
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# KSDATAFORMAT_SUBTYPE GUID after the format tag
+KSDATAFORMAT_GUID_TAIL = b'\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71'
+
+
+def chunk(name, data):
+    """Return RIFF chunk with tag, size and padded data."""
+    return name + struct.pack('<L', len(data)) + data + (b'\0' if len(data) % 2 else b'')
+
+
+def fmt_data(format_tag=1, bits=16, channels=1, samplerate=48000, sub_format=None):
+    """Return data of a 'fmt ' chunk, with extension if 'sub_format' is given."""
+    block_align = channels * ((bits + 7) // 8)
+    data = struct.pack('<HHLLHH', format_tag, channels, samplerate,
+                       samplerate * block_align, block_align, bits)
+
+    if sub_format is not None:
+        data += struct.pack('<HHLH', 22, bits, 0x3F, sub_format) + KSDATAFORMAT_GUID_TAIL
+
+    return data
+
+
+def wav_bytes(data, chunks=(), rf64=False, **fmt):
+    """Return WAV file with 'fmt ' and 'data' chunk, followed by extra chunks.
+
+    'chunks' are (tag, data) tuples. With 'rf64', an RF64 file is returned,
+    with all sizes of the 'data' chunk and the file in its 'ds64' chunk.
+
+    """
+    body = chunk(b'fmt ', fmt_data(**fmt))
+
+    if rf64:
+        body += b'data' + struct.pack('<L', 0xFFFFFFFF) + data + b'\0' * (len(data) % 2)
+    else:
+        body += chunk(b'data', data)
+
+    body += b''.join(chunk(name, chunk_data) for name, chunk_data in chunks)
+
+    if not rf64:
+        return b'RIFF' + struct.pack('<L', 4 + len(body)) + b'WAVE' + body
+
+    ds64 = chunk(b'ds64', struct.pack('<QQQL', 4 + 36 + len(body), len(data), 0, 0))
+    return b'RF64' + struct.pack('<L', 0xFFFFFFFF) + b'WAVE' + ds64 + body
+
+
+@pytest.fixture
+def make_wav(tmp_path):
+    """Return function, which writes 'wav_bytes' to a file and returns its path."""
+
+    def make_wav(name, data, **kwargs):
+        path = tmp_path / name
+        path.write_bytes(wav_bytes(data, **kwargs))
+        return str(path)
+
+    return make_wav
+
+
+@pytest.fixture
+def make_sfz(tmp_path):
+    """Return function, which writes SFZ text to a file and returns its path."""
+
+    def make_sfz(text, name='test.sfz'):
+        path = tmp_path / name
+        path.write_text(text)
+        return str(path)
+
+    return make_sfz
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Tests for the waveform peak pyramids."""
+
+import io
+import os
+import struct
+
+import numpy as np
+import pytest
+
+import peaks
+import wavfile
+from conftest import chunk, wav_bytes
+
+
+def reference_level(samples, bin_frames):
+    result = []
+
+    for start in range(0, len(samples), bin_frames):
+        block = samples[start:start + bin_frames]
+        rms = np.sqrt(np.mean(np.square(block, dtype=np.float64), axis=0))
+        result.append(np.stack([block.min(axis=0), block.max(axis=0), rms], axis=-1))
+
+    return peaks._to_int16(np.array(result))
+
+
+def test_compute_peaks():
+    rng = np.random.default_rng(1)
+    data = rng.integers(-32768, 32767, size=(1000, 2)).astype('<i2')
+    samples = data / 32768
+    wav = wavfile.WavFile(io.BytesIO(wav_bytes(data.tobytes(), channels=2)))
+    levels = [100, 200, 600]
+    result = peaks.compute_peaks(wav, levels)
+
+    assert [level.shape for level in result] == [(10, 2, 3), (5, 2, 3), (2, 2, 3)]
+
+    for level, data in zip(levels, result):
+        # RMS may differ by one step because of float32 rounding
+        assert np.abs(data.astype(int) - reference_level(samples, level)).max() <= 1
+
+    with pytest.raises(ValueError):
+        peaks.compute_peaks(wav, [256, 512, 768])
+
+
+def test_open_peaks(make_wav, tmp_path):
+    values = np.arange(-3000, 3000, dtype='<i4').reshape(1000, 6) * 1000
+    int24 = (values << 8).view(np.uint8).reshape(-1, 4)[:, 1:].tobytes()
+    path = make_wav('ext24.wav', int24, format_tag=0xFFFE, bits=24, channels=6,
+                    sub_format=1)
+    cache_dir = str(tmp_path / 'cache')
+
+    with peaks.open_peaks(path, [100, 400], cache_dir) as peakfile:
+        assert (peakfile.num_frames, peakfile.channels, peakfile.samplerate) == (
+            1000, 6, 48000)
+        assert peakfile.levels == [100, 400]
+        assert peakfile.level(400).shape == (3, 6, 3)
+        assert peakfile.for_zoom(300)[0] == 100
+        assert peakfile.for_zoom(10)[0] == 100
+        reference = reference_level(values / 2 ** 23, 400)
+        assert np.abs(peakfile.level(400).astype(int) - reference).max() <= 1
+
+    cached = peaks.peaks_path(path, cache_dir)
+    mtime = os.stat(cached).st_mtime_ns
+
+    with peaks.open_peaks(path, [100, 400], cache_dir):
+        assert os.stat(cached).st_mtime_ns == mtime
+
+    with peaks.open_peaks(path, [100, 200, 400], cache_dir) as peakfile:
+        assert peakfile.levels == [100, 200, 400]
+
+
+def test_short_fmt_chunk(tmp_path):
+    fmt = struct.pack('<HHLLH', 1, 1, 48000, 96000, 2)
+    body = b'WAVE' + chunk(b'fmt ', fmt) + chunk(b'data', bytes(100))
+    path = tmp_path / 'short.wav'
+    path.write_bytes(b'RIFF' + struct.pack('<L', len(body)) + body)
+
+    with pytest.raises(wavfile.ParseError):
+        peaks.open_peaks(str(path))
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Tests for the compiled binary instrument format."""
+
+import pytest
+
+import sfzbin
+
+
+SFZ = '''<control> default_path=samples/
+<global> volume=-6 ampeg_release=0.5
+<group> lovel=64 key=c4
+<region> sample=a.wav offset=1099511627776
+<region> sample=b.wav key=62 pan=-20.5 my_opcode=text
+'''
+
+
+def compile_and_load(make_sfz, tmp_path, text):
+    path = str(tmp_path / 'test.sfzb')
+    sfzbin.compile_sfz(make_sfz(text), path)
+    return sfzbin.load(path)
+
+
+def test_round_trip(make_sfz, tmp_path):
+    with compile_and_load(make_sfz, tmp_path, SFZ) as instrument:
+        assert len(instrument) == 2
+        regions = instrument.regions
+        assert regions['lokey'].tolist() == [60, 62]
+        assert regions['lovel'].tolist() == [64, 64]
+        assert regions['hivel'].tolist() == [sfzbin.NO_INT] * 2
+        assert regions['offset'].tolist() == [2 ** 40, sfzbin.NO_LONG]
+        assert regions['volume'].tolist() == [-6.0, -6.0]
+        assert [instrument.string(i) for i in regions['sample']] == [
+            'samples/a.wav', 'samples/b.wav']
+
+        assert [dict(opcodes) for opcodes in instrument.iter_regions()] == [
+            {'sample': 'samples/a.wav', 'lokey': '60', 'hikey': '60',
+             'pitch_keycenter': '60', 'lovel': '64', 'offset': '1099511627776',
+             'volume': '-6', 'ampeg_release': '0.5'},
+            {'sample': 'samples/b.wav', 'lokey': '62', 'hikey': '62',
+             'pitch_keycenter': '62', 'lovel': '64', 'volume': '-6', 'pan': '-20.5',
+             'ampeg_release': '0.5', 'my_opcode': 'text'},
+        ]
+
+
+def test_values_kept_as_text(make_sfz, tmp_path):
+    text = ('<region> sample=a.wav lokey=x9 lovel=-2147483648 offset=%i '
+            'volume=nan pan=inf tune=5\n' % 2 ** 70)
+
+    with compile_and_load(make_sfz, tmp_path, text) as instrument:
+        assert len(instrument.extras) == 5
+        assert dict(next(instrument.iter_regions())) == {
+            'sample': 'a.wav', 'tune': '5', 'lokey': 'x9', 'lovel': '-2147483648',
+            'offset': str(2 ** 70), 'volume': 'nan', 'pan': 'inf'}
+
+
+def test_invalid_files(tmp_path):
+    path = tmp_path / 'test.sfzb'
+    path.write_bytes(b'')
+
+    with pytest.raises(sfzbin.Error):
+        sfzbin.load(str(path))
+
+    path.write_bytes(b'SFZX' + bytes(100))
+
+    with pytest.raises(sfzbin.Error):
+        sfzbin.load(str(path))
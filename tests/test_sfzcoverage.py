@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Tests for the region overlap and coverage analysis."""
+
+from sfzcoverage import Gap, Overlap, Zone, analyse, find_overlaps, zones_from_sfz
+from sfzparser import SFZParser
+
+
+def zone(ref, lokey=60, hikey=60, lovel=0, hivel=127, seq_position=1, seq_length=1):
+    return Zone(lokey, hikey, lovel, hivel, seq_position, seq_length, ref)
+
+
+def test_round_robin_overlaps():
+    zones = [
+        zone('a', seq_position=1, seq_length=2),
+        zone('b', seq_position=2, seq_length=2),
+        # sounds at steps 1, 5, 9, ... like 'a' at steps 1, 3, 5, ...
+        zone('c', seq_position=1, seq_length=4),
+        # sounds at steps 2, 5, 8, ...
+        zone('d', seq_position=2, seq_length=3),
+    ]
+    overlaps = {(o.first, o.second): o.seq_position for o in find_overlaps(zones)}
+    assert overlaps == {('a', 'c'): 1, ('a', 'd'): 5, ('b', 'd'): 2, ('c', 'd'): 5}
+
+
+def test_key_and_velocity_ranges():
+    zones = [
+        zone('a', 60, 64, 0, 63),
+        zone('b', 60, 64, 64, 127),
+        zone('c', 64, 70, 60, 70),
+        zone('d', 65, 72, 0, 59),
+    ]
+    coverage = analyse(zones)
+    assert coverage.overlaps == [
+        Overlap('a', 'c', 64, 64, 60, 63, 1),
+        Overlap('b', 'c', 64, 64, 64, 70, 1),
+    ]
+    assert coverage.gaps == [Gap(65, 70, 71, 127), Gap(71, 72, 60, 127)]
+    assert coverage.unreachable == []
+
+
+def test_unreachable_and_sfz_zones(make_sfz):
+    parser = SFZParser(make_sfz(
+        '<group> lovel=0 hivel=63\n'
+        '<region> key=c4 sample=a.wav\n'
+        '<region> lokey=62 hikey=61 sample=b.wav\n'
+        '<region> key=60 seq_position=3 seq_length=2 sample=c.wav\n'))
+    zones = zones_from_sfz(parser.regions)
+    assert zones[0] == zone(0, hivel=63)
+    coverage = analyse(zones, key_range=(60, 61))
+    assert [z.ref for z in coverage.unreachable] == [1, 2]
+    assert coverage.gaps == [Gap(60, 60, 64, 127), Gap(61, 61, 0, 127)]
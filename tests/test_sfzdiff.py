@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Tests for the structural diff of SFZ files."""
+
+from sfzdiff import (ADDED, CHANGED, REMOVED, RegionDiff, diff_files, diff_regions,
+                     format_diff)
+
+
+OLD = '''<global> volume=-3
+<group> lovel=0 hivel=63
+<region> sample=a.wav key=c4
+<region> sample=b.wav key=62
+<region> sample=c.wav key=64
+'''
+
+# same regions in a different layout and order, with notes as numbers
+NEW = '''// reordered
+<group> hivel=63 lovel=0 volume=-3
+<region> key=62 sample=b.wav tune=10
+<region> sample=a.wav key=60
+<region> sample=d.wav key=65
+'''
+
+
+def test_diff_files(make_sfz):
+    diffs = diff_files(make_sfz(OLD, 'old.sfz'), make_sfz(NEW, 'new.sfz'))
+    assert diffs == [
+        RegionDiff(CHANGED, 1, 0, 'b.wav', [('tune', None, '10')]),
+        RegionDiff(REMOVED, 2, None, 'c.wav', []),
+        RegionDiff(ADDED, None, 2, 'd.wav', []),
+    ]
+    assert format_diff(diffs[0]) == '~ region 2 -> 1 (sample=b.wav): +tune=10'
+
+
+def test_pairing_and_duplicates():
+    old = [{'sample': 'a.wav', 'lokey': '60'}, {'sample': 'a.wav', 'lokey': '60'},
+           {'sample': 'b.wav', 'lokey': '60', 'lovel': '0'}]
+    new = [{'sample': 'a.wav', 'lokey': '60'}, {'sample': 'b.wav', 'lokey': '61'}]
+    assert diff_regions(old, new) == [
+        RegionDiff(REMOVED, 0, None, 'a.wav', []),
+        RegionDiff(CHANGED, 2, 1, 'b.wav', [('lokey', '60', '61'), ('lovel', '0', None)]),
+    ]
+    assert diff_regions(old, old) == []
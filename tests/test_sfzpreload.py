@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""Tests for the preload file generator."""
+
+import numpy as np
+
+import sfzpreload
+
+
+def test_extensible_and_float_samples(tmp_path, make_wav):
+    frames = 1000
+    signal = np.sin(np.arange(frames * 6) / 10).reshape(frames, 6)
+    int24 = (signal * 2 ** 23).astype('<i4').view(np.uint8).reshape(-1, 4)[:, :3]
+    ext24 = int24.tobytes()
+    float32 = signal[:, :2].astype('<f4').tobytes()
+    pcm16 = (signal[:, :2] * 30000).astype('<i2').tobytes()
+    make_wav('ext24.wav', ext24, format_tag=0xFFFE, bits=24, channels=6, sub_format=1)
+    make_wav('float.wav', float32, format_tag=3, bits=32, channels=2)
+    make_wav('pcm16.wav', pcm16, channels=2)
+    sfz = tmp_path / 'test.sfz'
+    sfz.write_text('<region> sample=ext24.wav offset=10\n'
+                   '<region> sample=float.wav\n'
+                   '<region> sample=pcm16.wav\n')
+    output = str(tmp_path / 'test.preload')
+
+    assert sfzpreload.build_preload(str(sfz), output, preload_frames=100) == 3
+
+    with sfzpreload.load(output) as preload:
+        assert preload.region_entries.tolist() == [0, 1, 2]
+        ext = preload.entries[0]
+        assert (ext['format_tag'], ext['bits_per_sample'], ext['channels']) == (1, 24, 6)
+        assert (ext['frame_size'], ext['total_frames'], ext['num_frames']) == (18, 1000, 100)
+        assert bytes(preload.head(0)) == ext24[10 * 18:110 * 18]
+        assert preload.entries[1]['format_tag'] == 3
+        assert bytes(preload.head(1)) == float32[:100 * 8]
+        assert bytes(preload.head(2)) == pcm16[:100 * 4]
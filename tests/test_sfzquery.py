@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Tests for region queries."""
+
+from sfzparser import Instrument
+
+
+def make_instrument():
+    # fresh header dicts for each test, since updates modify them in place
+    return Instrument([
+        ('group', {'lokey': '60', 'hikey': '62', 'pitch_keycenter': '61'}),
+        ('region', {'sample': 'a.wav'}),
+        ('region', {'sample': 'b.wav'}),
+    ])
+
+
+def test_select_after_update_of_key():
+    instrument = make_instrument()
+    selector = instrument.selector()
+    assert [r['sample'] for r in selector.select(lokey__ge=60)] == ['a.wav', 'b.wav']
+
+    selector.update(selector.select(sample='b.wav'), key='72')
+
+    assert [r['sample'] for r in selector.select(lokey__ge=70)] == ['b.wav']
+    assert [r['sample'] for r in selector.select(hikey=62)] == ['a.wav']
+    assert [r['sample'] for r in selector.select(pitch_keycenter='72')] == ['b.wav']
+    assert [r['sample'] for r in selector.select(key__exists=True)] == ['b.wav']
+
+
+def test_group_update_invalidates_region_indexes():
+    instrument = make_instrument()
+    assert instrument.select(lovel__ge=64) == []
+    assert len(instrument.select(hikey=62)) == 2
+
+    groups = instrument.selector('group')
+    groups.update(groups.select(), lovel='64', hikey='72')
+
+    assert [r['sample'] for r in instrument.select(lovel__ge=64)] == ['a.wav', 'b.wav']
+    assert instrument.select(hikey=62) == []
+    assert len(instrument.select(hikey__gt=70)) == 2
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""Tests for the WAV file reader."""
+
+import io
+import struct
+
+import pytest
+
+import wavfile
+from conftest import chunk, wav_bytes
+
+
+DATA = bytes(range(256)) * 4
+
+
+def test_chunks(make_wav):
+    path = make_wav('test.wav', DATA, channels=2,
+                    chunks=[(b'junk', b'abc'), (b'junk', b'de')])
+
+    with wavfile.WavFile(path) as wav:
+        fmt = wav.fmt
+        assert (fmt.format_tag, fmt.channels, fmt.samples_per_sec) == (1, 2, 48000)
+        assert (fmt.bits_per_sample, fmt.sample_width, fmt.frame_size) == (16, 2, 4)
+        assert fmt.comp_name == 'PCM/uncompressed'
+        assert not fmt.compressed
+        assert wav.num_frames == len(DATA) // 4
+        assert wav.chunks[b'data'].data == DATA
+        # unknown chunks are kept in lists, padding of odd sizes is skipped
+        assert [c.data for c in wav.chunks[b'junk']] == [b'abc', b'de']
+
+
+def test_format_tags():
+    fmt = wavfile.WavFile(io.BytesIO(wav_bytes(DATA, format_tag=3, bits=32))).fmt
+    assert (fmt.comp_name, fmt.compressed, fmt.frame_size) == ('IEEE float', False, 4)
+
+    fmt = wavfile.WavFile(io.BytesIO(wav_bytes(DATA, format_tag=2, bits=4))).fmt
+    assert (fmt.comp_name, fmt.compressed) == ('Microsoft ADPCM', True)
+
+    with pytest.raises(wavfile.UnsupportedCompressionError):
+        fmt.sample_width
+
+
+def test_invalid_files():
+    with pytest.raises(wavfile.ParseError):
+        wavfile.WavFile(io.BytesIO(b'RIFF'))
+
+    with pytest.raises(wavfile.ParseError):
+        # no 'data' chunk
+        body = b'WAVE' + chunk(b'fmt ', struct.pack('<HHLLHH', 1, 1, 48000, 96000, 2, 16))
+        wavfile.WavFile(io.BytesIO(b'RIFF' + struct.pack('<L', len(body)) + body))
+
+    with pytest.raises(wavfile.ParseError):
+        body = b'WAVE' + chunk(b'fmt ', b'\x01\x00') + chunk(b'data', DATA)
+        wavfile.WavFile(io.BytesIO(b'RIFF' + struct.pack('<L', len(body)) + body))
+
+
+def test_set_chunk_and_write(make_wav):
+    path = make_wav('test.wav', DATA, chunks=[(b'junk', b'abc')])
+    loop = wavfile.Loop(0, wavfile.LOOP_TYPE_FORWARD, 10, 99, 0, 0)
+
+    with wavfile.WavFile(path) as wav:
+        wav.set_chunk(wavfile.SmplChunk.create([loop], midi_unity_note=64,
+                                               samplerate=48000))
+        output = io.BytesIO()
+        wav.write(output)
+
+        with pytest.raises(ValueError):
+            wav.set_chunk(wavfile.WavChunk(b'data', 0, data=b''))
+
+    output.seek(0)
+    wav = wavfile.WavFile(output)
+    assert [c.name for c in wav] == [b'fmt ', b'data', b'junk', b'smpl']
+    assert wav.chunks[b'data'].data == DATA
+    assert wav.root_note == 64
+    assert wav.loops == [loop]
+    assert wav.chunks[b'smpl'].sample_period == round(1e9 / 48000)
+
+
+def smpl_data(loops, declared=None, sampler_data=b'', unity_note=60):
+    header = struct.pack('<9L', 0, 0, 20833, unity_note, 0, 0, 0,
+                         len(loops) if declared is None else declared, len(sampler_data))
+    return header + b''.join(struct.pack('<6L', *loop) for loop in loops) + sampler_data
+
+
+def test_loops_and_cue_points(make_wav):
+    loops = [(1, 0, 100, 199, 0, 0), (2, 1, 300, 399, 0, 3)]
+    cue = struct.pack('<L', 2) + b''.join(
+        struct.pack('<2L4s3L', cue_id, pos, b'data', 0, 0, pos)
+        for cue_id, pos in ((1, 100), (2, 300)))
+    adtl = b'adtl' + chunk(b'labl', struct.pack('<L', 1) + b'Sustain\0')
+    path = make_wav('test.wav', DATA, chunks=[
+        (b'smpl', smpl_data(loops, sampler_data=b'xyzw', unity_note=62)),
+        (b'cue ', cue),
+        (b'LIST', adtl),
+    ])
+
+    with wavfile.WavFile(path) as wav:
+        assert wav.root_note == 62
+        assert wav.loops == [wavfile.Loop(*loop) for loop in loops]
+        assert wav.loops[1].type == wavfile.LOOP_TYPE_ALTERNATE
+        assert [(c.id, c.position, c.sample_offset) for c in wav.cue_points] == [
+            (1, 100, 100), (2, 300, 300)]
+        assert wav.cue_labels == {1: 'Sustain'}
+
+        # other fields and sampler specific data are kept from the template
+        new_loop = wavfile.Loop(0, wavfile.LOOP_TYPE_FORWARD, 0, 50, 0, 0)
+        smpl = wavfile.SmplChunk.create([new_loop], template=wav.smpl)
+        assert smpl.data == smpl_data([new_loop], sampler_data=b'xyzw', unity_note=62)
+
+
+def test_truncated_loop_list(make_wav):
+    loops = [(1, 0, 100, 199, 0, 0)]
+    path = make_wav('test.wav', DATA, chunks=[(b'smpl', smpl_data(loops, declared=3))])
+
+    with wavfile.WavFile(path) as wav:
+        assert wav.smpl.sample_loops == 3
+        assert wav.loops == [wavfile.Loop(*loop) for loop in loops]
+
+
+def test_rf64_windowed_access(make_wav):
+    path = make_wav('test.wav', DATA, rf64=True, channels=2, chunks=[(b'junk', b'abc')])
+
+    with wavfile.WavFile(path) as wav:
+        assert wav.riff_type == b'RF64'
+        assert wav.chunks[b'data'].size == len(DATA)
+        assert wav.chunks[b'junk'][0].data == b'abc'
+        assert wav.num_frames == len(DATA) // 4
+        assert wav.read_frames(10, 5) == DATA[40:60]
+        assert wav.read_frames(250) == DATA[1000:]
+        assert [len(block) for block in wav.iter_blocks(100)] == [400, 400, 224]
+        assert b''.join(wav.iter_blocks(100)) == DATA
+        assert bytes(wav.mmap_data()) == DATA
+
+        output = io.BytesIO()
+        wav.write(output)
+
+    assert output.getvalue() == wav_bytes(DATA, channels=2, chunks=[(b'junk', b'abc')])
+
+
+def test_extensible_format(make_wav):
+    data = bytes(18 * 10)
+    path = make_wav('test.wav', data, format_tag=0xFFFE, bits=24, channels=6,
+                    sub_format=1)
+
+    with wavfile.WavFile(path) as wav:
+        fmt = wav.fmt
+        assert (fmt.sub_format, fmt.valid_bits_per_sample, fmt.compressed) == (1, 24, False)
+        assert (fmt.sample_width, fmt.frame_size, wav.num_frames) == (3, 18, 10)
+        assert wav.read_frames(9) == data[162:]
+
+    fmt = wavfile.WavFile(io.BytesIO(wav_bytes(data, format_tag=0xFFFE, bits=32,
+                                               sub_format=3))).fmt
+    assert (fmt.comp_name, fmt.compressed, fmt.frame_size) == ('Extensible', False, 4)
+
+    fmt = wavfile.WavFile(io.BytesIO(wav_bytes(data, format_tag=0xFFFE, bits=4,
+                                               sub_format=2))).fmt
+    assert fmt.compressed
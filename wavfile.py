@@ -1,23 +1,28 @@
 # -*- coding: utf-8 -*-
 
-__all_ = [
+__all__ = [
+    'CueChunk',
+    'CuePoint',
+    'DS64Chunk',
     'Error',
     'FmtChunk',
-    'ParsingError',
+    'ListChunk',
+    'Loop',
+    'ParseError',
     'SmplChunk',
     'UnsupportedCompressionError',
+    'UnsupportedFileTypeError',
     'WavChunk',
     'WavFile'
 ]
 
+import io
 import logging
+import mmap
 import struct
+from collections import namedtuple
 
-from chunk import Chunk
-
-
-if not isinstance('', bytes):
-    basestring = str
+import perfstats
 
 
 # module globals
@@ -26,6 +31,7 @@ log = logging.getLogger(__name__)
 KNOWN_CHUNKS = [
     b'cue ',
     b'data',
+    b'ds64',
     b'fact',
     b'fmt ',
     b'inst',
@@ -43,6 +49,7 @@ FORMAT_TAGS = {
     0: 'Unknown',
     1: 'PCM/uncompressed',
     2: 'Microsoft ADPCM',
+    3: 'IEEE float',
     6: 'ITU G.711 a-law',
     7: 'ITU G.711 u-law',
     17: 'IMA ADPCM',
@@ -50,13 +57,41 @@ FORMAT_TAGS = {
     49: 'GSM 6.10',
     64: 'ITU G.721 ADPCM',
     80: 'MPEG',
+    0xFFFE: 'Extensible',
     0xFFFF: 'Experimental',
 }
 
+# RIFF variants: RF64 (EBU Tech 3306) and BW64 (ITU-R BS.2088) use 64-bit
+# chunk sizes stored in a 'ds64' chunk for files > 4 GB
+RIFF_TAGS = (b'RIFF', b'RF64', b'BW64')
+SIZE_IN_DS64 = 0xFFFFFFFF
+BLOCK_FRAMES = 65536
+
 LOOP_TYPE_FORWARD = 0
 LOOP_TYPE_ALTERNATE = 1
 LOOP_TYPE_REVERSE = 2
 WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+Loop = namedtuple('Loop', [
+    'cue_point_id',
+    'type',
+    'start',
+    'end',
+    'fraction',
+    'play_count'])
+CuePoint = namedtuple('CuePoint', [
+    'id',
+    'position',
+    'data_chunk_id',
+    'chunk_start',
+    'block_start',
+    'sample_offset'])
+
+_CHUNK_HEADER = struct.Struct('<4sL')
+_RIFF_HEADER = struct.Struct('<4sL4s')
+_LABEL_ID = struct.Struct('<L')
 
 
 # exceptions
@@ -78,150 +113,165 @@ class UnsupportedCompressionError(Error):
 
 
 # utility functions
-def _unpack_to_dict(format, data, offset=0, *names):
-    return dict(zip(names, struct.unpack_from(format, data, offset)))
+def _unpack_records(record_struct, data, offset, count, record_type, chunk_name):
+    """Unpack 'count' consecutive fixed-size records from data at offset.
 
+    Returns a list of 'record_type' named tuples or plain tuples, if
+    'record_type' is None.
 
-def chunk_factory(file):
-    fourcc = file.read(4)
+    """
+    available = (len(data) - offset) // record_struct.size
 
-    if len(fourcc) < 4:
-        raise EOFError("Stream too short for RIFF type file.")
+    if count > available:
+        log.warning("'%s' chunk declares %i records but only contains %i.",
+            chunk_name, count, available)
+        count = available
 
-    return _chunk_registry.get(fourcc, _chunk_registry[None])(file, name=fourcc)
+    view = memoryview(data)[offset:offset + count * record_struct.size]
+    records = record_struct.iter_unpack(view)
+    return list(records) if record_type is None else list(map(record_type._make, records))
 
 
 # API classes
-class WavChunk(Chunk):
+class WavChunk(object):
     """Base class for chunks in a WAVE RIFF file.
 
-    Sub-classes chunk.Chunk but offers more convenient property-based access
-    to chunk data. Attributes:
+    Attributes:
 
         - name: four-character chunk tag name
         - size: length of chunk data
+        - offset: file position of chunk data
         - data: raw chunk data
 
-    Specialized sub-classes for specific chunk types may add more attributes
-    for parsed chunk data.
+    The chunk data of generic chunks is only read from the file on first
+    access of the 'data' attribute. Specialized sub-classes for specific
+    (metadata) chunk types read and parse their data when the chunk is
+    created and store the parsed values in slot attributes.
 
-    Getting the string value of an instance (e.g. via 'str()' or 'print'),
-    yields the binary chunk data including tag and size fields and appopriate
-    data padding.
+    Getting the bytes value of an instance (e.g. via 'bytes()'), yields the
+    binary chunk data including tag and size fields and appropriate data
+    padding.
 
     """
+    __slots__ = ('name', 'size', 'offset', '_file', '_data')
     fourcc = b''
-    _fieldnames = ()
-    _pack_format = ''
-
-    def __init__(self, file, name=None):
-        self.closed = False
-        # whether to align to word (2-byte) boundaries
-        self.align = True
-        self.file = file
-
-        if name is None:
-            self.chunkname = file.read(4)
-            if len(self.chunkname) < 4:
-                raise EOFError
-        else:
-            self.name = name
+    # whether chunk data is read and parsed when the chunk is created
+    eager = False
 
-        try:
-            self.chunksize = struct.unpack('<L', file.read(4))[0]
-        except struct.error:
-            raise EOFError
+    def __init__(self, name, size, offset=None, file=None, data=None):
+        self.name = name
+        self.size = size
+        self.offset = offset
+        self._file = file
+        self._data = data
 
-        self.size_read = 0
+        if data is not None:
+            self._parse(data)
 
-        try:
-            self.offset = self.file.tell()
-        except (AttributeError, IOError):
-            self.seekable = False
-            self._data = self.read()
-        else:
-            self.seekable = True
-            self._data = None
+    @classmethod
+    def from_file(cls, file, name, size, offset):
+        """Create chunk for chunk data at given offset in file.
 
-    def _get_name(self):
-        return self.chunkname
-    def _set_name(self, name):
-        if len(name) > 4:
-            raise ValueError("Chunk tag name length must be 4 characters.")
+        Chunk classes with 'eager' set read and parse the data immediately.
 
-        self.chunkname = name + b' ' * max(0, 4 - len(name))
-    name = property(_get_name, _set_name, None, "Four-character chunk tag.")
+        """
+        if cls.eager:
+            file.seek(offset)
+            data = file.read(size)
+            perfstats.count("wav.bytes_read", len(data))
 
-    @property
-    def size(self):
-        if self._data is None:
-            return self.chunksize
-        else:
-            return len(self.data)
+            if len(data) < size:
+                raise ParseError("Truncated '%s' chunk." % name.decode('latin1'))
+
+            return cls(name, size, offset, data=data)
+
+        return cls(name, size, offset, file=file)
 
     @property
     def data(self):
         if self._data is None:
-            log.debug("Reading data from %s", self.__class__.__name__)
-            self.seek(0)
-            self._data = self.read()
+            self._file.seek(self.offset)
+            self._data = self._file.read(self.size)
+            perfstats.count("wav.bytes_read", len(self._data))
 
         return self._data
 
-    def __repr__(self):
-        return (" ".join(["%02X" % c if isinstance(c, int) else ord(c)
-            for c in self.data[:100]]) +
-            (" [...]" if len(self.data) > 100 else ""))
-
-    def __str__(self):
-        fmt = '<4sL%is' % len(self.data)
-        packed_size = struct.pack('<L', len(self.data))
-        log.debug("Data size: %i (%r)", len(self.data), packed_size)
-        return struct.pack(fmt, self.name, len(self.data), self.data) + (
-            '\0' if len(self.data) % 2 else '')
-
-    def __getattr__(self, name):
-        log.debug("%s.__getattr__(%r) called.", self.__class__.__name__, name)
-        # attribute access triggers deferred parsing of chunk data
-        if self._data is None:
-            self._parse()
+    def read_range(self, start, size):
+        """Return 'size' bytes of chunk data from position 'start'.
 
-        try:
-            return self.__dict__[name]
-        except KeyError:
-            raise AttributeError(name)
+        Only reads the requested range from the file, unless the chunk data was
+        already read completely.
 
-    def _parse(self):
-        log.debug("%s._parse() called.", self.__class__.__name__)
-        try:
-            self.__dict__.update(_unpack_to_dict(self._pack_format, self.data,
-                0, *self._fieldnames))
-        except struct.error:
-            raise ParseError("Invalid data in '%s' chunk." % self.fourcc)
+        """
+        start = max(0, min(start, self.size))
+        size = max(0, min(size, self.size - start))
+
+        if self._data is not None:
+            return self._data[start:start + size]
+
+        self._file.seek(self.offset + start)
+        data = self._file.read(size)
+        perfstats.count("wav.bytes_read", len(data))
+        return data
+
+    def _parse(self, data):
+        pass
+
+    def __repr__(self):
+        return (" ".join("%02X" % c for c in self.data[:100]) +
+                (" [...]" if len(self.data) > 100 else ""))
+
+    def __bytes__(self):
+        data = self.data
+        return (_CHUNK_HEADER.pack(self.name, len(data)) + data +
+                (b'\0' if len(data) % 2 else b''))
 
 
 class FmtChunk(WavChunk):
 
-    fourcc = 'fmt '
-    _pack_format = '<hhllh'
-    _fieldnames = (
+    __slots__ = (
         'format_tag',
         'channels',
         'samples_per_sec',
         'avg_bytes_per_sec',
-        'block_align')
-
-    def _parse(self):
-        WavChunk._parse(self)
+        'block_align',
+        'bits_per_sample',
+        'valid_bits_per_sample',
+        'sub_format',
+        'compressed')
+    fourcc = b'fmt '
+    eager = True
+    _struct = struct.Struct('<HHLLH')
+    _bits_struct = struct.Struct('<H')
+    # cbSize, valid bits per sample, channel mask, first two bytes of the
+    # sub-format GUID (the format tag of the sample data)
+    _extension_struct = struct.Struct('<HHLH')
+
+    def _parse(self, data):
+        try:
+            (self.format_tag, self.channels, self.samples_per_sec,
+             self.avg_bytes_per_sec, self.block_align) = self._struct.unpack_from(data)
+        except struct.error:
+            raise ParseError("Invalid data in 'fmt ' chunk.")
 
-        if self.format_tag == WAVE_FORMAT_PCM:
-            self.bits_per_sample = struct.unpack('<h', self.data[14:16])[0]
-            self.compressed = False
+        if len(data) >= 16:
+            self.bits_per_sample = self._bits_struct.unpack_from(data, 14)[0]
         else:
-            self.compressed = True
+            self.bits_per_sample = None
+
+        self.valid_bits_per_sample = self.bits_per_sample
+        self.sub_format = self.format_tag
 
-            if self.format_tag not in FORMAT_TAGS:
-                log.warn('Unknown format tag: %r', self.format_tag)
+        if self.format_tag == WAVE_FORMAT_EXTENSIBLE and len(data) >= 26:
+            _, valid_bits, _, self.sub_format = self._extension_struct.unpack_from(data, 16)
+
+            if valid_bits:
+                self.valid_bits_per_sample = valid_bits
+
+        self.compressed = self.sub_format not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT)
+
+        if self.compressed and self.format_tag not in FORMAT_TAGS:
+            log.debug('Unknown format tag: %r', self.format_tag)
 
     @property
     def comp_name(self):
@@ -229,24 +279,32 @@ class FmtChunk(WavChunk):
 
     @property
     def sample_width(self):
-        if self.format_tag == WAVE_FORMAT_PCM:
+        """Size of one sample (of the container, for extensible formats) in bytes."""
+        if not self.compressed and self.bits_per_sample:
             return (self.bits_per_sample + 7) // 8
         else:
             raise UnsupportedCompressionError("Can't determine sample width "
-                "for %s data compression format.", self.comp_name)
+                "for %s data compression format." %
+                FORMAT_TAGS.get(self.sub_format, '<unsupported>'))
 
     @property
     def frame_size(self):
+        """Size of one frame in bytes (the block alignment for uncompressed data)."""
+        if not self.compressed and self.block_align:
+            return self.block_align
+
         return self.channels * self.sample_width
 
 
 class SmplChunk(WavChunk):
-    """Represents a 'smpl' chunk with information for samplers."""
+    """Represents a 'smpl' chunk with information for samplers.
 
-    fourcc = 'smpl'
-    _pack_format = '<9l'
-    _loop_pack_format = '<6l'
-    _fieldnames = (
+    The sample loops are available through the 'loops' attribute as a list of
+    'Loop' named tuples.
+
+    """
+
+    __slots__ = (
         'manufacturer',
         'product',
         'sample_period',
@@ -255,23 +313,84 @@ class SmplChunk(WavChunk):
         'smpte_format',
         'smpte_offset',
         'sample_loops',
-        'sampler_data')
-    _loop_fieldnames = (
-        'cue_point_id',
-        'type',
-        'start',
-        'end',
-        'fraction',
-        'play_count')
+        'sampler_data',
+        'loops')
+    fourcc = b'smpl'
+    eager = True
+    _struct = struct.Struct('<9L')
+    _loop_struct = struct.Struct('<6L')
+
+    def _parse(self, data):
+        try:
+            (self.manufacturer, self.product, self.sample_period,
+             self.midi_unity_note, self.midi_pitch_fraction, self.smpte_format,
+             self.smpte_offset, self.sample_loops,
+             self.sampler_data) = self._struct.unpack_from(data)
+        except struct.error:
+            raise ParseError("Invalid data in 'smpl' chunk.")
+
+        self.loops = _unpack_records(self._loop_struct, data, self._struct.size,
+                                     self.sample_loops, Loop, 'smpl')
+
+    @classmethod
+    def create(cls, loops, midi_unity_note=0, samplerate=None, template=None):
+        """Create 'smpl' chunk with given loops.
+
+        All other fields are copied from the SmplChunk 'template', if given,
+        including any sampler specific data after the loops. Otherwise they
+        are set from 'midi_unity_note' and 'samplerate' or to zero. A
+        'midi_unity_note' of zero means the root note is unknown.
+
+        """
+        if template is not None:
+            fields = [template.manufacturer, template.product, template.sample_period,
+                      template.midi_unity_note, template.midi_pitch_fraction,
+                      template.smpte_format, template.smpte_offset]
+            loops_end = cls._struct.size + len(template.loops) * cls._loop_struct.size
+            sampler_data = template.data[loops_end:loops_end + template.sampler_data]
+        else:
+            period = int(round(1e9 / samplerate)) if samplerate else 0
+            fields = [0, 0, period, midi_unity_note, 0, 0, 0]
+            sampler_data = b''
+
+        data = b''.join([cls._struct.pack(*(fields + [len(loops), len(sampler_data)]))] +
+                        [cls._loop_struct.pack(*loop) for loop in loops] +
+                        [sampler_data])
+        return cls(cls.fourcc, len(data), data=data)
 
-    def _parse(self):
-        WavChunk._parse(self)
-        self.loops = []
 
-        for i in range(self.sample_loops):
-            self.loops.append(
-                _unpack_to_dict(self._loop_pack_format, self.data,
-                struct.calcsize(self._pack_format), *self._loop_fieldnames))
+class DS64Chunk(WavChunk):
+    """Represents a 'ds64' chunk with 64-bit sizes of RF64/BW64 files.
+
+    'table' maps chunk tags of chunks other than 'data' to their sizes.
+
+    """
+
+    __slots__ = ('riff_size', 'data_size', 'sample_count', 'table')
+    fourcc = b'ds64'
+    eager = True
+    _struct = struct.Struct('<QQQL')
+    _entry_struct = struct.Struct('<4sQ')
+
+    def _parse(self, data):
+        try:
+            (self.riff_size, self.data_size, self.sample_count,
+             table_length) = self._struct.unpack_from(data)
+        except struct.error:
+            raise ParseError("Invalid data in 'ds64' chunk.")
+
+        self.table = dict(_unpack_records(self._entry_struct, data, self._struct.size,
+                                          table_length, None, 'ds64'))
+
+    def chunk_size(self, name):
+        if name == b'data':
+            return self.data_size
+
+        try:
+            return self.table[name]
+        except KeyError:
+            raise ParseError("No size for '%s' chunk in 'ds64' chunk." %
+                name.decode('latin1'))
 
 
 class ListChunk(WavChunk):
@@ -283,51 +402,62 @@ class ListChunk(WavChunk):
     (as a byte string) as the second.
 
     """
-    _fieldnames = ('type_id',)
-    _pack_format = '<4s'
+    __slots__ = ('type_id', 'subchunks')
+    fourcc = b'LIST'
+    eager = True
 
-    def _parse(self):
-        WavChunk._parse(self)
-        pos = 4
+    def _parse(self, data):
+        if len(data) < 4:
+            raise ParseError("Invalid data in 'LIST' chunk.")
+
+        self.type_id = data[:4]
         self.subchunks = []
+        pos = 4
 
-        while pos < len(self.data):
-            tag = self.data[pos:pos+4]
-            size = struct.unpack_from('<l', self.data, pos + 4)[0]
-            self.subchunks.append((tag, self.data[pos+8:pos+8+size]))
-            pos += 8 + size + (1 if size % 2 else 0)
+        while pos + 8 <= len(data):
+            tag, size = _CHUNK_HEADER.unpack_from(data, pos)
+            self.subchunks.append((tag, data[pos+8:pos+8+size]))
+            pos += 8 + size + (size & 1)
 
 
 class CueChunk(WavChunk):
-    """Represents a 'cue ' chunk with the list of cue points."""
-
-    fourcc = 'cue '
-    _pack_format = '<l'
-    _cue_pack_format = '<2l4s3l'
-    _fieldnames = ('num_cue_points')
-    _loop_fieldnames = (
-        'id',
-        'position',
-        'data_chunk_id',
-        'chunk_start',
-        'block_start',
-        'sample_offset')
-
-    def _parse(self):
-        WavChunk._parse(self)
-        self.cue_points = []
-
-        for i in range(self.num_cue_points):
-            self.cue_points.append(
-                _unpack_to_dict(self._cue_pack_format, self.data,
-                struct.calcsize(self._pack_format), *self._cue_fieldnames))
+    """Represents a 'cue ' chunk with the list of cue points.
+
+    The cue points are available through the 'cue_points' attribute as a list
+    of 'CuePoint' named tuples.
+
+    """
+
+    __slots__ = ('num_cue_points', 'cue_points')
+    fourcc = b'cue '
+    eager = True
+    _struct = struct.Struct('<L')
+    _cue_struct = struct.Struct('<2L4s3L')
+
+    def _parse(self, data):
+        try:
+            self.num_cue_points = self._struct.unpack_from(data)[0]
+        except struct.error:
+            raise ParseError("Invalid data in 'cue ' chunk.")
+
+        self.cue_points = _unpack_records(self._cue_struct, data, self._struct.size,
+                                          self.num_cue_points, CuePoint, 'cue ')
 
 
 class WavFile(object):
-    """WAV file reader."""
+    """WAV file reader.
+
+    Supports RIFF/WAVE files and RF64/BW64 files with 64-bit chunk sizes.
+
+    Reads the RIFF structure of the file on creation. Metadata chunks ('fmt ',
+    'smpl', 'cue ', 'LIST') are read and parsed immediately, the data of all
+    other chunks, including the 'data' chunk, is only read on access.
+
+    """
 
     def __init__(self, wavfile):
         self._i_opened_the_file = False
+        perfstats.count("wav.files")
 
         if isinstance(wavfile, str):
             self.filename = wavfile
@@ -335,56 +465,95 @@ class WavFile(object):
             self._i_opened_the_file = True
         else:
             self.file = wavfile
-            try:
-                self.filename = wavfile.name
-            except AttributeError:
-                self.filename = None
+            self.filename = getattr(wavfile, 'name', None)
 
         try:
-            self._riff = Chunk(self.file, align=True, bigendian=False)
+            self._read_chunks()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_chunks(self):
+        # use underlying binary buffer of text streams (e.g. sys.stdin)
+        file = self.file = getattr(self.file, 'buffer', self.file)
+
+        try:
+            seekable = file.seekable()
+        except AttributeError:
+            seekable = False
+
+        if not seekable:
+            # e.g. pipes
+            file = self.file = io.BytesIO(file.read())
 
-            riff_name = self._riff.getname()
-            if riff_name != b'RIFF':
-                raise ValueError("First chunk name != 'RIFF' (value '%s')" %
-                    riff_name)
-        except (EOFError, ValueError):
+        header = file.read(_RIFF_HEADER.size)
+
+        try:
+            riff_name, riff_size, riff_type = _RIFF_HEADER.unpack(header)
+        except struct.error:
             raise ParseError("%s: Invalid/missing RIFF tag or chunk size." %
                 self.filename)
 
-        if self._riff.read(4) != b'WAVE':
+        if riff_name not in RIFF_TAGS:
+            raise ParseError("%s: First chunk name not in %r (value %r)" %
+                (self.filename, RIFF_TAGS, riff_name))
+
+        if riff_type != b'WAVE':
             raise Error("%s: not a WAVE file" % self.filename)
 
+        file_size = file.seek(0, io.SEEK_END)
+        # sizes of RF64/BW64 files are taken from the 'ds64' chunk
+        end = file_size if riff_name != b'RIFF' else min(8 + riff_size, file_size)
+        pos = _RIFF_HEADER.size
+        ds64 = None
+        self.riff_type = riff_name
+
         # dict to store chunk by chunk name (four-cc tag)
         self.chunks = dict()
         # we keep an extra list of chunks to maintain chunk position
         self._chunklist = []
 
-        while True:
-            try:
-                chunk = chunk_factory(self._riff)
-            except EOFError:
-                break
+        while pos + _CHUNK_HEADER.size <= end:
+            file.seek(pos)
+            name, size = _CHUNK_HEADER.unpack(file.read(_CHUNK_HEADER.size))
+            offset = pos + _CHUNK_HEADER.size
+
+            if size == SIZE_IN_DS64 and ds64 is not None:
+                size = ds64.chunk_size(name)
+
+            if offset + size > file_size:
+                log.warning("%s: '%s' chunk truncated at end of file.",
+                    self.filename, name.decode('latin1'))
+                size = file_size - offset
+
+            cls = _chunk_registry.get(name, WavChunk)
+            chunk = cls.from_file(file, name, size, offset)
 
-            if chunk.name == b'data' and b'fmt ' not in self.chunks:
-                log.warn("Encountered 'data' chunk before 'fmt ' chunk.")
+            if name == b'ds64' and riff_name != b'RIFF':
+                ds64 = chunk
+                if riff_size == SIZE_IN_DS64:
+                    end = min(8 + ds64.riff_size, file_size)
 
-            if chunk.name in KNOWN_CHUNKS:
-                if chunk.name in self.chunks:
-                    log.warn("Ignoring extra '%s' chunk at %i bytes."
-                        % (chunk.name, self._riff.tell()))
+            if name == b'data' and b'fmt ' not in self.chunks:
+                log.warning("Encountered 'data' chunk before 'fmt ' chunk.")
+
+            if name in KNOWN_CHUNKS:
+                if name in self.chunks:
+                    log.warning("Ignoring extra '%s' chunk at %i bytes.",
+                        name.decode('latin1'), pos)
                 else:
-                    self.chunks[chunk.name] = chunk
+                    self.chunks[name] = chunk
             else:
-                self.chunks.setdefault(chunk.name, []).append(chunk)
+                self.chunks.setdefault(name, []).append(chunk)
 
             self._chunklist.append(chunk)
-            chunk.skip()
+            pos = offset + size + (size & 1)
 
         if b'fmt ' not in self.chunks or b'data' not in self.chunks:
             raise ParseError("'fmt ' chunk and/or 'data' chunk missing.")
 
     def close(self):
-        if self._i_opened_the_file:
+        if getattr(self, '_i_opened_the_file', False):
             try:
                 self.file.close()
             except:
@@ -405,11 +574,9 @@ class WavFile(object):
                 chunk.name.decode('ascii'), chunk.size, chunk))
         return "".join(s)
 
-    def __str__(self):
-        data = b"".join(str(chunk) for chunk in self)
-        packed_size = struct.pack('<l', len(data) + 4)
-        log.debug("Data size: %i (%r)", len(data), packed_size)
-        return b"RIFF" + packed_size + b"WAVE" + data
+    def __bytes__(self):
+        data = b"".join(bytes(chunk) for chunk in self)
+        return b"RIFF" + struct.pack('<L', len(data) + 4) + b"WAVE" + data
 
     def __iter__(self):
         """Make object useable as an iterator which yields each RIFF chunk.
@@ -430,6 +597,56 @@ class WavFile(object):
 
             yield chunk
 
+    def set_chunk(self, chunk):
+        """Add metadata chunk or replace existing chunk with the same name.
+
+        A replaced chunk keeps its position in the file. Only chunks listed in
+        KNOWN_CHUNKS, of which a file has at most one, can be set.
+
+        """
+        if chunk.name not in KNOWN_CHUNKS or chunk.name in (b'data', b'ds64', b'fmt '):
+            raise ValueError("Can't set '%s' chunk." % chunk.name.decode('latin1'))
+
+        old = self.chunks.get(chunk.name)
+
+        if old is None:
+            self._chunklist.append(chunk)
+        else:
+            self._chunklist[self._chunklist.index(old)] = chunk
+
+        self.chunks[chunk.name] = chunk
+
+    def write(self, fp):
+        """Write WAV file with all its chunks to binary file object.
+
+        The chunk data of the 'data' chunk and other chunks, which have not
+        been read yet, is copied in blocks. Files are always written as RIFF
+        files, so RF64/BW64 files are converted and must be < 4 GB.
+
+        """
+        chunks = [chunk for chunk in self if chunk.name != b'ds64']
+        riff_size = 4 + sum(_CHUNK_HEADER.size + chunk.size + (chunk.size & 1)
+                            for chunk in chunks)
+
+        if riff_size > 0xFFFFFFFF:
+            raise Error("%s: too large to be written as RIFF file." % self.filename)
+
+        fp.write(_RIFF_HEADER.pack(b'RIFF', riff_size, b'WAVE'))
+        block_size = BLOCK_FRAMES * 16
+
+        for chunk in chunks:
+            if chunk._data is not None:
+                fp.write(bytes(chunk))
+                continue
+
+            fp.write(_CHUNK_HEADER.pack(chunk.name, chunk.size))
+
+            for pos in range(0, chunk.size, block_size):
+                fp.write(chunk.read_range(pos, block_size))
+
+            if chunk.size & 1:
+                fp.write(b'\0')
+
     def has_chunk(self, chunk_id):
         if isinstance(chunk_id, str):
             chunk_id = chunk_id.encode()
@@ -451,6 +668,14 @@ class WavFile(object):
             log.warning("'smpl' chunk not found.")
             return None
 
+    @property
+    def root_note(self):
+        """MIDI root note from 'smpl' chunk or None."""
+        try:
+            return self.chunks[b'smpl'].midi_unity_note
+        except KeyError:
+            return None
+
     @property
     def loops(self):
         try:
@@ -461,39 +686,92 @@ class WavFile(object):
     @property
     def cue_points(self):
         try:
-            return self.chunks[b'cue '].loops
+            return self.chunks[b'cue '].cue_points
         except KeyError:
             return []
 
+    @property
+    def cue_labels(self):
+        """Dict mapping cue point IDs to labels from 'LIST' ('adtl') chunks."""
+        labels = {}
+
+        for chunk in self.chunks.get(b'LIST', []):
+            if chunk.type_id == b'adtl':
+                for tag, data in chunk.subchunks:
+                    if tag == b'labl' and len(data) >= 4:
+                        cue_id = _LABEL_ID.unpack_from(data)[0]
+                        labels[cue_id] = data[4:].rstrip(b'\0').decode('latin1')
+
+        return labels
+
     @property
     def info(self):
-        try:
-            for chunk in self.chunks.get(b'LIST', []):
-                if chunk.type_id == b'INFO':
-                    return dict((key, val.rstrip('\0'))
-                        for key, val in chunk.subchunks)
-        except KeyError:
-            pass
+        for chunk in self.chunks.get(b'LIST', []):
+            if chunk.type_id == b'INFO':
+                return dict((key, val.rstrip(b'\0'))
+                    for key, val in chunk.subchunks)
         return dict()
 
+    @property
+    def num_frames(self):
+        """Number of (complete) sample frames in the 'data' chunk."""
+        return self.chunks[b'data'].size // self.fmt.frame_size
+
+    def read_frames(self, start=0, count=None):
+        """Return raw data of 'count' frames beginning at frame 'start'.
+
+        If 'count' is None, all frames from 'start' to the end are returned.
+        Only the requested range is read from the file.
+
+        """
+        fs = self.fmt.frame_size
+        end = self.num_frames if count is None else min(self.num_frames, start + count)
+        return self.chunks[b'data'].read_range(start * fs, max(0, end - start) * fs)
+
+    def iter_blocks(self, block_frames=BLOCK_FRAMES, start=0, end=None):
+        """Yield raw data of consecutive blocks of up to 'block_frames' frames.
+
+        Reads the 'data' chunk in windows of 'block_frames' frames, so memory
+        use does not depend on the size of the file.
+
+        """
+        end = self.num_frames if end is None else min(end, self.num_frames)
+
+        for pos in range(start, end, block_frames):
+            yield self.read_frames(pos, min(block_frames, end - pos))
+
+    def mmap_data(self):
+        """Return read-only memoryview of the 'data' chunk mapped into memory.
+
+        Requires that the WAV file was opened from a real file.
+
+        """
+        chunk = self.chunks[b'data']
+        aligned = chunk.offset - chunk.offset % mmap.ALLOCATIONGRANULARITY
+        skip = chunk.offset - aligned
+
+        if not chunk.size:
+            return memoryview(b'')
+
+        mapped = mmap.mmap(self.file.fileno(), chunk.size + skip,
+                           access=mmap.ACCESS_READ, offset=aligned)
+        return memoryview(mapped)[skip:]
+
     def raw_frames(self):
-        data = self.chunks[b'data'].data
-        size = len(data)
         fs = self.fmt.frame_size
-        pos = 0
 
-        while pos <= size - fs:
-            yield data[pos:pos+fs]
-            pos += fs
+        for block in self.iter_blocks():
+            for pos in range(0, len(block) - fs + 1, fs):
+                yield block[pos:pos+fs]
 
 
 _chunk_registry = {
     b'cue ': CueChunk,
+    b'ds64': DS64Chunk,
     b'fmt ': FmtChunk,
     b'smpl': SmplChunk,
     b'list': ListChunk,
     b'LIST': ListChunk,
-    None: WavChunk
 }
 
 